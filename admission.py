@@ -0,0 +1,156 @@
+# admission.py
+"""
+LLM 调用的准入控制
+- 令牌桶限制发往上游的请求速率（平均速率 + 突发容量）
+- 拿不到令牌的请求进入有界优先级队列，按优先级（数字越小越优先）、同级先到先得依次放行
+- 在等待预算内无法放行、或队列已满且优先级不够高的请求被拒绝（shed），由调用方降级到规则/默认层
+"""
+import heapq
+import itertools
+import threading
+from time import monotonic
+from typing import Any, Dict, List, Optional
+
+from utils.logger import setup_logger
+from utils.metrics import registry as default_registry
+
+logger = setup_logger(__name__)
+
+
+class TokenBucket:
+    """令牌桶（非线程安全，由调用方加锁）"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self._updated = monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, now: Optional[float] = None) -> bool:
+        self._refill(monotonic() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now: Optional[float] = None) -> float:
+        """距离下一个令牌可用的秒数"""
+        self._refill(monotonic() if now is None else now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """令牌桶 + 有界优先级队列"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None, queue_size: int = 100,
+                 max_wait: float = 1.0, mid_transaction_priority: int = 0, default_priority: int = 1,
+                 scene_priorities: Optional[Dict[str, int]] = None, metrics=None):
+        """
+        Args:
+            rate: 每秒允许发往上游的请求数
+            burst: 突发容量（默认等于 rate）
+            queue_size: 等待队列上限
+            max_wait: 默认等待预算（秒），超时即拒绝
+            mid_transaction_priority: 正在填槽（current_step 非空）的会话的优先级
+            default_priority: 其他会话的优先级
+            scene_priorities: 按场景覆盖优先级
+        """
+        self.bucket = TokenBucket(rate, burst if burst is not None else max(1.0, rate))
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.mid_transaction_priority = mid_transaction_priority
+        self.default_priority = default_priority
+        self.scene_priorities = dict(scene_priorities or {})
+        self._cond = threading.Condition()
+        # 队列元素: [优先级, 序号, 是否被挤出]；序号唯一，比较不会触及第三项
+        self._queue: List[List[Any]] = []
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.shed = 0
+
+        self.metrics = metrics or default_registry
+        self._depth_gauge = self.metrics.gauge("llm_admission_queue_depth", "等待准入的 LLM 请求数")
+        self._wait_hist = self.metrics.histogram("llm_admission_wait_seconds", "LLM 请求获得准入前的等待时间")
+        self._shed_counter = self.metrics.counter(
+            "llm_admission_shed_total", "被拒绝并降级的 LLM 请求数", ("reason",))
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]], metrics=None) -> Optional["AdmissionController"]:
+        """config.yaml 中的 llm_admission 段；未配置 rate 时返回 None（不限流）"""
+        if not config or not config.get('rate'):
+            return None
+        priorities = config.get('priorities') or {}
+        return cls(rate=config['rate'], burst=config.get('burst'),
+                   queue_size=config.get('queue_size', 100), max_wait=config.get('max_wait', 1.0),
+                   mid_transaction_priority=priorities.get('mid_transaction', 0),
+                   default_priority=priorities.get('default', 1),
+                   scene_priorities=priorities.get('scenes'), metrics=metrics)
+
+    def priority_for(self, scene: str, current_step: str) -> int:
+        if scene in self.scene_priorities:
+            return self.scene_priorities[scene]
+        return self.mid_transaction_priority if current_step else self.default_priority
+
+    def acquire(self, priority: Optional[int] = None, max_wait: Optional[float] = None) -> bool:
+        """阻塞直到获得准入（返回 True），或在等待预算内无法放行时返回 False"""
+        priority = self.default_priority if priority is None else priority
+        t_start = monotonic()
+        deadline = t_start + (self.max_wait if max_wait is None else max_wait)
+        with self._cond:
+            if not self._queue and self.bucket.try_acquire(t_start):
+                return self._admit(t_start)
+            if len(self._queue) >= self.queue_size:
+                worst = max(self._queue)
+                if worst[0] <= priority:
+                    return self._reject("queue_full")
+                # 挤出优先级最低、最晚到达的请求
+                worst[2] = True
+                self._remove(worst)
+            entry = [priority, next(self._seq), False]
+            heapq.heappush(self._queue, entry)
+            self._depth_gauge.set(len(self._queue))
+            while True:
+                if entry[2]:
+                    return self._reject("evicted")
+                now = monotonic()
+                timeout = deadline - now
+                if self._queue[0] is entry:
+                    if self.bucket.try_acquire(now):
+                        heapq.heappop(self._queue)
+                        self._depth_gauge.set(len(self._queue))
+                        self._cond.notify_all() # 让下一个队首开始等待令牌
+                        return self._admit(t_start)
+                    token_wait = self.bucket.wait_time(now)
+                    if token_wait > timeout:
+                        timeout = 0 # 预算内不可能拿到令牌，立即降级
+                    else:
+                        timeout = token_wait
+                if timeout <= 0:
+                    self._remove(entry)
+                    return self._reject("timeout")
+                self._cond.wait(timeout)
+
+    def _remove(self, entry: List[Any]):
+        self._queue.remove(entry)
+        heapq.heapify(self._queue)
+        self._depth_gauge.set(len(self._queue))
+        self._cond.notify_all()
+
+    def _admit(self, t_start: float) -> bool:
+        self.admitted += 1
+        if self.metrics.enabled:
+            self._wait_hist.observe(monotonic() - t_start)
+        return True
+
+    def _reject(self, reason: str) -> bool:
+        self.shed += 1
+        self._shed_counter.inc(reason)
+        logger.debug("LLM 请求被拒绝 (%s)，降级处理", reason)
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queue_depth": len(self._queue), "admitted": self.admitted, "shed": self.shed}
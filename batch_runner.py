@@ -0,0 +1,164 @@
+# batch_runner.py
+"""
+离线批处理：流式读取 JSONL 对话记录 {"session_id": ..., "input": ...}，并发处理并流式写出结果
+- 同一会话的记录按 session_id 哈希到固定 worker 线程，保证轮次顺序
+- 会话状态仅保存在内存（ephemeral），不做逐轮磁盘写入；超出每个 worker 的会话上限时丢弃最久未访问的会话，
+  丢弃次数计入统计，该会话之后的第一条结果标记 state_reset（从空状态重新开始）
+- 读取、处理、写出之间使用有界队列，内存占用与输入文件大小无关
+"""
+import json
+import queue
+import threading
+import time
+import zlib
+from typing import Any, Dict, IO, List, Optional, Set
+
+from interpreter import DSLInterpreter
+from state_manager import SessionStateManager
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_STOP = object()
+
+class _BatchSessionStore(SessionStateManager):
+    """worker 的内存会话存储：记录被 LRU 丢弃、尚未再次出现的会话"""
+
+    def __init__(self, max_sessions: int):
+        super().__init__(ephemeral=True, max_sessions=max_sessions)
+        self.dropped: Set[str] = set()
+        self.evicted = 0
+
+    def _evict(self, session_id: str):
+        super()._evict(session_id)
+        self.dropped.add(session_id)
+        self.evicted += 1
+
+class BatchRunner:
+    """批处理执行器，复用 agent 的 LLM 客户端与已编译的脚本"""
+
+    def __init__(self, agent, workers: int = 4, queue_size: int = 1000,
+                 max_sessions_per_worker: int = 10000):
+        """
+        Args:
+            agent: 已加载脚本的 SmartDSLAgent
+            workers: 并发 worker 线程数
+            queue_size: 每个队列的容量（背压上限）
+            max_sessions_per_worker: 每个 worker 内存中保留的会话数上限，超出时丢弃最久未访问的会话
+                （丢弃次数记在统计的 evicted 中，该会话再次出现时的结果带 state_reset: true）
+        """
+        self.agent = agent
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.max_sessions_per_worker = max_sessions_per_worker
+
+    def _make_interpreter(self) -> DSLInterpreter:
+        interpreter = DSLInterpreter(
+            llm_client=self.agent.llm_client,
+            state_manager=_BatchSessionStore(self.max_sessions_per_worker),
+            programs=self.agent.programs,
+            admission=self.agent.admission # 所有 worker 共享同一个上游速率限制
+        )
+        interpreter.program = self.agent.interpreter.program
+        interpreter.profiler = self.agent.interpreter.profiler
+        interpreter.decision_log = self.agent.interpreter.decision_log
+        interpreter.turn_deadline = self.agent.interpreter.turn_deadline
+        interpreter.scene_deadlines = self.agent.interpreter.scene_deadlines
+        interpreter.intent_cache = self.agent.interpreter.intent_cache
+        return interpreter
+
+    def _worker(self, inbox: "queue.Queue", outbox: "queue.Queue", stores: List[_BatchSessionStore]):
+        interpreter = self._make_interpreter()
+        store = interpreter.state_manager
+        stores.append(store)
+        while True:
+            item = inbox.get()
+            if item is _STOP:
+                break
+            seq, record = item
+            session_id = str(record.get("session_id", "default"))
+            user_input = str(record.get("input", ""))
+            state_reset = session_id in store.dropped
+            if state_reset:
+                store.dropped.discard(session_id)
+            t_start = time.perf_counter()
+            response = interpreter.execute(user_input, session_id, record.get("script"))
+            turn = interpreter.last_turn
+            outbox.put({
+                "seq": seq,
+                "session_id": session_id,
+                "input": user_input,
+                "response": response,
+                "intent": turn.get("intent"),
+                "tier": turn.get("tier"),
+                "degraded": turn.get("degraded"),
+                "state_reset": state_reset,
+                "latency_ms": round((time.perf_counter() - t_start) * 1000, 3),
+            })
+
+    def _writer(self, outbox: "queue.Queue", out: IO[str], stats: Dict[str, Any]):
+        while True:
+            result = outbox.get()
+            if result is _STOP:
+                break
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            stats["processed"] += 1
+
+    def run(self, input_path: str, output_path: str) -> Dict[str, Any]:
+        """处理整个输入文件，返回统计信息"""
+        stats: Dict[str, Any] = {"processed": 0, "invalid": 0}
+        stores: List[_BatchSessionStore] = []
+        inboxes: List[queue.Queue] = [queue.Queue(self.queue_size) for _ in range(self.workers)]
+        outbox: queue.Queue = queue.Queue(self.queue_size)
+        t_start = time.perf_counter()
+
+        with open(input_path, 'r', encoding='utf-8') as src, open(output_path, 'w', encoding='utf-8') as out:
+            workers = [threading.Thread(target=self._worker, args=(inbox, outbox, stores), daemon=True)
+                       for inbox in inboxes]
+            writer = threading.Thread(target=self._writer, args=(outbox, out, stats), daemon=True)
+            for thread in workers:
+                thread.start()
+            writer.start()
+
+            for seq, line in enumerate(src):
+                line = line.strip()
+                if not line:
+                    continue
+                record = self._parse_line(line)
+                if record is None:
+                    stats["invalid"] += 1
+                    continue
+                # 使用稳定哈希（而非 hash()），保证同一会话总是进入同一队列
+                slot = zlib.crc32(str(record.get("session_id", "default")).encode('utf-8')) % self.workers
+                inboxes[slot].put((seq, record))
+
+            for inbox in inboxes:
+                inbox.put(_STOP)
+            for thread in workers:
+                thread.join()
+            outbox.put(_STOP)
+            writer.join()
+
+        elapsed = time.perf_counter() - t_start
+        stats["evicted"] = sum(store.evicted for store in stores)
+        stats["seconds"] = elapsed
+        stats["turns_per_sec"] = stats["processed"] / elapsed if elapsed else 0.0
+        logger.info("批处理完成: %s 轮, 无效记录 %s, 丢弃会话 %s, 耗时 %.2fs (%.0f 轮/秒)",
+                    stats["processed"], stats["invalid"], stats["evicted"], elapsed, stats["turns_per_sec"])
+        if stats["evicted"]:
+            logger.warning("%s 次会话因超出每个 worker 的上限 (%s) 被丢弃，之后的轮次从空状态开始"
+                           "（结果中 state_reset 为 true），可调大 max_sessions_per_worker",
+                           stats["evicted"], self.max_sessions_per_worker)
+        return stats
+
+    @staticmethod
+    def _parse_line(line: str) -> Optional[Dict[str, Any]]:
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            logger.warning("跳过无法解析的记录: %s", line[:80])
+            return None
+        if not isinstance(record, dict) or "input" not in record:
+            logger.warning("跳过缺少 input 字段的记录: %s", line[:80])
+            return None
+        return record
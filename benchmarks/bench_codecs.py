@@ -0,0 +1,66 @@
+# benchmarks/bench_codecs.py
+"""
+会话编解码器基准：各编解码器（及是否压缩）的编码/解码耗时与单会话字节数
+用法: python benchmarks/bench_codecs.py [--rounds 2000]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import session_codec
+
+
+def sample_session() -> dict:
+    """构造一个典型的会话：20 条历史 + 若干变量"""
+    history = []
+    for i in range(10):
+        history.append({"role": "user", "content": f"我想查一下第{i}件商品袜子的价格"})
+        history.append({"role": "assistant", "content": f"【电商】袜子 现价 {99 + i} 元。请问还有其他可以帮您的吗？"})
+    return {
+        "session_id": "user_0001",
+        "state_data": {
+            "history": history,
+            "current_scene": "ecommerce_scene",
+            "current_intent": "provide_product_name",
+            "script": "multi_business",
+            "variables": {"current_step": "", "user_input": "袜子", "result": "【模拟数据: get_price 返回正常】",
+                          "prod": "袜子"},
+            "last_response": "【电商】袜子 现价 99 元。",
+        },
+        "created_at": 1700000000.0,
+        "updated_at": 1700000100.0,
+        "last_activity": 1700000100.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话编解码器基准")
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    data = sample_session()
+    print(f"{'编解码器':<22}{'编码 us':>10}{'解码 us':>10}{'字节':>8}")
+    for name, codec in session_codec.CODECS.items():
+        if name == "msgpack" and session_codec.msgpack is None:
+            print(f"{name:<24}(未安装 msgpack，跳过)")
+            continue
+        for threshold in (None, 0):
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                raw = session_codec.encode(data, codec, threshold)
+            encode_us = (time.perf_counter() - start) / args.rounds * 1e6
+            start = time.perf_counter()
+            for _ in range(args.rounds):
+                session_codec.decode(raw)
+            decode_us = (time.perf_counter() - start) / args.rounds * 1e6
+            label = name + ("+zlib" if threshold is not None and name != "json-pretty" else "")
+            print(f"{label:<24}{encode_us:>10.1f}{decode_us:>10.1f}{len(raw):>8}")
+            if name == "json-pretty":
+                break # 旧格式不支持压缩
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/bench_decision_log.py
+"""
+决策日志开销基准：对比关闭 / 开启决策日志时的单轮耗时，以及入队本身的耗时
+会话只保存在内存中，使差异只来自决策日志
+用法: python benchmarks/bench_decision_log.py [--turns 20000] [--batch 500]
+"""
+import argparse
+import logging
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from decision_log import DecisionLog, read_decisions
+from dsl_program import compile_program
+from interpreter import DSLInterpreter
+from state_manager import SessionStateManager
+from utils.metrics import MetricsRegistry
+from tests.test_stubs import MockLLMClient
+
+INPUTS = ["我要查价格", "袜子", "查订单", "123456"]
+
+
+def run(turns: int, decision_log=None) -> float:
+    registry = MetricsRegistry(enabled=False)
+    interpreter = DSLInterpreter(MockLLMClient(), SessionStateManager(ephemeral=True), metrics=registry)
+    script_path = Path(__file__).resolve().parent.parent / "examples" / "ecommerce.dsl"
+    interpreter.set_program(compile_program(script_path.read_text(encoding="utf-8")))
+    interpreter.decision_log = decision_log
+    start = time.perf_counter()
+    for i in range(turns):
+        interpreter.execute(INPUTS[i % len(INPUTS)], f"s{i % 50}")
+    return (time.perf_counter() - start) / turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description="决策日志开销基准")
+    parser.add_argument("--turns", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=500, help="每批写出的记录数")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_decision_log_")
+    try:
+        run(500) # 预热
+        baseline = run(args.turns)
+        log = DecisionLog(tmp_dir, batch_size=args.batch, max_buffer=args.turns, metrics=MetricsRegistry())
+        with_log = run(args.turns, log)
+
+        entry = {"ts": 0.0, "session_id": "s1", "input": "袜子", "tier": "expect", "latency_ms": 0.1}
+        start = time.perf_counter()
+        for _ in range(args.turns):
+            log.record(entry)
+        enqueue = (time.perf_counter() - start) / args.turns
+        log.close()
+
+        size = sum(p.stat().st_size for p in Path(tmp_dir).iterdir())
+        records = sum(1 for _ in read_decisions(tmp_dir))
+        print(f"关闭决策日志:     {baseline * 1e6:8.1f} µs/轮")
+        print(f"开启决策日志:     {with_log * 1e6:8.1f} µs/轮 (+{(with_log - baseline) * 1e6:.1f} µs)")
+        print(f"单次入队:         {enqueue * 1e6:8.2f} µs")
+        print(f"写出 {records:,} 条（丢弃 {log.dropped}），压缩后 {size / records:.0f} 字节/条")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
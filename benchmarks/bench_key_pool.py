@@ -0,0 +1,83 @@
+# benchmarks/bench_key_pool.py
+"""
+密钥池基准：多个速率配额不同的本地替身端点，按固定速率发出请求（高于单个密钥的配额、
+低于各密钥配额之和），对比单密钥与密钥池（两种策略）的成功吞吐、被限流次数与降级次数，以及各密钥分到的请求数
+用法: python benchmarks/bench_key_pool.py [--rate 240] [--duration 3] [--threads 16] [--latency-ms 20]
+"""
+import argparse
+import logging
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from llm_client import LLMClient
+from llm_pool import KeyPool, PoolMember
+from utils.metrics import MetricsRegistry
+from tests.test_stubs import StubChatClient
+
+INTENTS = ["query_product", "provide_product_name", "query_order", "provide_order_id"]
+# (名称, 每秒配额)
+ENDPOINTS = [("a", 50), ("b", 100), ("c", 150)]
+
+
+def run(label: str, names, strategy: str, rate: float, duration: float, threads: int, latency: float,
+        cooldown: float):
+    registry = MetricsRegistry()
+    servers = {name: StubChatClient(lambda messages: "query_product", first_token_latency=latency,
+                                    rate_limit=rate, retry_after=None)
+               for name, rate in ENDPOINTS if name in names}
+    members = [PoolMember(api_key=f"key-{name}", name=name, weight=rate, client=servers[name])
+               for name, rate in ENDPOINTS if name in names]
+    pool = KeyPool(members, strategy=strategy, cooldown=cooldown, metrics=registry)
+    client = LLMClient(api_key="unused", client=pool, metrics=registry)
+    results = []
+
+    total = int(rate * duration)
+    start = time.perf_counter()
+
+    def worker(index):
+        # 第 n 个请求在 start + n / rate 发出，各线程轮流承担
+        for n in range(index, total, threads):
+            delay = start + n / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            results.append(client.intelligent_intent_recognition("我要查价格", INTENTS, []))
+
+    pool_threads = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool_threads:
+        thread.start()
+    for thread in pool_threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    limited = sum(server.rate_limited for server in servers.values())
+    answered = sum(1 for r in results if r == "query_product")
+    split = " ".join(f"{name}={len(server.requests)}" for name, server in servers.items())
+    print(f"{label:<28} 成功 {answered / elapsed:>6,.0f} 次/s  429 {limited:>5}  "
+          f"降级 {len(results) - answered:>5}  {split}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API 密钥池负载均衡基准")
+    parser.add_argument("--rate", type=float, default=240, help="每秒发出的请求数")
+    parser.add_argument("--duration", type=float, default=3.0, help="持续秒数")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="替身端点的响应延迟")
+    parser.add_argument("--cooldown", type=float, default=0.1, help="429 后的冷却秒数")
+    args = parser.parse_args()
+    logging.disable(logging.ERROR) # 降级时 llm_client 记录的错误日志
+
+    latency = args.latency_ms / 1000
+    print(f"{args.rate:g} 次/s × {args.duration:g}s，{args.threads} 线程，"
+          f"端点配额 {', '.join(f'{n}={r}/s' for n, r in ENDPOINTS)}")
+    run("单密钥 (c)", {"c"}, "least_outstanding", args.rate, args.duration, args.threads, latency, args.cooldown)
+    for strategy in ("least_outstanding", "weighted_round_robin"):
+        run(f"密钥池 {strategy}", {"a", "b", "c"}, strategy, args.rate, args.duration, args.threads, latency,
+            args.cooldown)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_logging.py
+"""
+日志管线基准：对比同步 StreamHandler（旧实现）与异步队列管线的每秒轮数
+日志输出写入临时文件以模拟被重定向的 stdout
+用法: python benchmarks/bench_logging.py [--turns 5000] [--level INFO]
+"""
+import argparse
+import logging
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dsl_parser import SimpleDSLParser
+from interpreter import DSLInterpreter
+from state_manager import SessionStateManager
+from utils.logger import DEFAULT_FORMAT, configure_logging, shutdown_logging
+from utils.metrics import MetricsRegistry
+from tests.test_stubs import MockLLMClient
+
+MODULES = ("interpreter", "state_manager", "llm_client")
+
+
+def use_sync_handlers(level: str):
+    """恢复旧实现：每个模块 logger 挂一个同步 StreamHandler"""
+    for name in MODULES:
+        logger = logging.getLogger(name)
+        logger.handlers = []
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(DEFAULT_FORMAT))
+        logger.addHandler(handler)
+        logger.setLevel(level)
+
+
+def run(turns: int) -> float:
+    tmp_dir = tempfile.mkdtemp(prefix="bench_logging_")
+    try:
+        registry = MetricsRegistry(enabled=False)
+        manager = SessionStateManager(persistence_dir=tmp_dir, metrics=registry)
+        interpreter = DSLInterpreter(MockLLMClient(), manager, metrics=registry)
+        script_path = Path(__file__).resolve().parent.parent / "examples" / "ecommerce.dsl"
+        interpreter.set_current_script(SimpleDSLParser.parse(script_path.read_text(encoding="utf-8")))
+        inputs = ["我要查价格", "袜子", "查订单", "123456"]
+
+        start = time.perf_counter()
+        for i in range(turns):
+            interpreter.execute(inputs[i % len(inputs)], f"s{i % 50}")
+        return turns / (time.perf_counter() - start)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日志管线基准")
+    parser.add_argument("--turns", type=int, default=5000)
+    parser.add_argument("--level", default="INFO")
+    args = parser.parse_args()
+
+    real_stdout = sys.stdout
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as sink:
+        sys.stdout = sink
+        try:
+            configure_logging({"level": args.level})
+            async_rate = run(args.turns)
+            shutdown_logging()
+            use_sync_handlers(args.level)
+            sync_rate = run(args.turns)
+        finally:
+            sys.stdout = real_stdout
+
+    print(f"同步 StreamHandler: {sync_rate:8.0f} 轮/秒")
+    print(f"异步队列管线:       {async_rate:8.0f} 轮/秒")
+
+
+if __name__ == "__main__":
+    main()
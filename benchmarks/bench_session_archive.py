@@ -0,0 +1,91 @@
+# benchmarks/bench_session_archive.py
+"""
+会话批量迁移基准：逐文件复制会话目录 vs 流式归档导出 + 导入
+用法: python benchmarks/bench_session_archive.py [--sessions 1000000] [--workers 4] [--chunk 1000] [--memory]
+"""
+import argparse
+import logging
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import session_codec
+from state_manager import SessionStateManager, session_file_path
+
+
+def populate(directory: Path, sessions: int):
+    """直接写出会话文件（与 SessionStateManager 持久化的格式相同）"""
+    codec = session_codec.get_codec("json")
+    now = time.time()
+    history = [{"role": "user", "content": "我想查一下袜子的价格"},
+               {"role": "assistant", "content": "请问查什么商品？"}]
+    for i in range(sessions):
+        data = {"session_id": f"user_{i}", "created_at": now, "updated_at": now, "last_activity": now,
+                "state_data": {"current_scene": "ecommerce_scene", "history": history,
+                               "variables": {"current_step": "waiting_prod", "n": i}}}
+        path = session_file_path(directory, f"user_{i}")
+        try:
+            path.write_bytes(session_codec.encode(data, codec))
+        except FileNotFoundError:
+            path.parent.mkdir(parents=True)
+            path.write_bytes(session_codec.encode(data, codec))
+
+
+def timed(label: str, sessions: int, func):
+    t_start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - t_start
+    print(f"{label:<22} {elapsed:8.2f} s  {sessions / elapsed:>10,.0f} 会话/s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话批量导出/导入基准")
+    parser.add_argument("--sessions", type=int, default=1_000_000, help="会话数")
+    parser.add_argument("--workers", type=int, default=4, help="并行导入线程数")
+    parser.add_argument("--chunk", type=int, default=1000, help="每块会话数")
+    parser.add_argument("--memory", action="store_true", help="额外用 tracemalloc 测量导出/导入的内存峰值")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_session_archive_"))
+    try:
+        src = work_dir / "src"
+        print(f"生成 {args.sessions:,} 个会话文件 ...")
+        populate(src, args.sessions)
+        archive = work_dir / "sessions.dsla"
+        # 设置 max_sessions 后启动时不全量加载，导出/导入只经过磁盘
+        manager = lambda name: SessionStateManager(persistence_dir=str(work_dir / name), max_sessions=1000)
+
+        timed("逐文件复制目录", args.sessions, lambda: shutil.copytree(src, work_dir / "copy"))
+        shutil.rmtree(work_dir / "copy")
+        timed("流式导出", args.sessions, lambda: manager("src").export_archive(str(archive), args.chunk))
+        timed("流式导入（单线程）", args.sessions, lambda: manager("dst1").import_archive(str(archive)))
+        shutil.rmtree(work_dir / "dst1")
+        timed(f"流式导入（{args.workers} 线程）", args.sessions,
+              lambda: manager("dst2").import_archive(str(archive), workers=args.workers))
+        shutil.rmtree(work_dir / "dst2")
+        src_bytes = sum(f.stat().st_size for f in src.rglob("*.session"))
+        print(f"原始会话文件 {src_bytes / 1024 / 1024:.1f} MiB，归档 {archive.stat().st_size / 1024 / 1024:.1f} MiB")
+
+        if args.memory:
+            tracemalloc.start()
+            manager("src").export_archive(str(archive), args.chunk)
+            _, export_peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            manager("dst3").import_archive(str(archive), workers=args.workers)
+            _, import_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            # 导入时的体积统计（每个会话一项）随会话数增长，其余部分只与块大小有关
+            print(f"内存峰值: 导出 {export_peak / 1024 / 1024:.1f} MiB，导入 {import_peak / 1024 / 1024:.1f} MiB")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# benchmarks/bench_session_cache.py
+"""
+会话缓存基准：长尾流量回放（少量热点会话 + 大量只出现一次的会话）
+对比不设上限与设置 max_sessions 时的常驻会话数、Python 堆峰值、会话目录体积和热点会话单次读写耗时
+用法: python benchmarks/bench_session_cache.py [--sessions 20000] [--hot 50] [--cap 1000]
+"""
+import argparse
+import logging
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from state_manager import SessionStateManager
+
+
+def replay(manager: SessionStateManager, sessions: int, hot: int, seed: int = 7):
+    """每 4 次访问中 3 次落在热点会话，1 次是新的长尾会话；返回热点访问的平均耗时"""
+    rng = random.Random(seed)
+    history = [{"role": "user", "content": "我想查一下袜子的价格"}] * 6
+    hot_time, hot_count, tail = 0.0, 0, 0
+    while tail < sessions:
+        if rng.random() < 0.75:
+            session_id = f"hot_{rng.randrange(hot)}"
+            t_start = time.perf_counter()
+            state = manager.get_state(session_id)
+            manager.update_state(session_id, {"turns": state.get("turns", 0) + 1})
+            hot_time += time.perf_counter() - t_start
+            hot_count += 1
+        else:
+            manager.update_state(f"tail_{tail}", {"history": history, "current_scene": "ecommerce_scene"})
+            tail += 1
+    return hot_time / max(hot_count, 1)
+
+
+def run(label: str, sessions: int, hot: int, **kwargs):
+    work_dir = tempfile.mkdtemp(prefix="bench_session_cache_")
+    try:
+        tracemalloc.start()
+        manager = SessionStateManager(persistence_dir=work_dir, **kwargs)
+        avg_hot = replay(manager, sessions, hot)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        disk = sum(f.stat().st_size for f in Path(work_dir).rglob("*") if f.is_file())
+        print(f"{label:<12} 常驻会话 {len(manager.sessions):>7}  堆峰值 {peak / 1024 / 1024:8.1f} MiB  "
+              f"磁盘 {disk / 1024 / 1024:7.1f} MiB  热点读写 {avg_hot * 1e6:8.1f} us")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话缓存长尾回放基准")
+    parser.add_argument("--sessions", type=int, default=20000, help="长尾会话数")
+    parser.add_argument("--hot", type=int, default=50, help="热点会话数")
+    parser.add_argument("--cap", type=int, default=1000, help="max_sessions 上限")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    run("不设上限", args.sessions, args.hot)
+    run(f"LRU {args.cap}", args.sessions, args.hot, max_sessions=args.cap)
+    run(f"LRU {args.cap}+压缩", args.sessions, args.hot, max_sessions=args.cap, compress_evicted=True)
+
+
+if __name__ == "__main__":
+    main()
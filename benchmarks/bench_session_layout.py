@@ -0,0 +1,83 @@
+# benchmarks/bench_session_layout.py
+"""
+会话目录布局基准：旧版平铺目录 vs 两级分片目录
+依次测量平铺目录的全量遍历与随机读取、启动时自动迁移、分片目录的全量遍历与随机读取、
+以及离线压缩（一半会话过期）的耗时
+用法: python benchmarks/bench_session_layout.py [--sessions 200000] [--reads 5000]
+"""
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import session_codec
+from state_manager import SessionStateManager, compact_sessions, session_file_path
+
+
+def timed(label: str, func, count: int = 0):
+    t_start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - t_start
+    rate = f"  {count / elapsed:>10,.0f} 次/s" if count else ""
+    print(f"{label:<24} {elapsed:8.2f} s{rate}")
+    return result
+
+
+def scan(directory: Path) -> int:
+    return sum(1 for p in directory.rglob("*.session"))
+
+
+def read_all(paths) -> int:
+    total = 0
+    for path in paths:
+        with open(path, 'rb') as f:
+            total += len(f.read())
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话目录布局基准")
+    parser.add_argument("--sessions", type=int, default=200_000, help="会话数")
+    parser.add_argument("--reads", type=int, default=5000, help="随机读取的会话数")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_session_layout_"))
+    try:
+        codec = session_codec.get_codec("json")
+        now = time.time()
+        print(f"生成 {args.sessions:,} 个平铺会话文件 ...")
+        for i in range(args.sessions):
+            data = {"session_id": f"user_{i}", "state_data": {"n": i}, "last_activity": now}
+            (work_dir / f"user_{i}.session").write_bytes(session_codec.encode(data, codec))
+        sample = random.Random(0).sample(range(args.sessions), min(args.reads, args.sessions))
+
+        timed("平铺：全量遍历", lambda: scan(work_dir), args.sessions)
+        timed("平铺：随机读取", lambda: read_all(work_dir / f"user_{i}.session" for i in sample), len(sample))
+        timed("启动时迁移到分片目录", lambda: SessionStateManager(persistence_dir=str(work_dir), max_sessions=1000),
+              args.sessions)
+        timed("分片：全量遍历", lambda: scan(work_dir), args.sessions)
+        timed("分片：随机读取", lambda: read_all(session_file_path(work_dir, f"user_{i}") for i in sample),
+              len(sample))
+
+        old = now - 7200
+        for i in range(0, args.sessions, 2):
+            path = session_file_path(work_dir, f"user_{i}")
+            os.utime(path, (old, old))
+        stats = timed("离线压缩（一半过期）", lambda: compact_sessions(str(work_dir), session_timeout=3600),
+                      args.sessions)
+        print(f"删除 {stats['expired']:,} 个过期文件，释放 {stats['bytes_freed'] / 1024 / 1024:.1f} MiB，"
+              f"删除空目录 {stats['dirs_removed']}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# benchmarks/bench_session_store.py
+"""
+会话存储后端并发基准：文件后端 vs Redis 协议后端（开/关近端缓存）
+每个线程模拟一个 agent 实例，按轮次对自己负责的会话执行 get_state + update_state；
+"共享实例" 一行让所有线程共用一个管理器（同一进程内多线程处理请求的情形），近端缓存容量小于会话总数
+默认连接进程内替身服务（受 GIL 限制，绝对数值偏低）；--redis host:port 可改用真实 redis-server
+用法: python benchmarks/bench_session_store.py [--threads 8] [--turns 500] [--redis 127.0.0.1:6379]
+"""
+import argparse
+import logging
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from redis_store import ConnectionPool, RedisSessionStateManager
+from state_manager import SessionStateManager
+from tests.test_stubs import StubRedisServer
+
+
+def worker(manager, index: int, turns: int, sessions: int, latencies: list):
+    for turn in range(turns):
+        session_id = f"w{index}_s{turn % sessions}"
+        t_start = time.perf_counter()
+        state = manager.get_state(session_id)
+        state["turns"] = state.get("turns", 0) + 1
+        state.setdefault("history", []).append({"role": "user", "content": "我想查一下袜子的价格"})
+        del state["history"][:-10]
+        manager.update_state(session_id, state)
+        latencies.append(time.perf_counter() - t_start)
+
+
+def run(label: str, make_manager, threads: int, turns: int, sessions: int, shared: bool = False):
+    if shared:
+        managers = [make_manager()] * threads
+    else:
+        managers = [make_manager() for _ in range(threads)]
+    latencies: list = []
+    workers = [threading.Thread(target=worker, args=(m, i, turns, sessions, latencies))
+               for i, m in enumerate(managers)]
+    t_start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - t_start
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(f"{label:<22} {len(latencies) / elapsed:9.0f} 轮/秒  p50 {p50 * 1000:7.2f} ms  p99 {p99 * 1000:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话存储后端并发基准")
+    parser.add_argument("--threads", type=int, default=8, help="并发实例数")
+    parser.add_argument("--turns", type=int, default=500, help="每个实例的轮次数")
+    parser.add_argument("--sessions", type=int, default=50, help="每个实例负责的会话数")
+    parser.add_argument("--redis", default=None, help="真实 redis-server 地址 host:port")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    work_dir = tempfile.mkdtemp(prefix="bench_session_store_")
+    server = None
+    if args.redis:
+        host, port = args.redis.rsplit(":", 1)
+        port = int(port)
+    else:
+        server = StubRedisServer().start()
+        host, port = server.host, server.port
+    try:
+        run("文件后端", lambda: SessionStateManager(persistence_dir=work_dir),
+            args.threads, args.turns, args.sessions)
+        pool = ConnectionPool(host, port, max_connections=args.threads)
+        run("Redis 后端", lambda: RedisSessionStateManager(pool=pool, near_cache=False, key_prefix="bench:"),
+            args.threads, args.turns, args.sessions)
+        run("Redis 后端 + 近端缓存", lambda: RedisSessionStateManager(pool=pool, key_prefix="bench:"),
+            args.threads, args.turns, args.sessions)
+        run("Redis 后端（共享实例）",
+            lambda: RedisSessionStateManager(pool=pool, key_prefix="bench:",
+                                             max_sessions=args.threads * args.sessions // 2),
+            args.threads, args.turns, args.sessions, shared=True)
+        for key_kind in ("", ":v"):
+            pool.pipeline([("DEL", *(f"bench:w{i}_s{j}{key_kind}" for j in range(args.sessions)))
+                           for i in range(args.threads)])
+        pool.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# decision_log.py
+"""
+逐轮决策日志（离线分析规则与提示词用）
+- 每轮记录输入、场景、候选意图、解析层级、最终意图、耗时与回复，默认关闭
+- 调用线程只把记录字典追加到内存队列（无锁、不做序列化）；队列达到上限时丢弃新记录并计数
+- 后台线程按批序列化为 JSON Lines，每批压缩为一个 gzip member 追加到当前分段文件；
+  分段超过大小上限时轮转，只保留最近若干个分段。进程崩溃最多丢失最后一批，已写出的批次仍可读取
+"""
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from utils.logger import setup_logger
+from utils.metrics import registry as default_registry
+
+logger = setup_logger(__name__)
+
+
+class DecisionLog:
+    """有界内存缓冲 + 后台批量写出的决策日志"""
+
+    def __init__(self, directory: str = "logs/decisions", max_buffer: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 1.0, segment_bytes: int = 64 * 1024 * 1024,
+                 keep_segments: Optional[int] = None, compress: bool = True, metrics=None):
+        """
+        Args:
+            directory: 分段文件目录
+            max_buffer: 内存中待写出记录数上限，超出时丢弃新记录
+            batch_size: 攒满该条数即唤醒后台线程写出
+            flush_interval: 不足一批时的最长写出间隔（秒）
+            segment_bytes: 单个分段文件的大小上限（写入磁盘的字节数），超出后轮转
+            keep_segments: 本进程最多保留的分段数，超出时删除最旧的（None 表示不删除）
+            compress: 是否 gzip 压缩（分段后缀 .jsonl.gz / .jsonl）
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        self.keep_segments = keep_segments
+        self.compress = compress
+        self.written = 0
+        self.segments: List[Path] = []
+
+        self.metrics = metrics or default_registry
+        self._records_counter = self.metrics.counter(
+            "decision_log_records_total", "决策日志记录数 (outcome: written/dropped)", ("outcome",))
+        self._flush_hist = self.metrics.histogram("decision_log_flush_seconds", "决策日志每批写出耗时")
+
+        self._buffer: deque = deque()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._file = None
+        self._segment_size = 0
+        self._seq = 0
+        self._writing = False
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+        self._start()
+        atexit.register(self.close)
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]], metrics=None) -> Optional["DecisionLog"]:
+        """config.yaml 中的 decision_log 段；未配置或 enabled 为 false 时返回 None（不记录）"""
+        if not config or not config.get('enabled', True):
+            return None
+        return cls(directory=config.get('dir', 'logs/decisions'),
+                   max_buffer=config.get('max_buffer', 10000), batch_size=config.get('batch_size', 500),
+                   flush_interval=config.get('flush_interval', 1.0),
+                   segment_bytes=int(config.get('segment_mb', 64) * 1024 * 1024),
+                   keep_segments=config.get('keep_segments'), compress=config.get('compress', True), metrics=metrics)
+
+    @property
+    def dropped(self) -> int:
+        return int(self._records_counter.get("dropped"))
+
+    def record(self, entry: Dict[str, Any]) -> bool:
+        """追加一条记录（调用线程中只做入队）；缓冲区已满时丢弃并返回 False"""
+        if self._pid != os.getpid():
+            self._reinit_after_fork()
+        buffer = self._buffer
+        if len(buffer) >= self.max_buffer:
+            self._records_counter.inc("dropped")
+            return False
+        buffer.append(entry)
+        if len(buffer) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def flush(self, timeout: float = 5.0):
+        """唤醒后台线程写出当前缓冲区并等待其清空（测试或关闭前使用）"""
+        deadline = time.monotonic() + timeout
+        self._wake.set()
+        while (self._buffer or self._writing) and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def close(self):
+        """停止后台线程，写出剩余记录并关闭分段文件"""
+        if self._pid != os.getpid() or self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # --- 后台线程 ---
+
+    def _start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="decision-log", daemon=True)
+        self._thread.start()
+
+    def _reinit_after_fork(self):
+        """fork 出的子进程里没有后台线程：丢弃继承自父进程的缓冲（由父进程写出），改写自己的分段"""
+        self._pid = os.getpid()
+        self._buffer = deque()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._file = None
+        self._segment_size = 0
+        self.segments = []
+        self._start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        buffer = self._buffer
+        while buffer:
+            self._writing = True
+            batch = []
+            try:
+                while buffer and len(batch) < self.batch_size:
+                    batch.append(buffer.popleft())
+            except IndexError:
+                pass
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                logger.error("写出决策日志失败（丢弃 %s 条）: %s", len(batch), e)
+                self._records_counter.inc("dropped", amount=len(batch))
+        self._writing = False
+
+    def _write_batch(self, batch: List[Dict[str, Any]]):
+        t_start = time.perf_counter()
+        data = "".join(json.dumps(entry, ensure_ascii=False, default=str) + "\n" for entry in batch).encode('utf-8')
+        if self.compress:
+            data = gzip.compress(data, compresslevel=1)
+        if self._file is None or (self._segment_size and self._segment_size + len(data) > self.segment_bytes):
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._segment_size += len(data)
+        self.written += len(batch)
+        self._records_counter.inc("written", amount=len(batch))
+        if self.metrics.enabled:
+            self._flush_hist.observe(time.perf_counter() - t_start)
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        self._seq += 1
+        suffix = ".jsonl.gz" if self.compress else ".jsonl"
+        path = self.directory / f"decisions-{time.strftime('%Y%m%d-%H%M%S')}-{self._pid}-{self._seq:04d}{suffix}"
+        self._file = open(path, 'ab')
+        self._segment_size = 0
+        self.segments.append(path)
+        if self.keep_segments is not None:
+            while len(self.segments) > max(1, self.keep_segments):
+                try:
+                    self.segments.pop(0).unlink()
+                except FileNotFoundError:
+                    pass
+
+
+def read_decisions(directory: str) -> Iterator[Dict[str, Any]]:
+    """按文件名顺序读取目录下全部分段的记录；进程崩溃时末尾不完整的批次整批跳过"""
+    for path in sorted(Path(directory).glob("decisions-*.jsonl*")):
+        with open(path, 'rb') as f:
+            batches = _gzip_members(f, path) if path.suffix == ".gz" else [f.read()]
+            for data in batches:
+                lines = data.split(b"\n")
+                if lines[-1]:
+                    logger.warning("决策日志分段不完整 %s：末尾一行被截断", path)
+                for line in lines[:-1]:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+def _gzip_members(f, path: Path) -> Iterator[bytes]:
+    """逐个解压 gzip member（每个 member 是一批记录），只返回完整的 member"""
+    decompressor = zlib.decompressobj(wbits=31)
+    parts: List[bytes] = []
+    for chunk in iter(lambda: f.read(65536), b""):
+        while chunk:
+            try:
+                parts.append(decompressor.decompress(chunk))
+            except zlib.error as e:
+                logger.warning("决策日志分段损坏 %s: %s", path, e)
+                return
+            if not decompressor.eof:
+                break
+            yield b"".join(parts)
+            parts = []
+            chunk = decompressor.unused_data
+            decompressor = zlib.decompressobj(wbits=31)
+    if parts:
+        logger.warning("决策日志分段不完整 %s：末尾一批被截断", path)
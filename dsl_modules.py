@@ -0,0 +1,196 @@
+# dsl_modules.py
+"""
+多文件 DSL 模块
+- 顶层 include "x.dsl" / import "x.dsl"（两者等价）把其他文件的场景并入当前程序，路径相对于声明所在的文件
+- 加载时建立依赖图（循环 include 报错），按“入口文件在前、深度优先”的顺序拼接场景，入口文件的第一个场景即入口场景
+- 加载时校验跨文件的 goto 目标与重名场景，错误在切换程序之前暴露
+- 按文件缓存解析结果，只有内容变化的文件会被重新解析；待解析文件较多时（如冷启动）分发到进程池并行解析
+"""
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from dsl_parser import SimpleDSLParser
+from dsl_program import DSLProgram, _scene_digest
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+@dataclass
+class DSLModule:
+    """单个 .dsl 文件的解析结果"""
+    path: str
+    content_digest: str
+    signature: Tuple[int, int] # (mtime_ns, size)，未变化时连读取都省掉
+    includes: List[str] # 已解析为绝对路径
+    scenes: List[Dict[str, Any]]
+    scene_digests: List[str]
+
+
+def parse_module(script_content: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """解析单个文件，返回 (场景列表, 场景摘要列表)；模块级函数，可在子进程中执行"""
+    scenes, digests = [], []
+    for chunk in SimpleDSLParser.split_scenes(script_content):
+        parsed = SimpleDSLParser.parse(chunk)
+        if parsed['scenes']:
+            scenes.append(parsed['scenes'][0])
+            digests.append(_scene_digest(chunk))
+    return scenes, digests
+
+
+def _signature(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+class ModuleLoader:
+    """多文件程序的加载器；同一个实例可被多个入口脚本共享（按文件缓存）"""
+
+    def __init__(self, workers: Optional[int] = None, parallel_threshold: int = 64):
+        """
+        Args:
+            workers: 并行解析的进程数（默认 CPU 核数，1 表示始终在当前进程解析）
+            parallel_threshold: 本次需要解析的文件数达到该值时才启用进程池（进程启动有固定开销）
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.parallel_threshold = parallel_threshold
+        self._cache: Dict[str, DSLModule] = {}
+        # 依赖图：文件 -> 它 include 的文件
+        self.graph: Dict[str, List[str]] = {}
+        # 最近一次 load 重新解析的文件
+        self.last_parsed: List[str] = []
+        self._lock = threading.Lock()
+
+    def load(self, entry_path: str, previous: Optional[DSLProgram] = None,
+             scene_pool: Optional[Dict[str, Dict[str, Any]]] = None) -> DSLProgram:
+        """
+        加载入口文件及其全部依赖并编译为一个程序
+        scene_pool（摘要 -> 场景）与 compile_program 的含义相同，用于在多个脚本间共享相同场景
+        """
+        with self._lock:
+            entry = os.path.abspath(entry_path)
+            includes_of, pending = self._discover(entry)
+            self._parse_pending(pending)
+            order = self._dependency_order(entry, includes_of)
+
+            scenes, digests, changed = [], [], []
+            owners: Dict[str, str] = {}
+            for path in order:
+                module = self._cache[path]
+                for scene, digest in zip(module.scenes, module.scene_digests):
+                    if scene['name'] in owners:
+                        raise ValueError(f"场景 '{scene['name']}' 在 {owners[scene['name']]} 与 {path} 中重复定义")
+                    owners[scene['name']] = path
+                    shared = scene_pool.get(digest) if scene_pool is not None else None
+                    scenes.append(shared if shared is not None else scene)
+                    digests.append(digest)
+                    if path in pending:
+                        changed.append(scene['name'])
+
+            version = previous.version + 1 if previous else 1
+            program = DSLProgram({'type': 'script', 'scenes': scenes}, version=version,
+                                 scene_digests=digests, changed_scenes=changed)
+            self._check_gotos(program, owners)
+            self.graph.update(includes_of)
+            self.last_parsed = list(pending)
+            logger.info("加载模块程序 %s: %s 个文件，重新解析 %s 个",
+                        entry_path, len(order), len(pending))
+            return program
+
+    def modules_of(self, entry_path: str) -> List[str]:
+        """入口文件（最近一次加载时）依赖的全部文件，包括自身"""
+        entry = os.path.abspath(entry_path)
+        return self._dependency_order(entry, self.graph) if entry in self.graph else [entry]
+
+    # --- 内部实现 ---
+
+    def _discover(self, entry: str) -> Tuple[Dict[str, List[str]], Dict[str, Tuple[str, str, Tuple[int, int], List[str]]]]:
+        """
+        遍历依赖图，返回 (依赖图, 需要重新解析的文件)
+        签名未变的文件直接使用缓存；签名变化但内容摘要相同（如 touch）的文件也不重新解析
+        """
+        includes_of: Dict[str, List[str]] = {}
+        pending: Dict[str, Tuple[str, str, Tuple[int, int], List[str]]] = {}
+        stack = [(entry, None)]
+        while stack:
+            path, parent = stack.pop()
+            if path in includes_of:
+                continue
+            try:
+                signature = _signature(path)
+            except OSError:
+                if parent is None:
+                    raise
+                raise FileNotFoundError(f"{parent} 中 include 的文件不存在: {path}") from None
+            cached = self._cache.get(path)
+            if cached is not None and cached.signature == signature:
+                includes = cached.includes
+            else:
+                with open(path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                content_digest = hashlib.sha1(content.encode('utf-8')).hexdigest()
+                if cached is not None and cached.content_digest == content_digest:
+                    cached.signature = signature
+                    includes = cached.includes
+                else:
+                    base = os.path.dirname(path)
+                    includes = [os.path.abspath(os.path.join(base, p))
+                                for p in SimpleDSLParser.parse_includes(content)]
+                    pending[path] = (content, content_digest, signature, includes)
+            includes_of[path] = includes
+            stack.extend((child, path) for child in reversed(includes))
+        return includes_of, pending
+
+    def _parse_pending(self, pending: Dict[str, Tuple[str, str, Tuple[int, int], List[str]]]):
+        paths = list(pending)
+        contents = [pending[path][0] for path in paths]
+        workers = min(self.workers, len(paths))
+        if workers > 1 and len(paths) >= self.parallel_threshold:
+            from concurrent.futures import ProcessPoolExecutor # 延迟导入：增量加载用不到进程池
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(parse_module, contents, chunksize=max(1, len(paths) // (workers * 4))))
+        else:
+            results = [parse_module(content) for content in contents]
+        for path, (scenes, digests) in zip(paths, results):
+            _, content_digest, signature, includes = pending[path]
+            self._cache[path] = DSLModule(path, content_digest, signature, includes, scenes, digests)
+
+    @staticmethod
+    def _dependency_order(entry: str, includes_of: Dict[str, List[str]]) -> List[str]:
+        """深度优先的前序遍历（入口文件在前）；同一文件只出现一次，循环 include 报错"""
+        order: List[str] = []
+        done = set()
+        chain: List[str] = []
+
+        def visit(path: str):
+            if path in chain:
+                cycle = chain[chain.index(path):] + [path]
+                raise ValueError("循环 include: " + " -> ".join(os.path.basename(p) for p in cycle))
+            if path in done:
+                return
+            done.add(path)
+            order.append(path)
+            chain.append(path)
+            for child in includes_of.get(path, []):
+                visit(child)
+            chain.pop()
+
+        visit(entry)
+        return order
+
+    @staticmethod
+    def _check_gotos(program: DSLProgram, owners: Dict[str, str]):
+        """所有文件拼接完成后再解析 goto，目标可以位于任意被依赖的文件中"""
+        missing = []
+        for scene_name, scene in program.scenes.items():
+            for intent in scene.get('intents', []):
+                for statement in intent.get('statements', []):
+                    target = statement.get('scene') if statement.get('type') == 'goto' else None
+                    if target and not program.has_target(target):
+                        missing.append(f"{os.path.basename(owners[scene_name])}: "
+                                       f"{scene_name}.{intent['name']} -> {target}")
+        if missing:
+            raise ValueError("goto 目标不存在: " + "; ".join(missing))
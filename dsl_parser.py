@@ -76,11 +76,76 @@ class SimpleDSLParser:
                 statement = SimpleDSLParser._parse_single_statement(line)
                 if statement:
                     current_intent['statements'].append(statement)
+            # 5. 场景级声明（expect / escape）
+            elif current_scene is not None:
+                SimpleDSLParser._parse_scene_directive(line, current_scene)
             
             i += 1
             
         return result
     
+    @staticmethod
+    def split_scenes(script_content: str) -> List[str]:
+        """
+        按 scene 声明把源码切分为独立片段（每段可单独 parse）
+        第一个 scene 之前的内容（注释等）被忽略
+        """
+        chunks: List[List[str]] = []
+        for raw_line in script_content.split('\n'):
+            if re.match(r'scene\s+(\w+)\s*\{', raw_line.split('#')[0].strip()):
+                chunks.append([])
+            if chunks:
+                chunks[-1].append(raw_line)
+        return ['\n'.join(chunk) for chunk in chunks]
+
+    @staticmethod
+    def parse_includes(script_content: str) -> List[str]:
+        """
+        顶层（场景之外）的模块声明，按出现顺序返回路径:
+            include "ecommerce.dsl"
+            import "shared/service.dsl"
+        两种写法等价；路径相对于声明所在的文件
+        """
+        paths = []
+        depth = 0
+        for raw_line in script_content.split('\n'):
+            line = raw_line.split('#')[0].strip()
+            if not line:
+                continue
+            if re.match(r'(scene|intent)\s+(\w+)\s*\{', line):
+                depth += 1
+            elif line == '}':
+                depth = max(0, depth - 1)
+            elif depth == 0:
+                include_match = re.match(r'(?:include|import)\s+["\'](.+?)["\']$', line)
+                if include_match:
+                    paths.append(include_match.group(1))
+        return paths
+
+    @staticmethod
+    def _parse_scene_directive(line: str, scene: Dict[str, Any]):
+        """
+        场景级声明:
+            expect "waiting_order_id" -> provide_order_id [as digits] [matching "正则"]
+            escape "主菜单", "退出"
+        expect: 会话处于该 current_step 时，下一句输入直接交给指定意图（不经过 LLM）
+        escape: 输入包含这些关键词时不走 expect，按正常流程识别
+        """
+        expect_match = re.match(
+            r'expect\s+["\'](.*?)["\']\s*->\s*(\w+)(?:\s+as\s+(\w+))?(?:\s+matching\s+(.+))?$', line)
+        if expect_match:
+            step, intent, value_type, pattern = expect_match.groups()
+            scene.setdefault('expects', []).append({
+                'type': 'expect',
+                'step': step,
+                'intent': intent,
+                'value_type': value_type,
+                'pattern': SimpleDSLParser._clean_string(pattern) if pattern else None
+            })
+        elif line.startswith('escape '):
+            keywords = re.findall(r'"(.*?)"|\'(.*?)\'', line[len('escape'):])
+            scene.setdefault('escapes', []).extend(a or b for a, b in keywords)
+
     @staticmethod
     def _parse_single_statement(line: str) -> Any:
         """解析单行语句"""
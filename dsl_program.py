@@ -0,0 +1,182 @@
+# dsl_program.py
+import hashlib
+import re
+import threading
+from typing import Dict, List, Any, Optional, Iterator
+
+from dsl_parser import SimpleDSLParser
+
+# expect ... as <类型> 支持的类型检查（对去掉首尾空白后的整句做完整匹配）
+EXPECT_TYPES = {
+    "text": r"\S.*",
+    "digits": r"\d+",
+    "number": r"[-+]?\d+(?:\.\d+)?",
+}
+
+
+class ExpectRule:
+    """编译后的 expect 声明：会话处于 step 时，下一句输入直接交给 intent"""
+
+    def __init__(self, step: str, intent: str, value_type: Optional[str] = None,
+                 pattern: Optional[str] = None, escapes: Optional[List[str]] = None):
+        if value_type is not None and value_type not in EXPECT_TYPES:
+            raise ValueError(f"expect 不支持的类型: {value_type}（可选: {', '.join(EXPECT_TYPES)}）")
+        self.step = step
+        self.intent = intent
+        self.value_type = value_type
+        self.escapes = list(escapes or [])
+        self._type_re = re.compile(EXPECT_TYPES[value_type]) if value_type else None
+        self._pattern_re = re.compile(pattern) if pattern else None
+
+    def accepts(self, user_input: str) -> bool:
+        """输入不含逃逸关键词且通过类型/正则检查时返回 True"""
+        text = user_input.strip()
+        if not text or any(keyword in text for keyword in self.escapes):
+            return False
+        if self._type_re is not None and not self._type_re.fullmatch(text):
+            return False
+        if self._pattern_re is not None and not self._pattern_re.search(text):
+            return False
+        return True
+
+class DSLProgram:
+    """
+    编译后的 DSL 程序（只读）
+    在解析结果之上建立场景/意图索引；热更新时整体替换，正在执行的轮次继续使用旧对象
+    """
+
+    def __init__(self, script: Dict[str, Any], version: int = 1,
+                 scene_digests: Optional[List[str]] = None, changed_scenes: Optional[List[str]] = None):
+        self.script = script
+        self.version = version
+        scenes = script.get('scenes', [])
+        self.scenes: Dict[str, Dict[str, Any]] = {s['name']: s for s in scenes}
+        self.entry_scene: str = scenes[0]['name'] if scenes else "main"
+
+        # 同名意图以先出现的场景为准（与逐场景查找的顺序一致）
+        self.intents: Dict[str, Dict[str, Any]] = {}
+        for scene in scenes:
+            for intent in scene.get('intents', []):
+                self.intents.setdefault(intent['name'], intent)
+        self.available_intents: List[str] = list(self.intents)
+
+        # current_step -> ExpectRule；同一 step 以先出现的声明为准
+        self.expects: Dict[str, ExpectRule] = {}
+        for scene in scenes:
+            for expect in scene.get('expects', []):
+                if expect['intent'] not in self.intents:
+                    raise ValueError(f"expect 指向不存在的意图: {expect['intent']}")
+                if expect['step'] not in self.expects:
+                    self.expects[expect['step']] = ExpectRule(
+                        expect['step'], expect['intent'], expect.get('value_type'),
+                        expect.get('pattern'), scene.get('escapes'))
+
+        # 场景源码摘要 -> 解析结果，用于增量编译时复用未改动的场景
+        self.scene_digests = scene_digests or []
+        self.scene_by_digest: Dict[str, Dict[str, Any]] = dict(zip(self.scene_digests, scenes))
+        self.changed_scenes = changed_scenes if changed_scenes is not None else list(self.scenes)
+
+    def has_target(self, name: str) -> bool:
+        """goto 的目标既可能是场景也可能是意图名"""
+        return name in self.scenes or name in self.intents
+
+
+def _scene_digest(chunk: str) -> str:
+    # 以去掉注释和空行后的内容计算摘要，仅修改注释或排版不会触发重新解析
+    lines = (line.split('#')[0].strip() for line in chunk.split('\n'))
+    normalized = "\n".join(line for line in lines if line)
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def compile_program(script_content: str, previous: Optional[DSLProgram] = None,
+                    scene_pool: Optional[Dict[str, Dict[str, Any]]] = None) -> DSLProgram:
+    """
+    编译 DSL 源码
+    传入 previous 时按场景增量编译：源码未变的场景直接复用旧的解析结果
+    传入 scene_pool（摘要 -> 场景）时，与其他脚本完全相同的场景共享同一个只读对象
+    """
+    scenes = []
+    digests = []
+    changed = []
+    for chunk in SimpleDSLParser.split_scenes(script_content):
+        digest = _scene_digest(chunk)
+        scene = previous.scene_by_digest.get(digest) if previous else None
+        if scene is None and scene_pool is not None:
+            scene = scene_pool.get(digest)
+        if scene is None:
+            parsed = SimpleDSLParser.parse(chunk)
+            if not parsed['scenes']:
+                continue
+            scene = parsed['scenes'][0]
+            changed.append(scene['name'])
+        scenes.append(scene)
+        digests.append(digest)
+
+    version = previous.version + 1 if previous else 1
+    return DSLProgram({'type': 'script', 'scenes': scenes}, version=version,
+                      scene_digests=digests, changed_scenes=changed)
+
+
+class ProgramRegistry:
+    """
+    进程内的多脚本注册表（脚本名 -> DSLProgram）
+    所有脚本的场景按源码摘要去重共享；会话通过状态中的 script 字段绑定到其中一个程序
+    """
+
+    def __init__(self):
+        self._programs: Dict[str, DSLProgram] = {}
+        self._scene_pool: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def compile(self, name: str, script_content: str) -> DSLProgram:
+        """编译（或增量重新编译）脚本并注册，返回新程序"""
+        with self._lock:
+            previous = self._programs.get(name)
+            program = compile_program(script_content, previous=previous, scene_pool=self._scene_pool)
+        self.register(name, program)
+        return program
+
+    def compile_modules(self, name: str, entry_path: str, loader) -> DSLProgram:
+        """编译由 include/import 组成的多文件程序（loader 为 dsl_modules.ModuleLoader）并注册"""
+        with self._lock:
+            previous = self._programs.get(name)
+            program = loader.load(entry_path, previous=previous, scene_pool=self._scene_pool)
+        self.register(name, program)
+        return program
+
+    def register(self, name: str, program: DSLProgram):
+        with self._lock:
+            self._programs[name] = program
+            self._rebuild_scene_pool()
+
+    def unregister(self, name: str):
+        with self._lock:
+            if self._programs.pop(name, None) is not None:
+                self._rebuild_scene_pool()
+
+    def _rebuild_scene_pool(self):
+        """重建场景池，释放已不被任何程序引用的旧场景（调用方持有 self._lock）"""
+        pool: Dict[str, Dict[str, Any]] = {}
+        for live in self._programs.values():
+            pool.update(live.scene_by_digest)
+        self._scene_pool = pool
+
+    def get(self, name: str) -> Optional[DSLProgram]:
+        return self._programs.get(name)
+
+    def __getitem__(self, name: str) -> DSLProgram:
+        return self._programs[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._programs
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._programs))
+
+    def __len__(self) -> int:
+        return len(self._programs)
+
+    def stats(self) -> Dict[str, int]:
+        """场景共享情况：各程序场景总数 vs 实际驻留的唯一场景数"""
+        total = sum(len(p.scene_digests) for p in self._programs.values())
+        return {"programs": len(self._programs), "scenes": total, "unique_scenes": len(self._scene_pool)}
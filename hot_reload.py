@@ -0,0 +1,71 @@
+# hot_reload.py
+import os
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+class ScriptWatcher:
+    """
+    轮询式文件监视器
+    后台线程定期比较文件的 (mtime, size)，变化时调用回调；回调也在后台线程执行，不阻塞请求处理
+    """
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self._watched: Dict[str, Tuple[Optional[Tuple[int, int]], Callable[[str], None]]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _signature(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def watch(self, path: str, callback: Callable[[str], None]):
+        with self._lock:
+            self._watched[path] = (self._signature(path), callback)
+
+    def unwatch(self, path: str):
+        with self._lock:
+            self._watched.pop(path, None)
+
+    def check_once(self):
+        """检查一轮所有文件（测试或手动触发时可直接调用）"""
+        with self._lock:
+            items = list(self._watched.items())
+        for path, (old_sig, callback) in items:
+            sig = self._signature(path)
+            if sig is None or sig == old_sig:
+                continue
+            with self._lock:
+                if path in self._watched:
+                    self._watched[path] = (sig, callback)
+            try:
+                callback(path)
+            except Exception as e:
+                logger.error("处理脚本变更失败 %s: %s", path, e)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def _loop():
+            while not self._stop.wait(self.interval):
+                self.check_once()
+
+        self._thread = threading.Thread(target=_loop, name="dsl-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
@@ -1,10 +1,20 @@
 # interpreter.py
 import re
-from typing import Dict, List, Any, Optional, Union
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import MISSING, dataclass, field, fields
+from time import perf_counter
+from typing import Callable, Dict, List, Any, Optional, Set, Tuple, Union
 
 from utils.logger import setup_logger
+from utils.metrics import registry as default_registry
+from dsl_program import DSLProgram, ProgramRegistry
+from state_manager import VersionConflict
 logger = setup_logger(__name__)
 
+HISTORY_LIMIT = 20 # 会话中保留的最近对话条数
+
 # [ConversationState, DSLInterpreter.__init__, set_current_script, execute_initial_greeting, execute, _get_available_intents 方法保持不变]
 # -----------------------------------------------------------------------------------------------------------------------------------------
 class ConversationState:
@@ -14,6 +24,7 @@ class ConversationState:
         self.history: List[Dict[str, str]] = []
         self.current_scene: str = "main"
         self.current_intent: str = ""
+        self.script: str = "" # 会话绑定的脚本名（多脚本托管），空表示使用默认脚本
         self.variables: Dict[str, Any] = {}
         self.last_response: str = ""
         self.variables['current_step'] = ""
@@ -22,14 +33,15 @@ class ConversationState:
     
     def add_to_history(self, role: str, content: str):
         self.history.append({"role": role, "content": content})
-        if len(self.history) > 20:
-            self.history = self.history[-20:]
+        if len(self.history) > HISTORY_LIMIT:
+            self.history = self.history[-HISTORY_LIMIT:]
     
     def to_dict(self) -> Dict[str, Any]:
         return {
             "history": self.history.copy(),
             "current_scene": self.current_scene,
             "current_intent": self.current_intent,
+            "script": self.script,
             "variables": self.variables.copy(),
             "last_response": self.last_response
         }
@@ -38,6 +50,7 @@ class ConversationState:
         self.history = state_dict.get("history", []).copy()
         self.current_scene = state_dict.get("current_scene", "main")
         self.current_intent = state_dict.get("current_intent", "")
+        self.script = state_dict.get("script", "")
         self.variables = state_dict.get("variables", {}).copy()
         self.last_response = state_dict.get("last_response", "")
         for key in ['current_step', 'user_input', 'result']:
@@ -45,27 +58,235 @@ class ConversationState:
                 self.variables[key] = ""
 
 
+class IntentCache:
+    """
+    最近 LLM 识别结果的 LRU 缓存（键: 脚本、场景、current_step、规范化后的输入）
+    只在本轮来不及或不允许调用 LLM 时作为降级结果使用
+    """
+    
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Tuple[str, ...], str]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key(state: ConversationState, user_input: str) -> Tuple[str, ...]:
+        return (state.script, state.current_scene, str(state.variables.get('current_step', '')),
+                " ".join(user_input.lower().split()))
+    
+    def get(self, key: Tuple[str, ...]) -> Optional[str]:
+        with self._lock:
+            intent = self._data.get(key)
+            if intent is not None:
+                self._data.move_to_end(key)
+            return intent
+    
+    def put(self, key: Tuple[str, ...], intent: str):
+        with self._lock:
+            self._data[key] = intent
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+_MISSING = object()
+
+
+def merge_turn_state(base: Dict[str, Any], ours: Dict[str, Any], theirs: Dict[str, Any],
+                     top_level: bool = True) -> Dict[str, Any]:
+    """
+    三方合并一轮对话的结果（提交时发现会话已被并发请求更新）
+    base: 本轮开始时读到的状态；ours: 本轮结束时的状态；theirs: 存储中的最新状态
+    本轮改动过的键（含 variables 中的单个变量）以本轮为准，其余保留 theirs；
+    history 把本轮追加的条目接在 theirs 之后，双方的对话都不会丢失
+    """
+    merged = dict(theirs)
+    for key in set(base) | set(ours):
+        before, after = base.get(key, _MISSING), ours.get(key, _MISSING)
+        if after == before:
+            continue
+        if top_level and key == "history":
+            appended = _appended_entries(before if before is not _MISSING else [], after or [])
+            merged[key] = (list(theirs.get(key) or []) + appended)[-HISTORY_LIMIT:]
+        elif isinstance(before, dict) and isinstance(after, dict) and isinstance(theirs.get(key), dict):
+            merged[key] = merge_turn_state(before, after, theirs[key], top_level=False)
+        elif after is _MISSING:
+            merged.pop(key, None)
+        else:
+            merged[key] = after
+    return merged
+
+
+def _appended_entries(before: List[Any], after: List[Any]) -> List[Any]:
+    """after 是 before 追加若干条后截断到上限的结果，返回追加的条目"""
+    for count in range(len(after) + 1):
+        kept = after[:len(after) - count]
+        if not kept or before[-len(kept):] == kept:
+            return after[len(after) - count:]
+    return list(after)
+
+
+@dataclass
+class Recognition:
+    """识别阶段的结果：候选意图及其来源层级（expect/rule/llm/cache/default）"""
+    intent: str
+    tier: str
+    degraded: Optional[str] = None
+
+
+@dataclass
+class Execution:
+    """执行阶段的结果；status: ok（执行完成，response 可能为空）/ rejected（validate 失败）/ missing（未定义）"""
+    intent: str
+    response: Optional[str]
+    status: str
+
+
+@dataclass
+class TurnContext:
+    """单轮对话在各阶段之间传递的上下文"""
+    user_input: str
+    session_id: str
+    script: Optional[str]
+    t_start: float
+    program: Optional[DSLProgram] = None
+    available_intents: List[str] = field(default_factory=list)
+    scene: str = "" # 本轮开始时所在的场景（goto 之前）
+    budget: Optional[float] = None
+    deadline: Optional[float] = None
+    next_tier: int = 0 # 下一个要尝试的识别层级（self.recognizers 的下标）
+    recognition: Optional[Recognition] = None
+    intent: Optional[str] = None # 最近一次识别出的意图（没有意图执行成功时用于兜底回复）
+    attempted: Set[str] = field(default_factory=set) # 本轮已执行过的意图，每个意图至多执行一次
+    execution: Optional[Execution] = None
+    tier: str = "default"
+    degraded: Optional[str] = None
+    response: str = ""
+    phases: Dict[str, float] = field(default_factory=dict)
+    version: Optional[int] = None # 读取时的会话版本（提交时 compare-and-set）
+    base: Dict[str, Any] = field(default_factory=dict) # 读取时的会话状态（合并时的共同祖先）
+    state: ConversationState = field(default_factory=ConversationState) # 本轮的对话状态，各轮互不共享
+    commits: int = 0 # 因版本冲突重新提交的次数
+    
+    def restart(self):
+        """重新执行整轮前复位各阶段的中间结果（保留输入、开始时间、阶段耗时与提交次数）"""
+        keep = ("user_input", "session_id", "script", "t_start", "phases", "commits")
+        for f in fields(self):
+            if f.name not in keep:
+                setattr(self, f.name, f.default_factory() if f.default_factory is not MISSING else f.default)
+
+
 class DSLInterpreter:
     """DSL解释器"""
     
-    def __init__(self, llm_client, state_manager):
+    def __init__(self, llm_client, state_manager, metrics=None,
+                 programs: Optional[ProgramRegistry] = None, admission=None):
         self.llm_client = llm_client
+        # 可选的 LLM 准入控制（admission.AdmissionController），被拒绝的轮次降级到默认层
+        self.admission = admission
+        # 性能剖析（profiler.TurnProfiler），None 表示关闭
+        self.profiler = None
+        # 逐轮决策日志（decision_log.DecisionLog），None 表示关闭
+        self.decision_log = None
+        # 单轮截止时间（秒，从读取会话开始计）：全局默认值与按场景覆盖，None 表示不限
+        self.turn_deadline: Optional[float] = None
+        self.scene_deadlines: Dict[str, float] = {}
+        self.intent_cache = IntentCache()
         self.state_manager = state_manager
-        self.current_script: Optional[Dict[str, Any]] = None
+        # 提交会话时的版本冲突处理：merge（三方合并本轮改动）/ retry（基于最新状态重新执行整轮）/
+        # overwrite（不做版本比较，直接覆盖）；commit_retries 为冲突后最多重新提交的次数
+        self.conflict_policy = "merge"
+        self.commit_retries = 3
+        # 编译后的程序；热更新时整体替换，执行中的轮次持有旧引用直到结束
+        self.program: Optional[DSLProgram] = None
+        # 多脚本托管：会话按 state.script 路由到注册表中的程序，未绑定时使用 self.program
+        self.programs = programs
+        # 最近一轮结束时的对话状态（只读视图，供调试与测试查看）；执行中的轮次各自持有 ctx.state
         self.state = ConversationState()
+        # 最近一轮的汇总记录（意图、解析层级、各阶段耗时），按线程区分，见 last_turn 属性
+        self._local = threading.local()
+        # 轮次流水线与识别层级，均为 (名称, 可调用对象) 列表，可重排、删减或插入自定义阶段/层级
+        # 阶段签名 stage(ctx) -> Optional[str]（返回阶段名表示跳转），层级签名 recognizer(ctx) -> Optional[Recognition]
+        self.stages: List[Tuple[str, Callable[[TurnContext], Optional[str]]]] = [
+            ("load", self._stage_load),
+            ("recognize", self._stage_recognize),
+            ("resolve", self._stage_resolve),
+            ("execute", self._stage_execute),
+            ("render", self._stage_render),
+            ("persist", self._stage_persist),
+        ]
+        self.recognizers: List[Tuple[str, Callable[[TurnContext], Optional[Recognition]]]] = [
+            ("expect", self._recognize_expect),
+            ("rule", self._recognize_rule),
+            ("llm", self._recognize_llm),
+            ("default", self._recognize_default),
+        ]
+        
+        self.metrics = metrics or default_registry
+        self._phase_hist = self.metrics.histogram(
+            "dsl_turn_phase_seconds", "单轮对话各阶段耗时", ("phase",))
+        self._turn_hist = self.metrics.histogram("dsl_turn_seconds", "单轮对话总耗时")
+        self._tier_counter = self.metrics.counter(
+            "dsl_intent_tier_total", "解析出意图的层级 (expect/rule/llm/cache/default)", ("tier",))
+        self._degraded_counter = self.metrics.counter(
+            "dsl_turn_degraded_total", "未能调用 LLM 而降级的轮次 (原因: deadline/shed)", ("reason",))
+        self._commit_counter = self.metrics.counter(
+            "dsl_commit_conflicts_total", "提交会话时的版本冲突 (merged/retried/failed)", ("outcome",))
+    
+    @property
+    def last_turn(self) -> Dict[str, Any]:
+        """当前线程最近一轮的汇总记录；多个线程共用解释器时各自读到自己执行的那一轮"""
+        return getattr(self._local, "last_turn", {})
+    
+    @last_turn.setter
+    def last_turn(self, record: Dict[str, Any]):
+        self._local.last_turn = record
+    
+    @property
+    def current_script(self) -> Optional[Dict[str, Any]]:
+        return self.program.script if self.program else None
     
     def set_current_script(self, script: Dict[str, Any]):
-        self.current_script = script
-        if script and script.get('scenes'):
-            self.state.current_scene = script['scenes'][0]['name']
+        self.set_program(DSLProgram(script) if script else None)
+    
+    def set_program(self, program: Optional[DSLProgram]):
+        """原子地切换到新编译的程序（单次引用赋值）"""
+        self.program = program
     
-    def execute_initial_greeting(self, session_id: str = "default") -> str:
+    def _resolve_program(self, state: ConversationState, session_id: str,
+                         script: Optional[str] = None) -> Optional[DSLProgram]:
+        """
+        确定本轮使用的程序（需在 state.from_dict 之后调用）
+        传入 script 时把会话绑定到该脚本，并从其入口场景开始
+        """
+        if script and script != state.script:
+            if self.programs is None or script not in self.programs:
+                raise KeyError(f"未加载的脚本: {script}")
+            state.script = script
+            state.current_scene = self.programs[script].entry_scene
+            logger.info("会话 %s 绑定到脚本 %s", session_id, script)
+        if state.script and self.programs is not None:
+            program = self.programs.get(state.script)
+            if program is not None:
+                return program
+        return self.program
+    
+    def _remap_scene(self, state: ConversationState, program: DSLProgram, session_id: str):
+        """热更新后会话所在场景可能已被删除：重置到入口场景"""
+        scene = state.current_scene
+        if program.scenes and not program.has_target(scene):
+            logger.warning("会话 %s 的场景 '%s' 在 v%s 中已不存在，重置为 '%s'",
+                           session_id, scene, program.version, program.entry_scene)
+            state.current_scene = program.entry_scene
+    
+    def execute_initial_greeting(self, session_id: str = "default", script: Optional[str] = None) -> str:
         try:
-            session_state = self.state_manager.get_state(session_id)
-            self.state.from_dict(session_state)
+            state = ConversationState()
+            state.from_dict(self.state_manager.get_state(session_id))
+            program = self._resolve_program(state, session_id, script)
             
-            greeting_resp = self._execute_dsl_intent("greeting", "") 
-            menu_resp = self._execute_dsl_intent("main_menu", "") 
+            greeting_resp = self._execute_dsl_intent(state, "greeting", "", program) 
+            menu_resp = self._execute_dsl_intent(state, "main_menu", "", program) 
 
             response = ""
             if greeting_resp and greeting_resp != "未找到意图的处理逻辑": response += greeting_resp
@@ -75,102 +296,316 @@ class DSLInterpreter:
             
             if not response: response = self._get_default_response("greeting")
             
-            self.state.add_to_history("assistant", response)
-            self.state_manager.update_state(session_id, self.state.to_dict())
+            state.add_to_history("assistant", response)
+            self.state_manager.update_state(session_id, state.to_dict())
+            self.state = state
             return response
         except Exception as e:
-            logger.error(f"执行初始问候失败: {e}")
+            logger.error("执行初始问候失败: %s", e)
             return "系统初始化失败。"
 
-    def execute(self, user_input: str, session_id: str = "default") -> str:
+    def execute(self, user_input: str, session_id: str = "default", script: Optional[str] = None) -> str:
+        profiler = self.profiler
+        if profiler is None:
+            return self._execute(user_input, session_id, script)
+        return profiler.run_turn(self._execute, user_input, session_id, script)
+    
+    def _execute(self, user_input: str, session_id: str, script: Optional[str]) -> str:
+        """按 self.stages 依次执行各阶段；阶段可返回另一阶段名以跳转（validate 失败时回到 recognize）"""
+        ctx = TurnContext(user_input=user_input, session_id=session_id, script=script,
+                          t_start=perf_counter())
         try:
-            session_state = self.state_manager.get_state(session_id)
-            self.state.from_dict(session_state)
-            self.state.variables['user_input'] = user_input
-            
-            available_intents = self._get_available_intents()
-            intent_name = None
-            response = None
-            
-            # 1. 规则匹配
-            intent_name = self.llm_client.fallback_intent_recognition(user_input, available_intents)
-            if intent_name:
-                logger.info(f"执行层: 规则匹配命中意图 '{intent_name}'")
-                response = self._execute_dsl_intent(intent_name, user_input)
-            
-            # 2. LLM 理解 (如果规则未命中，或者规则命中的意图执行中断/无回复)
-            if not response:
-                if not intent_name:
-                    intent_name = self.llm_client.intelligent_intent_recognition(
-                        user_input=user_input,
-                        available_intents=available_intents,
-                        conversation_context=self.state.history
-                    )
-                    logger.info(f"执行层: LLM 识别意图 '{intent_name}'")
-                
-                response = self._execute_dsl_intent(intent_name, user_input)
-            
-            # 3. 最终兜底
-            if not response:
-                if intent_name != "default" and "default" in available_intents:
-                    response = self._execute_dsl_intent("default", user_input)
-                
-                if not response or response == "未找到意图的处理逻辑":
-                     response = self._get_default_response(intent_name)
-
-            self.state.current_intent = intent_name if intent_name else "N/A"
-            self.state.add_to_history("user", user_input) 
-            self.state.add_to_history("assistant", response)
-            self.state.last_response = response
-            self.state_manager.update_state(session_id, self.state.to_dict())
+            stages = self.stages
+            index = 0
+            while index < len(stages):
+                name, stage = stages[index]
+                t_stage = perf_counter()
+                jump = stage(ctx)
+                ctx.phases[name] = ctx.phases.get(name, 0.0) + perf_counter() - t_stage
+                if jump is None:
+                    index += 1
+                else:
+                    index = next(i for i, (n, _) in enumerate(stages) if n == jump)
             
-            return response
+            total = perf_counter() - ctx.t_start
+            self.state = ctx.state
+            self._record_turn(session_id, ctx.state.current_intent, ctx.tier, ctx.phases,
+                              total, ctx.degraded, ctx.budget)
+            decision_log = self.decision_log
+            if decision_log is not None:
+                decision_log.record({
+                    "ts": time.time(),
+                    "session_id": session_id,
+                    "script": ctx.state.script,
+                    "version": ctx.program.version if ctx.program else None,
+                    "scene": ctx.scene,
+                    "input": user_input,
+                    "candidates": ctx.available_intents,
+                    "tier": ctx.tier,
+                    "intent": ctx.state.current_intent,
+                    "degraded": ctx.degraded,
+                    "latency_ms": total * 1000,
+                    "response": ctx.response,
+                })
+            return ctx.response
             
         except Exception as e:
-            logger.error(f"执行出错: {e}")
+            logger.error("执行出错: %s", e)
             return f"系统错误: {e}"
     
-    def _get_available_intents(self) -> List[str]:
-        if not self.current_script: return ["greeting", "default"]
-        all_intents = set()
-        for scene in self.current_script.get('scenes', []):
-            for intent in scene.get('intents', []):
-                all_intents.add(intent['name'])
-        return list(all_intents)
+    # --- 轮次阶段：load → recognize → resolve → execute → render → persist ---
+    
+    def _stage_load(self, ctx: "TurnContext") -> Optional[str]:
+        session_state, ctx.version = self.state_manager.get_state(ctx.session_id, with_version=True)
+        ctx.base = session_state
+        ctx.state.from_dict(session_state)
+        ctx.state.variables['user_input'] = ctx.user_input
+        ctx.program = self._resolve_program(ctx.state, ctx.session_id, ctx.script)
+        if ctx.program:
+            self._remap_scene(ctx.state, ctx.program, ctx.session_id)
+        ctx.scene = ctx.state.current_scene
+        ctx.available_intents = self._get_available_intents(ctx.program)
+        ctx.budget = self.scene_deadlines.get(ctx.state.current_scene, self.turn_deadline)
+        ctx.deadline = ctx.t_start + ctx.budget if ctx.budget is not None else None
+        return None
+    
+    def _stage_recognize(self, ctx: "TurnContext") -> Optional[str]:
+        """从下一个尚未尝试的层级起，取第一个给出候选意图的层级；全部用尽时 ctx.recognition 为 None"""
+        ctx.recognition = None
+        while ctx.next_tier < len(self.recognizers):
+            _, recognizer = self.recognizers[ctx.next_tier]
+            ctx.next_tier += 1
+            recognition = recognizer(ctx)
+            if recognition is not None:
+                ctx.recognition = recognition
+                break
+        return None
+    
+    def _stage_resolve(self, ctx: "TurnContext") -> Optional[str]:
+        """本轮已执行过、或程序中没有定义的意图不再执行，直接进入下一层级"""
+        recognition = ctx.recognition
+        if recognition is None:
+            return None
+        ctx.intent = recognition.intent
+        if ctx.program is None:
+            return None
+        if recognition.intent in ctx.attempted or recognition.intent not in ctx.program.intents:
+            logger.info("执行层: 跳过意图 '%s'（%s 层，本轮已执行或未定义）",
+                        recognition.intent, recognition.tier)
+            ctx.recognition = None
+            return "recognize"
+        return None
+    
+    def _stage_execute(self, ctx: "TurnContext") -> Optional[str]:
+        recognition = ctx.recognition
+        if recognition is None or ctx.program is None:
+            return None
+        ctx.attempted.add(recognition.intent)
+        execution = self._run_intent(ctx.state, recognition.intent, ctx.user_input, ctx.program)
+        if execution.status == "rejected":
+            return "recognize"
+        ctx.execution = execution
+        ctx.tier = recognition.tier
+        return None
+    
+    def _stage_render(self, ctx: "TurnContext") -> Optional[str]:
+        execution = ctx.execution
+        if execution is not None and execution.response:
+            ctx.response = execution.response
+            intent_name = execution.intent
+        else:
+            intent_name = execution.intent if execution is not None else ctx.intent
+            ctx.response = self._get_default_response(intent_name)
+        ctx.state.current_intent = intent_name if intent_name else "N/A"
+        ctx.state.add_to_history("user", ctx.user_input)
+        ctx.state.add_to_history("assistant", ctx.response)
+        ctx.state.last_response = ctx.response
+        return None
+    
+    def _stage_persist(self, ctx: "TurnContext") -> Optional[str]:
+        """
+        以读取时的版本做 compare-and-set 提交；期间会话被并发请求更新时按 conflict_policy 处理：
+        merge 把本轮改动合并到最新状态后重新提交，retry 基于最新状态重新执行整轮
+        """
+        new_state = ctx.state.to_dict()
+        if self.conflict_policy == "overwrite":
+            self.state_manager.update_state(ctx.session_id, new_state)
+            return None
+        while True:
+            try:
+                self.state_manager.update_state(ctx.session_id, new_state, expected_version=ctx.version)
+                return None
+            except VersionConflict as e:
+                ctx.commits += 1
+                if ctx.commits > self.commit_retries:
+                    self._commit_counter.inc("failed")
+                    logger.error("会话 %s 提交失败：%s 次重试后仍有版本冲突，本轮状态未保存",
+                                 ctx.session_id, self.commit_retries)
+                    return None
+                logger.info("会话 %s 版本冲突（期望 %s，当前 %s），%s",
+                            ctx.session_id, e.expected, e.actual, self.conflict_policy)
+            if self.conflict_policy == "retry":
+                self._commit_counter.inc("retried")
+                ctx.restart()
+                return "load"
+            theirs, ctx.version = self.state_manager.get_state(ctx.session_id, with_version=True)
+            new_state = merge_turn_state(ctx.base, new_state, theirs)
+            ctx.base = theirs
+            self._commit_counter.inc("merged")
+    
+    # --- 意图识别层级：expect → rule → llm（或降级的 cache）→ default ---
+    
+    def _recognize_expect(self, ctx: "TurnContext") -> Optional["Recognition"]:
+        """正在等待某个槽位的回答时，直接交给对应意图"""
+        if ctx.program is None:
+            return None
+        expect = ctx.program.expects.get(ctx.state.variables.get('current_step'))
+        if expect is not None and expect.accepts(ctx.user_input):
+            logger.info("执行层: expect 直接命中意图 '%s'", expect.intent)
+            return Recognition(expect.intent, "expect")
+        return None
+    
+    def _recognize_rule(self, ctx: "TurnContext") -> Optional["Recognition"]:
+        intent_name = self.llm_client.fallback_intent_recognition(ctx.user_input, ctx.available_intents)
+        if intent_name:
+            logger.info("执行层: 规则匹配命中意图 '%s'", intent_name)
+            return Recognition(intent_name, "rule")
+        return None
+    
+    def _recognize_llm(self, ctx: "TurnContext") -> Optional["Recognition"]:
+        t_llm = perf_counter()
+        intent_name, degraded = self._llm_recognize(ctx.state, ctx.user_input, ctx.available_intents,
+                                                    ctx.deadline)
+        # llm 是 recognize 阶段的一部分，单独记录以保留 LLM 耗时分布
+        ctx.phases["llm"] = perf_counter() - t_llm
+        ctx.degraded = degraded
+        if intent_name == "default":
+            return Recognition(intent_name, "default", degraded)
+        return Recognition(intent_name, "cache" if degraded else "llm", degraded)
+    
+    def _recognize_default(self, ctx: "TurnContext") -> Optional["Recognition"]:
+        if "default" in ctx.available_intents:
+            return Recognition("default", "default")
+        return None
+    
+    def _llm_recognize(self, state: ConversationState, user_input: str, available_intents: List[str],
+                       deadline: Optional[float]) -> Tuple[str, Optional[str]]:
+        """
+        在剩余预算内调用 LLM，返回 (意图, 降级原因)
+        预算耗尽、准入被拒绝或 LLM 超时时降级：先用缓存的同类识别结果，否则为 default
+        """
+        cache_key = IntentCache.key(state, user_input)
+        remaining = deadline - perf_counter() if deadline is not None else None
+        degraded = None
+        if remaining is not None and remaining <= 0:
+            degraded = "deadline"
+        elif self.admission is not None and not self.admission.acquire(
+                self.admission.priority_for(state.current_scene,
+                                            state.variables.get('current_step', '')),
+                max_wait=min(remaining, self.admission.max_wait) if remaining is not None else None):
+            degraded = "shed"
+        else:
+            kwargs = {}
+            if deadline is not None:
+                kwargs["timeout"] = deadline - perf_counter() # 只把剩余预算交给 LLM
+            intent_name = self.llm_client.intelligent_intent_recognition(
+                user_input=user_input,
+                available_intents=available_intents,
+                conversation_context=state.history,
+                scene=state.current_scene,
+                **kwargs
+            )
+            if intent_name is not None:
+                logger.info("执行层: LLM 识别意图 '%s'", intent_name)
+                if intent_name != "default":
+                    self.intent_cache.put(cache_key, intent_name)
+                return intent_name, None
+            degraded = "deadline"
+        
+        cached = self.intent_cache.get(cache_key)
+        intent_name = cached if cached in available_intents else "default"
+        logger.info("执行层: 未能调用 LLM (%s)，降级到意图 '%s'", degraded, intent_name)
+        return intent_name, degraded
+    
+    def _record_turn(self, session_id: str, intent_name: str, tier: str,
+                     phases: Dict[str, float], total: float, degraded: Optional[str] = None,
+                     deadline: Optional[float] = None):
+        """
+        记录本轮的阶段耗时与解析层级
+        degraded: 未能调用 LLM 的原因（deadline / shed），deadline: 本轮的时间预算
+        """
+        self.last_turn = {
+            "session_id": session_id,
+            "intent": intent_name,
+            "tier": tier,
+            "phases": phases,
+            "total": total,
+            "degraded": degraded,
+            "shed": degraded == "shed",
+            "deadline": deadline,
+        }
+        if not self.metrics.enabled:
+            return
+        if degraded:
+            self._degraded_counter.inc(degraded)
+        if not phases.get("llm"):
+            # 未调用 LLM 的轮次不计入 llm 阶段分布
+            phases = {k: v for k, v in phases.items() if k != "llm"}
+        self._phase_hist.observe_many(phases)
+        self._turn_hist.observe(total)
+        self._tier_counter.inc(tier)
+        self.metrics.publish(self.last_turn)
+    
+    def _get_available_intents(self, program: Optional[DSLProgram] = None) -> List[str]:
+        program = program or self.program
+        if not program: return ["greeting", "default"]
+        return list(program.available_intents)
+
+    def _execute_dsl_intent(self, state: ConversationState, intent_name: str, user_input: str,
+                            program: Optional[DSLProgram] = None) -> Optional[str]:
+        """执行DSL意图，返回回复（validate 失败或无回复时为 None）"""
+        program = program or self.program
+        if not program: return None
+        execution = self._run_intent(state, intent_name, user_input, program)
+        if execution.status == "missing": return "未找到意图的处理逻辑"
+        return execution.response
 
     # -----------------------------------------------------------------------------------------------------------------------------------------
     # ⚠️ 修正：确保 reply 后继续执行 set/goto，但 validate 失败必须中断
-    def _execute_dsl_intent(self, intent_name: str, user_input: str) -> Optional[str]:
-        """执行DSL意图"""
-        if not self.current_script: return None
-        
-        intent_definition = None
-        for scene in self.current_script.get('scenes', []):
-            intent_definition = next((i for i in scene.get('intents', []) if i.get('name') == intent_name), None)
-            if intent_definition: break
+    def _run_intent(self, state: ConversationState, intent_name: str, user_input: str,
+                    program: DSLProgram) -> "Execution":
+        """
+        执行意图的语句，返回执行结果
+        validate 失败时撤销该意图已做的变量与场景修改，保证被拒绝的意图不留下副作用
+        """
+        intent_definition = program.intents.get(intent_name)
         
-        if not intent_definition: return "未找到意图的处理逻辑"
+        if not intent_definition: return Execution(intent_name, None, "missing")
         
+        variables = state.variables.copy()
+        scene = state.current_scene
         final_response = None
         for statement in intent_definition.get('statements', []):
-            result = self._execute_statement(statement, user_input)
+            result = self._execute_statement(state, statement, user_input)
             
-            # ⚠️ 关键修复 2：如果 validate 返回 False，立即停止该意图的执行，并返回 None（无回复）
+            # ⚠️ 关键修复 2：如果 validate 返回 False，立即停止该意图的执行
             if result is False:
-                logger.warning(f"意图 {intent_name} 执行被 validate 中断，返回 None")
-                return None 
+                logger.warning("意图 %s 执行被 validate 中断", intent_name)
+                state.variables = variables
+                state.current_scene = scene
+                return Execution(intent_name, None, "rejected")
             
             # 如果结果是字符串（reply/ask），记录为最终回复
             if isinstance(result, str):
                 final_response = result
                 # ⚠️ 关键修复 1：不在这里 break，允许后续的 set/goto 语句被执行
         
-        # 返回收集到的回复（如果存在），否则返回 None
-        return final_response
+        return Execution(intent_name, final_response, "ok")
     
     # -----------------------------------------------------------------------------------------------------------------------------------------
     # ⚠️ 修正：确保 validate 失败时返回 False
-    def _execute_statement(self, statement: Dict[str, Any], user_input: str) -> Union[str, bool, None]:
+    def _execute_statement(self, state: ConversationState, statement: Dict[str, Any],
+                           user_input: str) -> Union[str, bool, None]:
         """
         执行单个语句
         Returns:
@@ -182,32 +617,32 @@ class DSLInterpreter:
         
         if stmt_type == 'reply' or stmt_type == 'ask':
             key = 'message' if stmt_type == 'reply' else 'question'
-            return self._replace_variables(statement.get(key, ''))
+            return self._replace_variables(state, statement.get(key, ''))
         
         elif stmt_type == 'goto':
             scene_name = statement.get('scene')
-            if scene_name: self.state.current_scene = scene_name
+            if scene_name: state.current_scene = scene_name
             return None
         
         elif stmt_type == 'set':
             variable = statement.get('variable')
             value = statement.get('value')
             if variable and value is not None:
-                final_value = self._replace_variables(str(value))
+                final_value = self._replace_variables(state, str(value))
                 if final_value == "user_input":
-                    self.state.variables[variable] = user_input
+                    state.variables[variable] = user_input
                 else:
-                    self.state.variables[variable] = final_value
-                logger.info(f"SET {variable} = {self.state.variables[variable]}")
+                    state.variables[variable] = final_value
+                logger.debug("SET %s = %s", variable, state.variables[variable])
             return None
         
         elif stmt_type == 'api_call':
             function = statement.get('function')
             arguments = statement.get('arguments', [])
-            arg_values = [self._replace_variables(str(arg)) for arg in arguments]
+            arg_values = [self._replace_variables(state, str(arg)) for arg in arguments]
             mock_result = f"【模拟数据: {function} 返回正常】"
-            self.state.variables['result'] = mock_result
-            logger.info(f"API CALL {function} -> {mock_result}")
+            state.variables['result'] = mock_result
+            logger.debug("API CALL %s -> %s", function, mock_result)
             return None
         
         elif stmt_type == 'validate':
@@ -216,26 +651,26 @@ class DSLInterpreter:
             if match:
                 var_name = match.group(1)
                 expected_value = match.group(2)
-                current_value = self.state.variables.get(var_name, "")
+                current_value = state.variables.get(var_name, "")
                 
                 if current_value == expected_value:
-                    logger.info(f"Validate pass: {var_name}=='{current_value}'")
+                    logger.debug("Validate pass: %s=='%s'", var_name, current_value)
                     return None 
                 else:
-                    logger.warning(f"Validate FAIL: {var_name} is '{current_value}', expected '{expected_value}'")
+                    logger.warning("Validate FAIL: %s is '%s', expected '%s'", var_name, current_value, expected_value)
                     # ⚠️ 关键修正：返回 False 作为中断信号
                     return False 
             
-            logger.warning(f"跳过无法解析的 validate: {condition}")
+            logger.warning("跳过无法解析的 validate: %s", condition)
             return None
 
         return None
     
-    def _replace_variables(self, text: str) -> str:
+    def _replace_variables(self, state: ConversationState, text: str) -> str:
         if not isinstance(text, str): return text
         def replacer(match):
             var_name = match.group(1).strip()
-            return str(self.state.variables.get(var_name, f"${{{var_name}}}"))
+            return str(state.variables.get(var_name, f"${{{var_name}}}"))
         return re.sub(r'\$\{(\w+)\}', replacer, text)
     
     def _get_default_response(self, intent_name: str) -> str:
@@ -1,9 +1,12 @@
 # llm_client.py
 import json
-from typing import Dict, List, Any, Optional
+import re
+import threading
+from time import perf_counter
+from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass
-from zhipuai import ZhipuAI
 from utils.logger import setup_logger
+from utils.metrics import registry as default_registry
 
 logger = setup_logger(__name__)
 
@@ -14,52 +17,208 @@ class LLMConfig:
     temperature: float = 0.1
     max_tokens: int = 256
     timeout: int = 30
+    stream_intent: bool = False # 流式识别：前缀唯一确定意图后立即关闭流
+
+
+@dataclass
+class CascadeTier:
+    """
+    模型级联中的一层
+    confidence: self_report（模型在答案后自报 0~1 置信度）或 agreement（多次采样结果一致才算可信）
+    最后一层总是直接采纳，其 confidence 设置不生效
+    """
+    model: str
+    confidence: str = "self_report"
+    threshold: float = 0.7 # self_report 的采纳阈值
+    samples: int = 2 # agreement 的采样次数（并发发出）
+    temperature: Optional[float] = None # 默认: agreement 为 0.7（需要采样多样性），否则同 LLMConfig
+
+    @classmethod
+    def from_config(cls, config: Any) -> "CascadeTier":
+        """config 为模型名，或包含 model/confidence/threshold/samples/temperature 的字典"""
+        if isinstance(config, str):
+            return cls(model=config)
+        if config.get('confidence', 'self_report') not in CONFIDENCE_SIGNALS:
+            raise ValueError(f"未知的置信度信号: {config['confidence']}（可选: {', '.join(CONFIDENCE_SIGNALS)}）")
+        return cls(**config)
+
+
+CONFIDENCE_SIGNALS = ("self_report", "agreement")
+
+
+def parse_cascade(config: Optional[Dict[str, Any]]):
+    """
+    解析 config.yaml 中 zhipuai.cascade 段，返回 (默认级联, 场景 -> 级联)
+    未配置时返回 ([], {})，即只使用 zhipuai.model 单模型
+    """
+    if not config:
+        return [], {}
+    tiers = [CascadeTier.from_config(t) for t in config.get('tiers') or []]
+    scenes = {scene: [CascadeTier.from_config(t) for t in scene_tiers]
+              for scene, scene_tiers in (config.get('scenes') or {}).items()}
+    return tiers, scenes
+
+
+# --- 全场景意图描述映射 (强化上下文逻辑) ---
+INTENT_DESCRIPTIONS = {
+    # --- 通用基础 ---
+    "greeting": "用户打招呼，如你好、开始。",
+    "farewell": "用户再见、结束对话。",
+    "main_menu": "用户请求返回主菜单。",
+    "ask_further_help": "用户询问还有什么功能。",
+    "default": "无法识别或与当前业务无关的问题。",
+    
+    # --- 电商业务 (重点修复) ---
+    # 关键：强调“发起”必须是完整的请求，或者在非回答状态下
+    "query_product": "【发起查询】用户主动要求查价格。例：'查价格'、'我想买东西'。❌注意：如果用户只说了一个商品名（如'袜子'）且助手刚才问了'查什么'，绝对不要选这个！",
+    
+    # 关键：强调“回答”的触发条件
+    "provide_product_name": "【回答参数】用户提供商品名称。✅触发条件：助手上一句问了'请问查什么商品'，用户回答'袜子'、'蛋糕'等。",
+    
+    "query_order": "【发起查询】用户查订单状态、查物流。",
+    "provide_order_id": "【回答参数】用户提供订单号。✅触发条件：助手上一句问了'请提供订单号'。",
+    "place_order": "【发起查询】用户想要下单购买。",
+    "provide_buy_product": "【回答参数】用户提供要购买的商品名。",
+
+    # --- 旅行预订 ---
+    "query_flight": "【发起查询】用户查询航班。",
+    "provide_destination": "【回答参数】用户提供目的地（如北京）。✅触发条件：助手问了'飞往哪里'。",
+    "book_hotel": "【发起查询】用户想要预订酒店。",
+    "provide_checkin_date": "【回答参数】用户提供日期。",
+    
+    # --- 客户服务 ---
+    "report_issue": "【发起查询】用户投诉、反馈问题。",
+    "provide_issue_detail": "【回答参数】用户描述问题细节。",
+    "contact_human": "【发起查询】用户要求转人工。",
+    "faq_password": "【发起查询】用户询问密码问题。",
+    
+    # --- 多业务路由 ---
+    "select_ecommerce": "用户选择进入'电商购物'模式。",
+    "select_travel": "用户选择进入'旅行预订'模式。",
+    "select_service": "用户选择进入'客户服务'模式。",
+}
+
+
+# ⚠️ 注意：这里不要放纯名词（如“袜子”），只放强意图词
+RULE_KEYWORDS = {
+    'greeting': ['你好', '您好', '开始'],
+    'farewell': ['再见', '拜拜', '结束'],
+    'main_menu': ['主菜单', '返回菜单', '退出'],
+    
+    'query_product': ['价格', '商品查询', '价钱'],
+    'query_order': ['订单', '物流', '快递'],
+    'place_order': ['下单', '购买'],
+    
+    'query_flight': ['航班', '机票', '飞往'],
+    'book_hotel': ['酒店', '宾馆', '住宿'],
+    
+    'report_issue': ['投诉', '坏了', '故障', '报错'],
+    'contact_human': ['人工', '转人工', '真人'],
+    'faq_password': ['忘记密码', '改密码'],
+    
+    # 路由关键词 (保持短语匹配)
+    'select_ecommerce': ['电商', '购物', '买东西'],
+    'select_travel': ['旅行', '旅游', '订票'],
+    'select_service': ['客服', '客户', '服务'],
+}
+
+
+def match_rule_keywords(user_input: str, available_intents: List[str]) -> Optional[str]:
+    """按 RULE_KEYWORDS 的顺序返回第一个命中关键词的候选意图"""
+    user_input_lower = user_input.lower()
+    for intent_name, keywords in RULE_KEYWORDS.items():
+        if intent_name in available_intents:
+            for keyword in keywords:
+                if keyword in user_input_lower:
+                    return intent_name
+    return None
+
+
+class _DeadlineExceeded(Exception):
+    """流式识别超过调用方给定的时间预算"""
+
+
+class IntentTrie:
+    """
+    候选意图名（及其数字编号）的前缀树
+    流式输出时逐字符匹配，一旦前缀唯一确定某个意图即可提前结束
+    """
+    
+    _WORD_CHARS = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_")
+    _LEADING_NOISE = " \t\r\n'\"`【[「“"
+    
+    def __init__(self, tokens: Dict[str, str]):
+        """tokens: 可被模型输出的词 -> 对应的意图名"""
+        # 节点: [子节点 dict, 终止值, 子树中终止值的集合]
+        self._root: List[Any] = [{}, None, set()]
+        for token, intent in tokens.items():
+            node = self._root
+            node[2].add(intent)
+            for ch in token:
+                node = node[0].setdefault(ch, [{}, None, set()])
+                node[2].add(intent)
+            node[1] = intent
+        self.max_length = max((len(t) for t in tokens), default=0)
+    
+    def match(self, text: str, final: bool = False):
+        """
+        返回 (意图, 是否已确定)
+        - 前缀唯一对应一个意图 -> (意图, True)（只用于流式的中间结果）
+        - 输出已偏离所有候选 -> (None, True)
+        - 仍有歧义 -> (None, False)
+        final=True 时输出已完整，不再按唯一前缀提前确定：只有整段输出恰好是候选词，
+        或候选词后紧跟分隔符时才返回该意图（"g"、"farewell_extra" 都不算命中）
+        """
+        text = text.lstrip(self._LEADING_NOISE)
+        node = self._root
+        for ch in text:
+            child = node[0].get(ch)
+            if child is None:
+                # 候选词已完整且后面跟着分隔符（如 "1." 或 "query_order\n"）
+                if node[1] is not None and ch not in self._WORD_CHARS:
+                    return node[1], True
+                return None, True
+            node = child
+            if not final and len(node[2]) == 1:
+                return next(iter(node[2])), True
+        if final:
+            return node[1], True
+        return None, False
+
 
 class LLMClient:
     """基于智谱AI的LLM客户端，支持多业务场景意图识别"""
     
-    def __init__(self, api_key: str, model: str = "glm-4", temperature: float = 0.1):
-        self.config = LLMConfig(api_key=api_key, model=model, temperature=temperature)
-        self.client = ZhipuAI(api_key=api_key)
+    def __init__(self, api_key: str, model: str = "glm-4", temperature: float = 0.1, metrics=None,
+                 client=None, stream_intent: bool = False, cascade: Optional[List[CascadeTier]] = None,
+                 scene_cascades: Optional[Dict[str, List[CascadeTier]]] = None):
+        """
+        Args:
+            client: 可选，注入兼容 chat.completions.create 接口的客户端（如本地替身服务）
+            stream_intent: 是否使用流式意图识别（只作用于级联的最后一层）
+            cascade: 模型级联（小模型在前），低置信度或无效答案逐层升级；为空时只使用 model
+            scene_cascades: 按场景覆盖级联
+        """
+        self.config = LLMConfig(api_key=api_key, model=model, temperature=temperature,
+                                stream_intent=stream_intent)
+        self.cascade = list(cascade or [])
+        self.scene_cascades = dict(scene_cascades or {})
+        # SDK 客户端在第一次真正调用模型时才创建（见 client 属性），
+        # 完全由规则 / expect 解析的运行不会导入 zhipuai
+        self._client = client
+        self._client_lock = threading.Lock() # 批处理等多线程场景下只创建一个 SDK 客户端
         
-        # --- 全场景意图描述映射 (强化上下文逻辑) ---
-        self.intent_descriptions = {
-            # --- 通用基础 ---
-            "greeting": "用户打招呼，如你好、开始。",
-            "farewell": "用户再见、结束对话。",
-            "main_menu": "用户请求返回主菜单。",
-            "ask_further_help": "用户询问还有什么功能。",
-            "default": "无法识别或与当前业务无关的问题。",
-            
-            # --- 电商业务 (重点修复) ---
-            # 关键：强调“发起”必须是完整的请求，或者在非回答状态下
-            "query_product": "【发起查询】用户主动要求查价格。例：'查价格'、'我想买东西'。❌注意：如果用户只说了一个商品名（如'袜子'）且助手刚才问了'查什么'，绝对不要选这个！",
-            
-            # 关键：强调“回答”的触发条件
-            "provide_product_name": "【回答参数】用户提供商品名称。✅触发条件：助手上一句问了'请问查什么商品'，用户回答'袜子'、'蛋糕'等。",
-            
-            "query_order": "【发起查询】用户查订单状态、查物流。",
-            "provide_order_id": "【回答参数】用户提供订单号。✅触发条件：助手上一句问了'请提供订单号'。",
-            "place_order": "【发起查询】用户想要下单购买。",
-            "provide_buy_product": "【回答参数】用户提供要购买的商品名。",
-
-            # --- 旅行预订 ---
-            "query_flight": "【发起查询】用户查询航班。",
-            "provide_destination": "【回答参数】用户提供目的地（如北京）。✅触发条件：助手问了'飞往哪里'。",
-            "book_hotel": "【发起查询】用户想要预订酒店。",
-            "provide_checkin_date": "【回答参数】用户提供日期。",
-            
-            # --- 客户服务 ---
-            "report_issue": "【发起查询】用户投诉、反馈问题。",
-            "provide_issue_detail": "【回答参数】用户描述问题细节。",
-            "contact_human": "【发起查询】用户要求转人工。",
-            "faq_password": "【发起查询】用户询问密码问题。",
-            
-            # --- 多业务路由 ---
-            "select_ecommerce": "用户选择进入'电商购物'模式。",
-            "select_travel": "用户选择进入'旅行预订'模式。",
-            "select_service": "用户选择进入'客户服务'模式。",
-        }
+        self.metrics = metrics or default_registry
+        self._request_hist = self.metrics.histogram(
+            "llm_request_seconds", "LLM 意图识别请求耗时", ("model",))
+        self._request_counter = self.metrics.counter(
+            "llm_requests_total", "LLM 意图识别请求数 (按结果分类)", ("model", "status"))
+        self._time_to_intent_hist = self.metrics.histogram(
+            "llm_time_to_intent_seconds", "流式识别从发出请求到确定意图的耗时", ("model",))
+        self._cascade_counter = self.metrics.counter(
+            "llm_cascade_total", "级联各层的处理结果 (accepted/low_confidence/invalid/error)", ("model", "outcome"))
+        
+        self.intent_descriptions = dict(INTENT_DESCRIPTIONS)
         
         # 强化 System Prompt，教 LLM 判断“是不是在回答问题”
         self.system_prompt_intent = """你是一个业务意图识别助手。
@@ -78,10 +237,29 @@ class LLMClient:
    - 如果用户输入菜单名（“电商”、“旅行”），选择对应的 `select_...` 意图。
 """
     
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from zhipuai import ZhipuAI
+                    self._client = ZhipuAI(api_key=self.config.api_key)
+        return self._client
+    
     def intelligent_intent_recognition(self, user_input: str, available_intents: List[str], 
-                                      conversation_context: List[Dict[str, str]]) -> str:
+                                      conversation_context: List[Dict[str, str]],
+                                      timeout: Optional[float] = None, scene: Optional[str] = None) -> Optional[str]:
+        """
+        Args:
+            timeout: 本次调用可用的时间（秒，所有级联层共享）；超时返回 None，由调用方降级
+            scene: 当前场景，用于选择按场景覆盖的级联
+        """
         if not available_intents: return "default"
+        if timeout is not None and timeout <= 0: return None
 
+        t_start = perf_counter()
+        tiers = self.scene_cascades.get(scene, self.cascade) if scene is not None else self.cascade
+        model = tiers[-1].model if tiers else self.config.model
         try:
             history_str = "无"
             if conversation_context:
@@ -94,12 +272,13 @@ class LLMClient:
                     history_list.append(f"{role}: {content}")
                 history_str = "\n".join(history_list)
             
-            # 过滤意图
-            all_target_intents = list(set(available_intents + ["default"]))
+            # 过滤意图（排序后编号，模型可返回名称或编号）
+            all_target_intents = sorted(set(available_intents + ["default"]))
+            intent_codes = {str(i): intent for i, intent in enumerate(all_target_intents, 1)}
             intents_desc_list = []
-            for intent in all_target_intents:
+            for code, intent in intent_codes.items():
                 desc = self.intent_descriptions.get(intent, "业务操作")
-                intents_desc_list.append(f"- {intent}: {desc}")
+                intents_desc_list.append(f"- [{code}] {intent}: {desc}")
             
             prompt = f"""
 【对话历史 (注意助手的最后一个问题)】：
@@ -110,62 +289,188 @@ class LLMClient:
 【可用意图列表】：
 {chr(10).join(intents_desc_list)}
 
-【判断】：基于对话历史，用户是在发起新请求还是在回答问题？请返回意图名称。"""
+【判断】：基于对话历史，用户是在发起新请求还是在回答问题？请只返回意图名称（或方括号中的编号）。"""
             
             messages = [
                 {"role": "system", "content": self.system_prompt_intent},
                 {"role": "user", "content": prompt}
             ]
             
-            response = self.client.chat.completions.create(
-                model=self.config.model,
-                messages=messages,
-                temperature=self.config.temperature,
-                max_tokens=self.config.max_tokens
-            )
+            tokens = dict(intent_codes)
+            tokens.update({intent: intent for intent in all_target_intents})
+            trie = IntentTrie(tokens)
+            # 输出上限：最长的候选名加引号即可（每个 token 至少一个字符）
+            max_tokens = min(self.config.max_tokens, trie.max_length + 2)
             
-            if response.choices:
-                intent = response.choices[0].message.content.strip().replace("'", "").replace('"', "")
-                if intent in all_target_intents:
-                    logger.info(f"LLM识别意图: '{user_input[:15]}...' -> '{intent}'")
+            # 级联：前面的（小）模型给出可信答案即采纳，否则升级到下一层
+            for tier in tiers[:-1]:
+                remaining = timeout - (perf_counter() - t_start) if timeout is not None else None
+                if remaining is not None and remaining <= 0:
+                    raise _DeadlineExceeded()
+                intent, outcome = self._ask_tier(tier, messages, trie, all_target_intents, max_tokens, remaining)
+                self._cascade_counter.inc(tier.model, outcome)
+                if outcome == "accepted":
+                    logger.info("LLM识别意图: '%s...' -> '%s' (%s)", user_input[:15], intent, tier.model)
+                    self._request_counter.inc(tier.model, "ok")
                     return intent
+                logger.debug("级联升级: %s 结果 %s (%s)", tier.model, intent, outcome)
+            
+            remaining = timeout - (perf_counter() - t_start) if timeout is not None else None
+            if remaining is not None and remaining <= 0:
+                raise _DeadlineExceeded()
+            intent = self._ask(model, messages, trie, max_tokens, remaining, self.config.temperature,
+                               stream=self.config.stream_intent)
+            
+            if intent in all_target_intents:
+                logger.info("LLM识别意图: '%s...' -> '%s'", user_input[:15], intent)
+                self._request_counter.inc(model, "ok")
+                if tiers:
+                    self._cascade_counter.inc(model, "accepted")
+                return intent
+            self._request_counter.inc(model, "invalid")
+            if tiers:
+                self._cascade_counter.inc(model, "invalid")
             return "default"
                 
+        except _DeadlineExceeded:
+            return self._timed_out(model)
         except Exception as e:
-            logger.error(f"LLM识别异常: {e}")
+            if timeout is not None and perf_counter() - t_start >= timeout:
+                # SDK 的请求超时异常类型各不相同，以耗时判断
+                return self._timed_out(model)
+            logger.error("LLM识别异常: %s", e)
+            self._request_counter.inc(model, "error")
             return "default"
+    
+    def _ask(self, model: str, messages: List[Dict[str, str]], trie: IntentTrie, max_tokens: int,
+             timeout: Optional[float], temperature: float, stream: bool = False) -> Optional[str]:
+        """单次请求，返回按候选前缀树匹配出的意图（无法匹配时为 None）"""
+        t_start = perf_counter()
+        extra = {"timeout": timeout} if timeout is not None else {}
+        if stream:
+            intent = self._stream_intent(messages, trie, max_tokens, t_start, timeout, extra, model)
+        else:
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **extra
+            )
+            intent = None
+            if response.choices:
+                content = response.choices[0].message.content.strip().replace("'", "").replace('"', "")
+                intent, _ = trie.match(content, final=True)
+        self._request_hist.observe(perf_counter() - t_start, model)
+        return intent
+    
+    def _ask_tier(self, tier: CascadeTier, messages: List[Dict[str, str]], trie: IntentTrie,
+                  all_target_intents: List[str], max_tokens: int,
+                  timeout: Optional[float]) -> Tuple[Optional[str], str]:
+        """向级联的非末层请求，返回 (意图, 结果)；结果为 accepted 以外时升级到下一层"""
+        try:
+            if tier.confidence == "agreement":
+                temperature = tier.temperature if tier.temperature is not None else 0.7
+                answers: List[Any] = [None] * max(1, tier.samples)
+                
+                def sample(i: int):
+                    try:
+                        answers[i] = self._ask(tier.model, messages, trie, max_tokens, timeout, temperature)
+                    except Exception as e:
+                        answers[i] = e
+                
+                # 多次采样并发发出，耗时约等于单次请求
+                threads = [threading.Thread(target=sample, args=(i,)) for i in range(1, len(answers))]
+                for thread in threads:
+                    thread.start()
+                sample(0)
+                for thread in threads:
+                    thread.join()
+                errors = [a for a in answers if isinstance(a, Exception)]
+                if errors:
+                    raise errors[0]
+                intent = answers[0]
+                if intent not in all_target_intents:
+                    return intent, "invalid"
+                return intent, "accepted" if all(a == intent for a in answers) else "low_confidence"
+            
+            # self_report：答案后附 "|置信度"
+            report_messages = messages[:-1] + [{
+                "role": "user",
+                "content": messages[-1]["content"] + "\n请按“意图|置信度”的格式返回，置信度为 0~1 的小数，例如：3|0.9",
+            }]
+            temperature = tier.temperature if tier.temperature is not None else self.config.temperature
+            content = self._ask_raw(tier.model, report_messages, max_tokens + 6, timeout, temperature)
+            answer, _, score = content.strip().replace("'", "").replace('"', "").partition("|")
+            intent, _ = trie.match(answer.strip(), final=True)
+            if intent not in all_target_intents:
+                return intent, "invalid"
+            score_match = re.match(r"\s*([01](?:\.\d+)?)", score)
+            if score_match is None:
+                return intent, "invalid"
+            return intent, "accepted" if float(score_match.group(1)) >= tier.threshold else "low_confidence"
+        except _DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.warning("级联模型 %s 请求失败，升级到下一层: %s", tier.model, e)
+            return None, "error"
+    
+    def _ask_raw(self, model: str, messages: List[Dict[str, str]], max_tokens: int,
+                 timeout: Optional[float], temperature: float) -> str:
+        t_start = perf_counter()
+        extra = {"timeout": timeout} if timeout is not None else {}
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **extra
+        )
+        self._request_hist.observe(perf_counter() - t_start, model)
+        return response.choices[0].message.content if response.choices else ""
+    
+    def _timed_out(self, model: str) -> None:
+        logger.warning("LLM识别超时，交由调用方降级")
+        self._request_counter.inc(model, "timeout")
+        return None
+    
+    def _stream_intent(self, messages: List[Dict[str, str]], trie: IntentTrie,
+                       max_tokens: int, t_start: float, timeout: Optional[float] = None,
+                       extra: Optional[Dict[str, Any]] = None, model: Optional[str] = None) -> Optional[str]:
+        """流式消费输出，前缀唯一确定意图后立即关闭流；超过 timeout 时也立即关闭"""
+        model = model or self.config.model
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=self.config.temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **(extra or {})
+        )
+        text = ""
+        intent, done = None, False
+        try:
+            for chunk in stream:
+                if timeout is not None and perf_counter() - t_start > timeout:
+                    raise _DeadlineExceeded()
+                if not chunk.choices:
+                    continue
+                text += chunk.choices[0].delta.content or ""
+                intent, done = trie.match(text)
+                if done:
+                    break
+            if not done:
+                intent, _ = trie.match(text, final=True)
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+        self._time_to_intent_hist.observe(perf_counter() - t_start, model)
+        return intent
 
     def fallback_intent_recognition(self, user_input: str, available_intents: List[str]) -> Optional[str]:
         """规则匹配"""
-        user_input_lower = user_input.lower()
-        
-        # ⚠️ 注意：这里不要放纯名词（如“袜子”），只放强意图词
-        keyword_intent_map = {
-            'greeting': ['你好', '您好', '开始'],
-            'farewell': ['再见', '拜拜', '结束'],
-            'main_menu': ['主菜单', '返回菜单', '退出'],
-            
-            'query_product': ['价格', '商品查询', '价钱'],
-            'query_order': ['订单', '物流', '快递'],
-            'place_order': ['下单', '购买'],
-            
-            'query_flight': ['航班', '机票', '飞往'],
-            'book_hotel': ['酒店', '宾馆', '住宿'],
-            
-            'report_issue': ['投诉', '坏了', '故障', '报错'],
-            'contact_human': ['人工', '转人工', '真人'],
-            'faq_password': ['忘记密码', '改密码'],
-            
-            # 路由关键词 (保持短语匹配)
-            'select_ecommerce': ['电商', '购物', '买东西'],
-            'select_travel': ['旅行', '旅游', '订票'],
-            'select_service': ['客服', '客户', '服务'],
-        }
-        
-        for intent_name, keywords in keyword_intent_map.items():
-            if intent_name in available_intents:
-                for keyword in keywords:
-                    if keyword in user_input_lower:
-                        logger.info(f"规则匹配成功: '{user_input[:15]}...' -> '{intent_name}'")
-                        return intent_name
-        return None
\ No newline at end of file
+        intent_name = match_rule_keywords(user_input, available_intents)
+        if intent_name:
+            logger.info("规则匹配成功: '%s...' -> '%s'", user_input[:15], intent_name)
+        return intent_name
@@ -0,0 +1,276 @@
+# llm_pool.py
+"""
+上游 API 密钥池（多个密钥 / 端点之间的负载均衡）
+- 每个密钥（可带独立的 base_url）持有自己的 SDK 客户端，连接在同一密钥的请求之间复用
+- 对外兼容 client.chat.completions.create 接口，可直接作为 LLMClient 的 client 注入
+- 选择策略：least_outstanding（在途请求数 / 权重最小者）或 weighted_round_robin（平滑加权轮询）
+- 收到 429 时该密钥进入冷却（优先使用上游给出的 Retry-After，连续触发时冷却时间加倍），
+  并把本次请求转给其他可用密钥；其他错误连续达到阈值时同样冷却。冷却期间不参与选择
+"""
+import threading
+from time import monotonic, perf_counter
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.logger import setup_logger
+from utils.metrics import registry as default_registry
+
+logger = setup_logger(__name__)
+
+STRATEGIES = ("least_outstanding", "weighted_round_robin")
+
+
+class NoAvailableKey(Exception):
+    """池中所有密钥都在冷却"""
+
+
+class PoolMember:
+    """池中的一个密钥及其运行状态（状态由 KeyPool 加锁维护）"""
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None, weight: float = 1.0,
+                 name: Optional[str] = None, client=None):
+        """
+        Args:
+            base_url: 可选，该密钥对应的端点（默认使用 SDK 的默认端点）
+            weight: 权重，按上游给该密钥的速率配额设置
+            name: 指标中的标签（默认取密钥末 4 位，不暴露完整密钥）
+            client: 可选，注入兼容 chat.completions.create 接口的客户端（如本地替身服务）
+        """
+        if weight <= 0:
+            raise ValueError(f"密钥权重必须为正数: {weight}")
+        self.api_key = api_key
+        self.base_url = base_url
+        self.weight = float(weight)
+        self.name = name or f"...{api_key[-4:]}"
+        self._client = client
+        self._client_lock = threading.Lock()
+        self.outstanding = 0
+        self.current_weight = 0.0 # 平滑加权轮询的当前值
+        self.cooldown_until = 0.0
+        self.strikes = 0 # 连续冷却次数，决定下一次冷却时长
+        self.consecutive_errors = 0
+
+    @classmethod
+    def from_config(cls, config: Any) -> "PoolMember":
+        """config 为密钥字符串，或包含 api_key/base_url/weight/name 的字典"""
+        if isinstance(config, str):
+            return cls(api_key=config)
+        return cls(**config)
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from zhipuai import ZhipuAI
+                    extra = {"base_url": self.base_url} if self.base_url else {}
+                    self._client = ZhipuAI(api_key=self.api_key, **extra)
+        return self._client
+
+
+class KeyPool:
+    """密钥池，兼容 chat.completions.create 接口"""
+
+    def __init__(self, members: List[PoolMember], strategy: str = "least_outstanding",
+                 cooldown: float = 10.0, max_cooldown: float = 300.0, error_threshold: int = 3,
+                 error_cooldown: Optional[float] = None, metrics=None,
+                 clock: Callable[[], float] = monotonic):
+        """
+        Args:
+            strategy: least_outstanding / weighted_round_robin
+            cooldown: 429 后的冷却秒数（上游给出 Retry-After 时以其为准），连续触发时加倍
+            max_cooldown: 冷却时长上限
+            error_threshold: 连续失败（429 以外的错误）达到该次数后冷却
+            error_cooldown: 错误触发的冷却秒数（默认同 cooldown）
+            clock: 冷却计时使用的时钟（测试中可注入）
+        """
+        if not members:
+            raise ValueError("密钥池至少需要一个密钥")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"未知的负载均衡策略: {strategy}（可选: {', '.join(STRATEGIES)}）")
+        names = [m.name for m in members]
+        if len(set(names)) != len(names):
+            raise ValueError(f"密钥名称重复: {names}")
+        self.members = list(members)
+        self.strategy = strategy
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.error_threshold = max(1, error_threshold)
+        self.error_cooldown = cooldown if error_cooldown is None else error_cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._next = 0 # least_outstanding 平局时的轮转起点
+
+        self.metrics = metrics or default_registry
+        self._request_counter = self.metrics.counter(
+            "llm_key_requests_total", "各密钥的请求数 (outcome: ok/rate_limited/error)", ("key", "outcome"))
+        self._cooldown_counter = self.metrics.counter(
+            "llm_key_cooldowns_total", "各密钥进入冷却的次数 (reason: rate_limited/error)", ("key", "reason"))
+        self._outstanding_gauge = self.metrics.gauge("llm_key_outstanding", "各密钥的在途请求数", ("key",))
+        self._request_hist = self.metrics.histogram("llm_key_request_seconds", "各密钥的请求耗时", ("key",))
+        self._unavailable_counter = self.metrics.counter(
+            "llm_key_pool_unavailable_total", "所有密钥都在冷却、请求无法发出的次数")
+
+        self.chat = _Chat(self)
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]], metrics=None) -> Optional["KeyPool"]:
+        """config.yaml 中的 zhipuai.key_pool 段；未配置 keys 时返回 None（只使用 zhipuai.api_key）"""
+        if not config or not config.get('keys'):
+            return None
+        return cls([PoolMember.from_config(k) for k in config['keys']],
+                   strategy=config.get('strategy', 'least_outstanding'),
+                   cooldown=config.get('cooldown', 10.0), max_cooldown=config.get('max_cooldown', 300.0),
+                   error_threshold=config.get('error_threshold', 3),
+                   error_cooldown=config.get('error_cooldown'), metrics=metrics)
+
+    def create(self, **kwargs):
+        """
+        选择一个密钥发出请求；429 时换用其他未尝试过的可用密钥（请求未被上游处理，重发是安全的），
+        其他错误直接抛出。stream=True 时返回的流在消费完或 close 后才计为完成
+        带 timeout 时各次尝试共享这段时间，换密钥前已用完则抛出 TimeoutError
+        """
+        tried = set()
+        timeout = kwargs.get("timeout")
+        t_start = perf_counter()
+        while True:
+            if timeout is not None:
+                remaining = timeout - (perf_counter() - t_start)
+                if remaining <= 0:
+                    raise TimeoutError(f"密钥池请求超时（{timeout:.3f} 秒内未能发出请求）")
+                kwargs["timeout"] = remaining
+            member = self._acquire(tried)
+            if member is None:
+                self._unavailable_counter.inc()
+                raise NoAvailableKey("密钥池中没有可用的密钥（全部冷却中或已尝试）")
+            tried.add(member.name)
+            t_request = perf_counter()
+            try:
+                response = member.client.chat.completions.create(**kwargs)
+            except Exception as e:
+                retry_after = _rate_limit_retry_after(e)
+                self._release(member, "error" if retry_after is None else "rate_limited", t_request, retry_after)
+                if retry_after is not None:
+                    logger.warning("密钥 %s 被限流，换用其他密钥", member.name)
+                    continue
+                raise
+            if kwargs.get("stream"):
+                return _PooledStream(self, member, response, t_request)
+            self._release(member, "ok", t_request)
+            return response
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        now = self._clock()
+        return {m.name: {"outstanding": m.outstanding, "weight": m.weight,
+                         "cooldown": max(0.0, m.cooldown_until - now),
+                         "requests": int(sum(self._request_counter.get(m.name, o)
+                                             for o in ("ok", "rate_limited", "error")))}
+                for m in self.members}
+
+    # --- 选择与健康状态 ---
+
+    def _acquire(self, exclude) -> Optional[PoolMember]:
+        with self._lock:
+            now = self._clock()
+            # 从上一次选中之后的密钥开始排列：least_outstanding 平局时轮流选择，避免总是压在第一个密钥上
+            n = len(self.members)
+            ordered = [self.members[(self._next + i) % n] for i in range(n)]
+            available = [m for m in ordered if m.name not in exclude and m.cooldown_until <= now]
+            if not available:
+                return None
+            if self.strategy == "weighted_round_robin":
+                # 平滑加权轮询（nginx 算法）：权重 3:1 时选择序列为 a a b a，而不是 a a a b
+                total = sum(m.weight for m in available)
+                for m in available:
+                    m.current_weight += m.weight
+                member = max(available, key=lambda m: m.current_weight)
+                member.current_weight -= total
+            else:
+                member = min(available, key=lambda m: m.outstanding / m.weight)
+                self._next = self.members.index(member) + 1
+            member.outstanding += 1
+            self._outstanding_gauge.set(member.outstanding, member.name)
+            return member
+
+    def _release(self, member: PoolMember, outcome: str, t_request: float, retry_after: Optional[float] = None):
+        with self._lock:
+            member.outstanding -= 1
+            self._outstanding_gauge.set(member.outstanding, member.name)
+            if outcome == "ok":
+                member.consecutive_errors = 0
+                member.strikes = 0
+            elif outcome == "rate_limited":
+                self._cool_down(member, "rate_limited", self.cooldown, retry_after)
+            else:
+                member.consecutive_errors += 1
+                if member.consecutive_errors >= self.error_threshold:
+                    member.consecutive_errors = 0
+                    self._cool_down(member, "error", self.error_cooldown)
+        self._request_counter.inc(member.name, outcome)
+        if self.metrics.enabled:
+            self._request_hist.observe(perf_counter() - t_request, member.name)
+
+    def _cool_down(self, member: PoolMember, reason: str, base: float, retry_after: Optional[float] = None):
+        """调用方持有 self._lock；上游给出 Retry-After 时按其冷却，否则按连续冷却次数指数退避"""
+        duration = min(self.max_cooldown, retry_after or base * (2 ** member.strikes))
+        member.strikes += 1
+        member.cooldown_until = max(member.cooldown_until, self._clock() + duration)
+        self._cooldown_counter.inc(member.name, reason)
+        logger.warning("密钥 %s 冷却 %.1f 秒 (%s)", member.name, duration, reason)
+
+
+class _Chat:
+    def __init__(self, pool: KeyPool):
+        self.completions = _Completions(pool)
+
+
+class _Completions:
+    def __init__(self, pool: KeyPool):
+        self.create = pool.create
+
+
+class _PooledStream:
+    """包装上游的流：消费完、出错或 close 时释放密钥（只释放一次）"""
+
+    def __init__(self, pool: KeyPool, member: PoolMember, stream, t_request: float):
+        self._pool = pool
+        self._member = member
+        self._stream = stream
+        self._t_request = t_request
+        self._released = False
+
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                yield chunk
+        except Exception as e:
+            retry_after = _rate_limit_retry_after(e)
+            self._finish("error" if retry_after is None else "rate_limited", retry_after)
+            raise
+        self._finish("ok")
+
+    def close(self):
+        close = getattr(self._stream, "close", None)
+        if close is not None:
+            close()
+        self._finish("ok")
+
+    def _finish(self, outcome: str, retry_after: Optional[float] = None):
+        if not self._released:
+            self._released = True
+            self._pool._release(self._member, outcome, self._t_request, retry_after)
+
+
+def _rate_limit_retry_after(error: Exception) -> Optional[float]:
+    """
+    错误是 429 时返回建议的冷却秒数（没有 Retry-After 时为 0，表示使用默认冷却），否则返回 None
+    SDK 的异常带有 status_code 或 response.status_code，两种都识别
+    """
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status != 429:
+        return None
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or 0)
+    except (TypeError, ValueError):
+        return 0.0
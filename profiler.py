@@ -0,0 +1,273 @@
+# profiler.py
+"""
+内置的按轮次性能剖析
+- deterministic：cProfile，输出 .pstats（可用 python -m pstats / snakeviz 查看）
+- sampling：后台线程定时采样执行中轮次的调用栈，输出 collapsed stacks（flamegraph.pl / speedscope 可直接读取）
+两种模式都支持“连续剖析 N 轮”或“只保留耗时超过阈值的轮次”；可选用 tracemalloc 统计各会话的内存增长
+（tracemalloc 只有进程级的占用，内存增长只在轮次没有与其他轮次并发时才归到会话）
+关闭时解释器只多一次 None 判断，开启/关闭可在运行中随时切换
+"""
+import cProfile
+import itertools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+MODES = ("deterministic", "sampling")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class TurnProfiler:
+    """剖析会话轮次；由 DSLInterpreter.execute 调用 run_turn"""
+
+    def __init__(self, out_dir: str = "profiles", mode: str = "deterministic", turns: Optional[int] = 100,
+                 slow_threshold: Optional[float] = None, sample_interval: float = 0.005,
+                 trace_memory: bool = False, on_finish: Optional[Callable[["TurnProfiler"], None]] = None):
+        """
+        Args:
+            mode: deterministic（cProfile）或 sampling（栈采样）
+            turns: 剖析的轮次数，达到后自动输出并结束；None 表示直到 stop() 为止
+            slow_threshold: 设置后只为耗时超过该秒数的轮次单独输出剖析文件
+            sample_interval: 采样模式的采样间隔（秒）
+            trace_memory: 是否用 tracemalloc 统计各会话的内存增长
+            on_finish: 剖析结束（输出文件后）的回调，用于从解释器上摘除
+        """
+        if mode not in MODES:
+            raise ValueError(f"未知的剖析模式: {mode}（可选: {', '.join(MODES)}）")
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.mode = mode
+        self.turns = turns
+        self.slow_threshold = slow_threshold
+        self.sample_interval = sample_interval
+        self.trace_memory = trace_memory
+        self.on_finish = on_finish
+        self.files: List[str] = []
+        self.turns_seen = 0
+        self.finished = False
+
+        self._lock = threading.Lock()
+        self._prefix = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self._file_seq = itertools.count(1)
+        # 连续剖析时跨轮次累积；cProfile 同一时刻只能有一个实例处于启用状态
+        self._profile = cProfile.Profile() if mode == "deterministic" and slow_threshold is None else None
+        self._cprofile_busy = threading.Lock()
+        self._stacks: Counter = Counter()
+        # 采样模式：线程 id -> 本轮采到的栈
+        self._active: Dict[int, Counter] = {}
+        self._sampler: Optional[threading.Thread] = None
+        self._stop_sampling = threading.Event()
+        self._session_memory: Counter = Counter()
+        self._turns_running = 0
+        self._turns_started = 0
+        self._unattributed_turns = 0 # 与其他轮次重叠、内存增长无法归属到会话的轮次数
+        self._memory_start = None
+        self._owns_tracemalloc = False
+
+        if trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+                self._owns_tracemalloc = True
+            self._memory_start = tracemalloc.take_snapshot()
+        if mode == "sampling":
+            self._sampler = threading.Thread(target=self._sample_loop, name="turn-profiler", daemon=True)
+            self._sampler.start()
+        logger.info("性能剖析已开启: 模式=%s, 轮次=%s, 慢轮次阈值=%s, 内存=%s",
+                    mode, turns, slow_threshold, trace_memory)
+
+    # --- 轮次钩子 ---
+
+    def run_turn(self, func: Callable[..., str], user_input: str, session_id: str, *args: Any) -> str:
+        """
+        剖析一轮；剖析本身出错（如 cProfile 与其他剖析工具冲突、tracemalloc 或文件写入失败）时
+        记录日志并关闭剖析，本轮照常执行（或返回已完成的结果），不影响对话
+        """
+        if self.finished:
+            return func(user_input, session_id, *args)
+        turn: Dict[str, Any] = {"started": False}
+
+        def run() -> str:
+            turn["started"] = True
+            turn["response"] = func(user_input, session_id, *args)
+            return turn["response"]
+
+        try:
+            return self._profile_turn(run, session_id)
+        except Exception as e:
+            if turn["started"] and "response" not in turn:
+                raise # 轮次本身的异常
+            self._abort(e)
+            return turn["response"] if "response" in turn else func(user_input, session_id, *args)
+
+    def _profile_turn(self, run: Callable[[], str], session_id: str) -> str:
+        memory = self._memory_begin() if self.trace_memory else None
+        try:
+            response, profiled = self._run_profiled(run, session_id)
+        finally:
+            if memory is not None:
+                self._memory_end(memory, session_id)
+        if profiled:
+            self._count_turn()
+        return response
+
+    def _run_profiled(self, run: Callable[[], str], session_id: str):
+        """返回 (回复, 本轮是否被剖析)"""
+        t_start = perf_counter()
+        if self.mode == "sampling":
+            ident = threading.get_ident()
+            stacks: Counter = Counter()
+            self._active[ident] = stacks
+            try:
+                response = run()
+            finally:
+                del self._active[ident]
+            self._finish_turn_sampling(stacks, session_id, perf_counter() - t_start)
+            return response, True
+
+        # 并发执行的其他轮次不做剖析（cProfile 不支持多个实例同时启用）
+        if not self._cprofile_busy.acquire(blocking=False):
+            return run(), False
+        profile = self._profile or cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                response = run()
+            finally:
+                profile.disable()
+        finally:
+            self._cprofile_busy.release()
+        elapsed = perf_counter() - t_start
+        if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+            self._dump_pstats(profile, f"slow-{session_id}-{int(elapsed * 1000)}ms")
+        return response, True
+
+    def _memory_begin(self):
+        """返回 (本轮开始序号, 是否为唯一在执行的轮次, 开始时的 tracemalloc 占用)"""
+        with self._lock:
+            self._turns_running += 1
+            self._turns_started += 1
+            return self._turns_started, self._turns_running == 1, tracemalloc.get_traced_memory()[0]
+
+    def _memory_end(self, memory, session_id: str):
+        """
+        tracemalloc 的占用是进程级的：只有本轮执行期间没有其他轮次在跑时，差值才归到该会话，
+        与其他轮次重叠的轮次只计入 unattributed
+        """
+        started, solo, before = memory
+        with self._lock:
+            self._turns_running -= 1
+            if solo and self._turns_started == started:
+                self._session_memory[session_id] += tracemalloc.get_traced_memory()[0] - before
+            else:
+                self._unattributed_turns += 1
+
+    def _abort(self, error: Exception):
+        """剖析出错：关闭剖析并从解释器上摘除，已经写出的文件保留"""
+        logger.error("性能剖析出错，已关闭剖析: %s", error, exc_info=True)
+        with self._lock:
+            self.finished = True
+        self._stop_sampling.set()
+        if self._owns_tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
+        if self.on_finish is not None:
+            self.on_finish(self)
+
+    def _finish_turn_sampling(self, stacks: Counter, session_id: str, elapsed: float):
+        if self.slow_threshold is None:
+            with self._lock:
+                self._stacks.update(stacks)
+        elif elapsed >= self.slow_threshold and stacks:
+            self._write_collapsed(stacks, f"slow-{session_id}-{int(elapsed * 1000)}ms")
+
+    def _count_turn(self):
+        with self._lock:
+            self.turns_seen += 1
+            done = self.turns is not None and self.turns_seen >= self.turns
+        if done:
+            self.stop()
+
+    def _sample_loop(self):
+        while not self._stop_sampling.wait(self.sample_interval):
+            if not self._active:
+                continue
+            frames = sys._current_frames()
+            for ident, stacks in list(self._active.items()):
+                frame = frames.get(ident)
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                if labels:
+                    stacks[";".join(reversed(labels))] += 1
+
+    # --- 输出 ---
+
+    def _path(self, name: str, suffix: str) -> Path:
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+        return self.out_dir / f"{self._prefix}-{next(self._file_seq):04d}-{safe}{suffix}"
+
+    def _dump_pstats(self, profile: cProfile.Profile, name: str):
+        path = self._path(name, ".pstats")
+        profile.dump_stats(str(path))
+        self.files.append(str(path))
+
+    def _write_collapsed(self, stacks: Counter, name: str):
+        path = self._path(name, ".collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self.files.append(str(path))
+
+    def _write_memory_report(self):
+        snapshot = tracemalloc.take_snapshot()
+        snapshot_path = self._path("memory", ".tracemalloc")
+        snapshot.dump(str(snapshot_path))
+        report_path = snapshot_path.with_suffix(".txt")
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write("# 各会话在剖析期间的内存增长（字节，按 tracemalloc 当前占用差值累计）\n")
+            f.write("# tracemalloc 统计的是整个进程：与其他轮次并发执行的轮次不计入任何会话\n")
+            for session_id, growth in self._session_memory.most_common():
+                f.write(f"{session_id}\t{growth}\n")
+            f.write(f"# 未归属的并发轮次: {self._unattributed_turns}\n")
+            f.write("\n# 分配增长最多的代码位置\n")
+            for stat in snapshot.compare_to(self._memory_start, "lineno")[:30]:
+                f.write(f"{stat}\n")
+        self.files.extend([str(snapshot_path), str(report_path)])
+
+    def stop(self) -> List[str]:
+        """结束剖析并输出汇总文件，返回本次生成的全部文件路径"""
+        with self._lock:
+            if self.finished:
+                return self.files
+            self.finished = True
+        if self._sampler is not None:
+            self._stop_sampling.set()
+            self._sampler.join()
+        if self._profile is not None:
+            with self._cprofile_busy: # 等待正在剖析的轮次结束
+                self._dump_pstats(self._profile, f"turns{self.turns_seen}")
+        if self.mode == "sampling" and self.slow_threshold is None and self._stacks:
+            self._write_collapsed(self._stacks, f"turns{self.turns_seen}")
+        if self.trace_memory:
+            self._write_memory_report()
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+        logger.info("性能剖析结束: %s 轮，输出 %s", self.turns_seen, self.files)
+        if self.on_finish is not None:
+            self.on_finish(self)
+        return self.files
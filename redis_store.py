@@ -0,0 +1,400 @@
+# redis_store.py
+"""
+基于 Redis 协议（RESP2）的会话存储后端，供多个 agent 实例共享会话
+- 纯标准库实现的连接池与流水线，无需安装 redis-py
+- 会话过期交给服务端 TTL（每次访问刷新），不再在进程内扫描
+- 可选本地近端缓存：命中时只校验版本号，版本一致则免去读取会话数据
+每个会话对应两个键: {prefix}{session_id}（序列化数据）与 {prefix}{session_id}:v（版本号）
+"""
+import queue
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import session_codec
+from state_manager import SessionState, SessionStateManager, VersionConflict
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class RedisError(Exception):
+    """服务端返回的错误回复"""
+
+
+class RespConnection:
+    """单个 RESP 连接；pipeline() 一次发送多条命令后依次读取回复"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0,
+                 password: Optional[str] = None, timeout: float = 5.0):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self.sock.makefile('rb')
+        if password:
+            self.execute("AUTH", password)
+        if db:
+            self.execute("SELECT", db)
+
+    @staticmethod
+    def _encode(args: Sequence[Any]) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if isinstance(arg, bytes):
+                data = arg
+            else:
+                data = str(arg).encode('utf-8')
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    def _read_reply(self) -> Any:
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis 连接已关闭")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode('utf-8')
+        if kind == b"-":
+            return RedisError(rest.decode('utf-8'))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"无法解析的 RESP 回复: {line[:20]!r}")
+
+    def pipeline(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        """一次往返执行多条命令；错误回复以 RedisError 对象的形式出现在结果中"""
+        self.sock.sendall(b"".join(self._encode(cmd) for cmd in commands))
+        return [self._read_reply() for _ in commands]
+
+    def execute(self, *args: Any) -> Any:
+        reply = self.pipeline([args])[0]
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    def close(self):
+        try:
+            self._reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class ConnectionPool:
+    """线程安全的有界连接池；连接出错时丢弃而不是放回"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0,
+                 password: Optional[str] = None, max_connections: int = 16, timeout: float = 5.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[RespConnection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    @contextmanager
+    def connection(self) -> Iterator[RespConnection]:
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("等待 Redis 连接超时")
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = RespConnection(self.host, self.port, self.db, self.password, self.timeout)
+            try:
+                yield conn
+            except BaseException:
+                # 出错（包括 RedisError、超时与中断）后连接上可能残留未读完的回复，不能放回池中复用
+                conn.close()
+                raise
+            self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def pipeline(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        with self.connection() as conn:
+            return conn.pipeline(commands)
+
+    def execute(self, *args: Any) -> Any:
+        with self.connection() as conn:
+            return conn.execute(*args)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def _check(replies: List[Any]) -> List[Any]:
+    for reply in replies:
+        if isinstance(reply, RedisError):
+            raise reply
+    return replies
+
+
+class RedisSessionStateManager(SessionStateManager):
+    """
+    Redis 会话存储后端，对外接口与 SessionStateManager 相同
+    self.sessions 只作为本地近端缓存（可用 max_sessions 限制大小），权威数据在服务端
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0,
+                 password: Optional[str] = None, session_timeout: int = 3600,
+                 key_prefix: str = "dsl:session:", max_connections: int = 16,
+                 near_cache: bool = True, pool: Optional[ConnectionPool] = None, metrics=None,
+                 codec: str = "json", compress_threshold: Optional[int] = None,
+                 max_sessions: Optional[int] = 10000):
+        """
+        Args:
+            key_prefix: 会话键前缀，多个部署共享同一 Redis 时用于隔离
+            near_cache: 是否启用本地近端缓存（每次访问仍会校验版本号）
+            pool: 可选，共享已有的连接池
+            max_sessions: 近端缓存的会话数上限
+        """
+        super().__init__(session_timeout=session_timeout, metrics=metrics, ephemeral=True,
+                         codec=codec, compress_threshold=compress_threshold,
+                         max_sessions=max_sessions)
+        self.pool = pool or ConnectionPool(host, port, db, password, max_connections)
+        self.key_prefix = key_prefix
+        self.near_cache = near_cache
+        self._versions: Dict[str, int] = {}
+        self._near_cache_counter = self.metrics.counter(
+            "session_near_cache_total", "近端缓存版本校验结果", ("result",))
+
+    def _keys(self, session_id: str) -> Tuple[str, str]:
+        key = self.key_prefix + session_id
+        return key, key + ":v"
+
+    # --- 覆盖基类的存储钩子 ---
+
+    def _cleanup_expired_sessions(self):
+        """过期由服务端 TTL 负责"""
+
+    def _persist_session(self, session_id: str, atomic: bool = False,
+                         compress_threshold: Optional[int] = None):
+        """基类 create_session 的写入钩子，调用方持有 self._lock"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return
+        t_start = time.perf_counter()
+        version, size = self._write(session, compress_threshold)
+        self._versions[session_id] = version
+        self._track_size(session_id, size)
+        if self.metrics.enabled:
+            self._persist_hist.observe(time.perf_counter() - t_start)
+        logger.debug("持久化会话到 Redis: %s", session_id)
+
+    def _write(self, session: SessionState, compress_threshold: Optional[int] = None) -> Tuple[int, int]:
+        """无条件写入服务端，返回 (新版本号, 序列化字节数)；不访问本地缓存，可在锁外调用"""
+        if compress_threshold is None:
+            compress_threshold = self.compress_threshold
+        payload = session_codec.encode(self._persist_data(session), self.codec, compress_threshold)
+        key, version_key = self._keys(session.session_id)
+        # MULTI/EXEC 保证数据与版本号原子更新，整个事务只需一次往返
+        replies = _check(self.pool.pipeline([
+            ("MULTI",),
+            ("SET", key, payload, "EX", self.session_timeout),
+            ("INCR", version_key),
+            ("EXPIRE", version_key, self.session_timeout),
+            ("EXEC",),
+        ]))
+        return replies[-1][1], len(payload)
+
+    def _load(self, session_id: str) -> Optional[Tuple[SessionState, int, int]]:
+        """从服务端读取会话，返回 (会话, 版本号, 字节数)；不存在或无法解析时返回 None"""
+        key, version_key = self._keys(session_id)
+        raw, version = _check(self.pool.pipeline([("MGET", key, version_key)]))[0]
+        if raw is None:
+            return None
+        try:
+            session = SessionState(**session_codec.decode(raw))
+        except Exception as e:
+            logger.warning("解析 Redis 会话失败 %s: %s", session_id, e)
+            return None
+        return session, int(version or 0), len(raw)
+
+    def _install(self, session: SessionState, version: int, size: int):
+        """放入近端缓存，调用方持有 self._lock"""
+        session_id = session.session_id
+        self._drop_resident(session_id)
+        self.sessions[session_id] = session
+        self._versions[session_id] = version
+        self._track_size(session_id, size)
+        self._sessions_gauge.set(len(self.sessions))
+        self._enforce_capacity(session_id)
+
+    def _fault_in(self, session_id: str) -> bool:
+        return self._reload(session_id)[0] is not None
+
+    def _reload(self, session_id: str) -> Tuple[Optional[SessionState], int]:
+        """锁外读取服务端数据，锁内替换本地副本；返回 (会话, 版本号)"""
+        loaded = self._load(session_id)
+        with self._lock:
+            if loaded is None:
+                self._drop_resident(session_id)
+                self._versions.pop(session_id, None)
+                return None, 0
+            session, version, size = loaded
+            self._install(session, version, size)
+            self._faults.inc()
+            return session, version
+
+    def _evict(self, session_id: str):
+        """近端缓存淘汰：服务端已有最新数据，直接丢弃（调用方持有 self._lock）"""
+        self._drop_resident(session_id)
+        self._versions.pop(session_id, None)
+        self._evictions.inc()
+
+    def _refresh(self, session_id: str) -> Tuple[Optional[SessionState], int]:
+        """保证本地副本与服务端一致，同时刷新 TTL；返回 (会话, 版本号)，会话不存在时为 (None, 0)"""
+        with self._lock:
+            cached = self.sessions.get(session_id) if self.near_cache else None
+            cached_version = self._versions.get(session_id)
+        if cached is None:
+            return self._reload(session_id)
+        key, version_key = self._keys(session_id)
+        version, alive, _ = _check(self.pool.pipeline([
+            ("GET", version_key),
+            ("EXPIRE", key, self.session_timeout),
+            ("EXPIRE", version_key, self.session_timeout),
+        ]))
+        if alive and version is not None and int(version) == cached_version:
+            self._near_cache_counter.inc("hit")
+            return cached, cached_version
+        self._near_cache_counter.inc("miss")
+        return self._reload(session_id)
+
+    def _iter_payloads(self, batch_size: int) -> Iterator[Tuple[str, bytes]]:
+        """导出：SCAN 遍历服务端的会话键，按批 MGET"""
+        yield from self._iter_resident_payloads()
+        cursor = b"0"
+        while True:
+            cursor, keys = self.pool.execute("SCAN", cursor, "MATCH", self.key_prefix + "*", "COUNT", batch_size)
+            session_ids = [key[len(self.key_prefix):].decode('utf-8') for key in keys if not key.endswith(b":v")]
+            session_ids = [sid for sid in session_ids if sid not in self.sessions]
+            if session_ids:
+                payloads = self.pool.execute("MGET", *(self._keys(sid)[0] for sid in session_ids))
+                for session_id, payload in zip(session_ids, payloads):
+                    if payload is not None:
+                        yield session_id, payload
+            if cursor in (b"0", 0):
+                return
+
+    def _store_payloads(self, records: List[Tuple[str, bytes]]) -> List[Tuple[str, int, Optional[SessionState]]]:
+        """导入：每块一次管道写入，版本号递增使其他节点的近端缓存失效"""
+        commands: List[Sequence[Any]] = []
+        for session_id, payload in records:
+            key, version_key = self._keys(session_id)
+            commands += [("SET", key, payload, "EX", self.session_timeout),
+                         ("INCR", version_key),
+                         ("EXPIRE", version_key, self.session_timeout)]
+        _check(self.pool.pipeline(commands))
+        return [(session_id, len(payload), None) for session_id, payload in records]
+
+    def _apply_imported(self, results: List[Tuple[str, int, Optional[SessionState]]]) -> int:
+        with self._lock:
+            for session_id, _, _ in results:
+                self._versions.pop(session_id, None)
+            return super()._apply_imported(results)
+
+    # --- 公共接口 ---
+
+    def get_state(self, session_id: str, with_version: bool = False):
+        # 网络往返都在锁外进行，锁只保护近端缓存，避免多线程共享实例时互相阻塞
+        session, version = self._refresh(session_id)
+        if session is None:
+            # 刚确认过服务端不存在，不必再走 create_session 的存在性检查
+            session = SessionState(session_id=session_id)
+            version, size = self._write(session)
+            with self._lock:
+                self._install(session, version, size)
+            logger.info("创建新会话: %s", session_id)
+        with self._lock:
+            session.last_activity = time.time()
+            if self.sessions.get(session_id) is session:
+                self.sessions.move_to_end(session_id)
+            state = session.state_data.copy()
+        # 版本号即服务端的版本计数器
+        return (state, version) if with_version else state
+
+    def update_state(self, session_id: str, new_state: Dict[str, Any],
+                     expected_version: Optional[int] = None) -> int:
+        # 写入无需先读取：本地没有副本时直接以新状态覆盖服务端
+        with self._lock:
+            previous = self.sessions.get(session_id)
+            now = time.time()
+            session = SessionState(session_id=session_id, state_data=new_state.copy(),
+                                   created_at=previous.created_at if previous else now,
+                                   updated_at=now, last_activity=now)
+        t_start = time.perf_counter()
+        if expected_version is None:
+            version, size = self._write(session)
+        else:
+            version, size = self._compare_and_set(session, expected_version)
+        with self._lock:
+            if self.near_cache:
+                self._install(session, version, size)
+            else:
+                self._drop_resident(session_id)
+                self._versions.pop(session_id, None)
+                self._track_size(session_id, size)
+        if self.metrics.enabled:
+            self._persist_hist.observe(time.perf_counter() - t_start)
+        return version
+
+    def _compare_and_set(self, session: SessionState, expected_version: int) -> Tuple[int, int]:
+        """WATCH 版本键后比较，MULTI/EXEC 写入；期间版本键被其他客户端修改时 EXEC 放弃，抛出 VersionConflict"""
+        session_id = session.session_id
+        payload = session_codec.encode(self._persist_data(session), self.codec, self.compress_threshold)
+        key, version_key = self._keys(session_id)
+        with self.pool.connection() as conn:
+            current = _check(conn.pipeline([("WATCH", version_key), ("GET", version_key)]))[1]
+            current = int(current or 0)
+            if current == expected_version:
+                committed = _check(conn.pipeline([
+                    ("MULTI",),
+                    ("SET", key, payload, "EX", self.session_timeout),
+                    ("INCR", version_key),
+                    ("EXPIRE", version_key, self.session_timeout),
+                    ("EXEC",),
+                ]))[-1]
+            else:
+                conn.execute("UNWATCH")
+                committed = None
+        if committed is None:
+            # 本地副本已过期，下次访问时重新读取
+            with self._lock:
+                self._drop_resident(session_id)
+                self._versions.pop(session_id, None)
+            self._conflicts.inc()
+            raise VersionConflict(session_id, expected_version,
+                                  current if current != expected_version else None)
+        return committed[1], len(payload)
+
+    def clear_session(self, session_id: str):
+        self.update_state(session_id, {})
+        logger.info("已清空会话数据: %s", session_id)
+
+    def delete_session(self, session_id: str):
+        with self._lock:
+            self._drop_resident(session_id)
+            self._track_size(session_id, 0)
+            self._versions.pop(session_id, None)
+        _check(self.pool.pipeline([("DEL", *self._keys(session_id))]))
+
+    def close(self):
+        self.pool.close()
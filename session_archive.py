@@ -0,0 +1,128 @@
+# session_archive.py
+"""
+会话存储的流式归档格式（迁移主机、备份、为新节点灌入会话）
+
+    文件头  "DSLA" | 版本(1)
+    数据块  "CHNK" | 记录数(I) | 压缩后长度(I) | CRC32(I) | zlib(记录 ...)
+    结尾    "DEND" | 会话总数(Q) | 数据块数(I)
+    记录    会话 id 长度(H) | 会话 id (UTF-8) | 负载长度(I) | 负载
+
+负载是 session_codec 编码后的会话内容（与会话文件逐字节相同），导出导入时原样搬运，不做解码
+读写都按块进行，内存占用只与块大小有关；每块带 CRC32，结尾记录总数，截断或损坏的归档在导入时报错
+（导入默认先用 verify_archive 完整校验一遍，通过后才写入）
+"""
+import struct
+import zlib
+from typing import BinaryIO, Iterator, List, Tuple
+
+MAGIC = b"DSLA"
+VERSION = 1
+_FILE_HEADER = struct.Struct("!4sB")
+_CHUNK_HEADER = struct.Struct("!4sIII")
+_TRAILER = struct.Struct("!4sQI")
+_CHUNK_MAGIC = b"CHNK"
+_END_MAGIC = b"DEND"
+_ID_LEN = struct.Struct("!H")
+_PAYLOAD_LEN = struct.Struct("!I")
+
+# (块序号, 记录数, 压缩后的数据, CRC32)
+RawChunk = Tuple[int, int, bytes, int]
+
+
+class ArchiveWriter:
+    """逐条追加会话，攒满 chunk_size 条后压缩写出一块"""
+
+    def __init__(self, fileobj: BinaryIO, chunk_size: int = 1000, level: int = 1):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.level = level
+        self.count = 0
+        self.chunks = 0
+        self._buffer: List[bytes] = []
+        self._pending = 0
+        fileobj.write(_FILE_HEADER.pack(MAGIC, VERSION))
+
+    def add(self, session_id: str, payload: bytes):
+        key = session_id.encode('utf-8')
+        self._buffer += [_ID_LEN.pack(len(key)), key, _PAYLOAD_LEN.pack(len(payload)), payload]
+        self._pending += 1
+        if self._pending >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        compressed = zlib.compress(b"".join(self._buffer), self.level)
+        self.fileobj.write(_CHUNK_HEADER.pack(_CHUNK_MAGIC, self._pending, len(compressed), zlib.crc32(compressed)))
+        self.fileobj.write(compressed)
+        self.count += self._pending
+        self.chunks += 1
+        self._buffer = []
+        self._pending = 0
+
+    def close(self) -> int:
+        """写出剩余记录与结尾，返回会话总数"""
+        self._flush()
+        self.fileobj.write(_TRAILER.pack(_END_MAGIC, self.count, self.chunks))
+        return self.count
+
+
+def read_chunks(fileobj: BinaryIO) -> Iterator[RawChunk]:
+    """逐块读取（不解压），结构错误或文件被截断时抛出 ValueError"""
+    magic, version = _FILE_HEADER.unpack(_read_exact(fileobj, _FILE_HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("不是会话归档文件")
+    if version > VERSION:
+        raise ValueError(f"归档版本 {version} 高于当前支持的 {VERSION}")
+    count = 0
+    index = 0
+    while True:
+        tag = _read_exact(fileobj, 4)
+        if tag == _END_MAGIC:
+            total, chunks = struct.unpack("!QI", _read_exact(fileobj, _TRAILER.size - 4))
+            if (total, chunks) != (count, index):
+                raise ValueError(f"归档结尾记录 {total} 个会话/{chunks} 块，实际读到 {count}/{index}")
+            return
+        if tag != _CHUNK_MAGIC:
+            raise ValueError(f"归档第 {index} 块格式错误")
+        records, length, crc = struct.unpack("!III", _read_exact(fileobj, _CHUNK_HEADER.size - 4))
+        yield index, records, _read_exact(fileobj, length), crc
+        count += records
+        index += 1
+
+
+def decode_chunk(chunk: RawChunk) -> List[Tuple[str, bytes]]:
+    """校验并解压一块，返回 [(会话 id, 负载)]；可在多个线程中并行调用"""
+    index, records, compressed, crc = chunk
+    if zlib.crc32(compressed) != crc:
+        raise ValueError(f"归档第 {index} 块校验失败")
+    data = memoryview(zlib.decompress(compressed))
+    result = []
+    offset = 0
+    for _ in range(records):
+        (key_len,) = _ID_LEN.unpack_from(data, offset)
+        offset += _ID_LEN.size
+        session_id = bytes(data[offset:offset + key_len]).decode('utf-8')
+        offset += key_len
+        (payload_len,) = _PAYLOAD_LEN.unpack_from(data, offset)
+        offset += _PAYLOAD_LEN.size
+        result.append((session_id, bytes(data[offset:offset + payload_len])))
+        offset += payload_len
+    if offset != len(data):
+        raise ValueError(f"归档第 {index} 块记录数不符")
+    return result
+
+
+def verify_archive(fileobj: BinaryIO) -> int:
+    """完整校验归档（结构、每块 CRC 与记录数、结尾计数），不保留数据，返回会话总数；出错时抛出 ValueError"""
+    count = 0
+    for chunk in read_chunks(fileobj):
+        count += len(decode_chunk(chunk))
+    return count
+
+
+def _read_exact(fileobj: BinaryIO, size: int) -> bytes:
+    data = fileobj.read(size)
+    if len(data) != size:
+        raise ValueError("归档文件不完整（被截断）")
+    return data
@@ -0,0 +1,169 @@
+# session_codec.py
+"""
+会话状态序列化编解码层
+
+新格式文件结构: MAGIC(4) | schema 版本(1) | 编解码器 id(1) | 标志位(1) | 负载
+- 标志位 bit0 表示负载经过 zlib 压缩
+- 不带 MAGIC 的文件视为旧版缩进 JSON（schema 版本 0），读取时自动识别
+"""
+import json
+import marshal
+import struct
+import sys
+import zlib
+from typing import Any, Callable, Dict, Optional, Tuple
+
+MAGIC = b"DSLS"
+SCHEMA_VERSION = 1
+_HEADER = struct.Struct("!4sBBB")
+_FLAG_ZLIB = 0x01
+
+try:
+    import msgpack
+except ImportError: # msgpack 为可选依赖
+    msgpack = None
+
+
+class SessionCodec:
+    """编解码器基类"""
+    codec_id = 0
+    name = ""
+
+    def dumps(self, data: Dict[str, Any]) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, payload: bytes) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class PrettyJSONCodec(SessionCodec):
+    """旧版格式：缩进 JSON，无文件头"""
+    codec_id = 0
+    name = "json-pretty"
+
+    def dumps(self, data: Dict[str, Any]) -> bytes:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+    def loads(self, payload: bytes) -> Dict[str, Any]:
+        return json.loads(payload.decode('utf-8'))
+
+
+class CompactJSONCodec(SessionCodec):
+    """紧凑 JSON：无缩进、无多余空格"""
+    codec_id = 1
+    name = "json"
+
+    def dumps(self, data: Dict[str, Any]) -> bytes:
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, payload: bytes) -> Dict[str, Any]:
+        return json.loads(payload.decode('utf-8'))
+
+
+class MsgpackCodec(SessionCodec):
+    """msgpack 二进制格式（需要安装 msgpack）"""
+    codec_id = 2
+    name = "msgpack"
+
+    def dumps(self, data: Dict[str, Any]) -> bytes:
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loads(self, payload: bytes) -> Dict[str, Any]:
+        return msgpack.unpackb(payload, raw=False)
+
+
+class MarshalCodec(SessionCodec):
+    """
+    标准库 marshal 二进制格式（无额外依赖，编解码最快）
+    marshal 格式只保证同一 Python 版本系列内兼容，且不防御被篡改的数据：负载前记录写入时的
+    Python 主次版本号，版本不一致时拒绝解码（换用 json 重新导出），只适合本机可信的会话目录
+    """
+    codec_id = 3
+    name = "marshal"
+    _VERSION = struct.Struct("!BB")
+
+    def dumps(self, data: Dict[str, Any]) -> bytes:
+        return self._VERSION.pack(*sys.version_info[:2]) + marshal.dumps(data)
+
+    def loads(self, payload: bytes) -> Dict[str, Any]:
+        if len(payload) < self._VERSION.size:
+            raise ValueError("marshal 会话数据不完整")
+        written = self._VERSION.unpack_from(payload)
+        if written != tuple(sys.version_info[:2]):
+            raise ValueError(f"会话数据由 Python {written[0]}.{written[1]} 的 marshal 编码，"
+                             f"当前为 {sys.version_info[0]}.{sys.version_info[1]}，无法读取"
+                             "（请用原版本的 Python 以 json 编解码器重新导出）")
+        try:
+            data = marshal.loads(payload[self._VERSION.size:])
+        except (EOFError, TypeError, ValueError) as e:
+            raise ValueError(f"marshal 会话数据损坏: {e}") from None
+        if not isinstance(data, dict):
+            raise ValueError("marshal 会话数据损坏: 顶层不是字典")
+        return data
+
+
+CODECS: Dict[str, SessionCodec] = {
+    c.name: c for c in (PrettyJSONCodec(), CompactJSONCodec(), MsgpackCodec(), MarshalCodec())
+}
+_CODECS_BY_ID: Dict[int, SessionCodec] = {c.codec_id: c for c in CODECS.values()}
+
+# schema 迁移：版本 v -> v+1 的转换函数
+MIGRATIONS: Dict[int, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    0: lambda data: data, # 旧版缩进 JSON 与 v1 字段相同
+}
+
+
+def get_codec(name: str) -> SessionCodec:
+    if name not in CODECS:
+        raise ValueError(f"未知的会话编解码器: {name}（可选: {', '.join(CODECS)}）")
+    if name == "msgpack" and msgpack is None:
+        raise ValueError("使用 msgpack 编解码器需要先安装 msgpack: pip install msgpack")
+    return CODECS[name]
+
+
+def migrate(data: Dict[str, Any], version: int) -> Dict[str, Any]:
+    """把旧 schema 版本的数据逐级迁移到当前版本"""
+    while version < SCHEMA_VERSION:
+        data = MIGRATIONS[version](data)
+        version += 1
+    return data
+
+
+def encode(data: Dict[str, Any], codec: SessionCodec, compress_threshold: Optional[int] = None) -> bytes:
+    """编码会话数据；负载超过 compress_threshold 字节时使用 zlib 压缩"""
+    payload = codec.dumps(data)
+    if codec.codec_id == PrettyJSONCodec.codec_id:
+        return payload # 旧版格式不带文件头
+    flags = 0
+    if compress_threshold is not None and len(payload) > compress_threshold:
+        payload = zlib.compress(payload, 1)
+        flags |= _FLAG_ZLIB
+    return _HEADER.pack(MAGIC, SCHEMA_VERSION, codec.codec_id, flags) + payload
+
+
+def is_compressed(raw: bytes) -> bool:
+    """编码后的负载是否经过 zlib 压缩；旧版格式不压缩"""
+    if len(raw) < _HEADER.size or not raw.startswith(MAGIC):
+        return False
+    return bool(_HEADER.unpack_from(raw)[3] & _FLAG_ZLIB)
+
+
+def decode(raw: bytes) -> Dict[str, Any]:
+    """解码会话数据，自动识别编解码器、压缩与 schema 版本"""
+    data, version = _decode_raw(raw)
+    return migrate(data, version)
+
+
+def _decode_raw(raw: bytes) -> Tuple[Dict[str, Any], int]:
+    if not raw.startswith(MAGIC):
+        return PrettyJSONCodec().loads(raw), 0
+    _, version, codec_id, flags = _HEADER.unpack_from(raw)
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"会话文件 schema 版本 {version} 高于当前支持的 {SCHEMA_VERSION}")
+    codec = _CODECS_BY_ID.get(codec_id)
+    if codec is None:
+        raise ValueError(f"未知的编解码器 id: {codec_id}")
+    payload = raw[_HEADER.size:]
+    if flags & _FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    return codec.loads(payload), version
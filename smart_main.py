@@ -5,85 +5,278 @@
 支持真正的自然语言理解和多轮对话
 """
 
-import argparse
 import sys
+import time
 from pathlib import Path
+from typing import Any, Dict, List, Optional
 
 # 添加项目根目录到Python路径
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
+from admission import AdmissionController
 from dsl_parser import SimpleDSLParser
+from dsl_program import DSLProgram, ProgramRegistry
+from hot_reload import ScriptWatcher
 from interpreter import DSLInterpreter 
-from llm_client import LLMClient
+from llm_client import LLMClient, parse_cascade
 from state_manager import SessionStateManager
-from utils.logger import setup_logger
+from utils.logger import setup_logger, configure_logging
 from utils.config import load_config
+from utils.metrics import registry as metrics_registry
 
 logger = setup_logger(__name__)
 
 class SmartDSLAgent:
     """智能DSL Agent主类"""
     
-    def __init__(self, config_path: str = "config.yaml"):
-        """初始化智能DSL Agent"""
-        self.config = load_config(config_path)
+    def __init__(self, config_path: str = "config.yaml", llm_client=None):
+        """
+        初始化智能DSL Agent
         
-        # 检查API密钥 (使用get安全访问)
-        api_key = self.config.get('zhipuai', {}).get('api_key')
-        if not api_key or api_key == "你的智谱API密钥":
-            print("❌ 错误：未配置智谱AI API密钥")
-            print("请编辑 config.yaml 文件，填入您的智谱AI API密钥")
-            sys.exit(1)
+        Args:
+            config_path: 配置文件路径
+            llm_client: 可选，注入已有的 LLM 客户端（如测试桩），此时不检查 API 密钥
+        """
+        self.config = load_config(config_path)
+        configure_logging(self.config.get('logging'))
         
         # 初始化各个组件
         self.dsl_parser = SimpleDSLParser()
-        self.llm_client = LLMClient(
-            api_key=api_key,
-            model=self.config.get('zhipuai', {}).get('model', 'glm-4'),
-            temperature=self.config.get('zhipuai', {}).get('temperature', 0.1)
-        )
-        self.state_manager = SessionStateManager()
+        if llm_client is None:
+            # 多密钥池（未配置 zhipuai.key_pool.keys 时只使用单个 api_key）
+            key_pool = None
+            pool_config = self.config.get('zhipuai', {}).get('key_pool')
+            if pool_config:
+                from llm_pool import KeyPool
+                key_pool = KeyPool.from_config(pool_config)
+            # 检查API密钥 (使用get安全访问)
+            api_key = self.config.get('zhipuai', {}).get('api_key')
+            if key_pool is not None:
+                api_key = key_pool.members[0].api_key
+            if not api_key or api_key == "你的智谱API密钥":
+                print("❌ 错误：未配置智谱AI API密钥")
+                print("请编辑 config.yaml 文件，填入您的智谱AI API密钥")
+                sys.exit(1)
+            
+            cascade, scene_cascades = parse_cascade(self.config.get('zhipuai', {}).get('cascade'))
+            llm_client = LLMClient(
+                api_key=api_key,
+                model=self.config.get('zhipuai', {}).get('model', 'glm-4'),
+                temperature=self.config.get('zhipuai', {}).get('temperature', 0.1),
+                stream_intent=self.config.get('zhipuai', {}).get('stream_intent', False),
+                cascade=cascade,
+                scene_cascades=scene_cascades,
+                client=key_pool
+            )
+        self.llm_client = llm_client
+        session_config = self.config.get('session') or {}
+        if session_config.get('backend', 'file') == 'redis':
+            from redis_store import RedisSessionStateManager
+            redis_config = session_config.get('redis') or {}
+            self.state_manager = RedisSessionStateManager(
+                host=redis_config.get('host', '127.0.0.1'),
+                port=redis_config.get('port', 6379),
+                db=redis_config.get('db', 0),
+                password=redis_config.get('password'),
+                session_timeout=session_config.get('timeout', 3600),
+                key_prefix=redis_config.get('key_prefix', 'dsl:session:'),
+                max_connections=redis_config.get('max_connections', 16),
+                near_cache=redis_config.get('near_cache', True),
+                codec=session_config.get('codec', 'json'),
+                compress_threshold=session_config.get('compress_threshold'),
+                max_sessions=session_config.get('max_sessions', 10000)
+            )
+        else:
+            self.state_manager = SessionStateManager(
+                persistence_dir=session_config.get('persistence_dir', 'sessions'),
+                session_timeout=session_config.get('timeout', 3600),
+                codec=session_config.get('codec', 'json'),
+                compress_threshold=session_config.get('compress_threshold'),
+                max_sessions=session_config.get('max_sessions'),
+                max_bytes=session_config.get('max_bytes'),
+                compress_evicted=session_config.get('compress_evicted', False)
+            )
         # 确保 interpreter 被正确初始化
+        # 加载的脚本：所有脚本编译后登记在同一注册表中，相同场景跨脚本共享
+        self.loaded_scripts = {}
+        self.programs = ProgramRegistry()
+        # LLM 准入控制（未配置 llm_admission.rate 时为 None，不限流）
+        self.admission = AdmissionController.from_config(self.config.get('llm_admission'))
         self.interpreter = DSLInterpreter(
             llm_client=self.llm_client,
-            state_manager=self.state_manager
+            state_manager=self.state_manager,
+            programs=self.programs,
+            admission=self.admission
         )
+        # 并发提交同一会话时的版本冲突处理（merge / retry / overwrite）
+        self.interpreter.conflict_policy = session_config.get('conflict_policy', 'merge')
+        self.interpreter.commit_retries = session_config.get('commit_retries', 3)
+        # 单轮截止时间：turn_deadline.default 为全局预算，turn_deadline.scenes 按场景覆盖
+        deadline_config = self.config.get('turn_deadline') or {}
+        self.interpreter.turn_deadline = deadline_config.get('default')
+        self.interpreter.scene_deadlines = dict(deadline_config.get('scenes') or {})
+        # 逐轮决策日志（默认关闭，配置 decision_log 段后开启）
+        if self.config.get('decision_log'):
+            from decision_log import DecisionLog # 延迟导入：未开启时不加载
+            self.interpreter.decision_log = DecisionLog.from_config(self.config['decision_log'])
+        self.script_paths: Dict[str, str] = {}
+        # 多文件脚本：脚本名 -> 依赖的全部 .dsl 文件（任一文件变化都会触发该脚本热更新）
+        self.script_modules: Dict[str, List[str]] = {}
+        self._module_loader = None
         
-        # 加载的脚本
-        self.loaded_scripts = {}
+        # 热更新
+        self._watcher: Optional[ScriptWatcher] = None
+        self.last_reload: Dict[str, Any] = {}
+        self._reload_hist = metrics_registry.histogram(
+            "dsl_reload_seconds", "DSL 脚本热更新耗时（读取+增量编译+切换）", ("script",))
         
     def load_script(self, script_path: str) -> str:
         """加载并解析DSL脚本"""
         try:
-            with open(script_path, 'r', encoding='utf-8') as f:
-                script_content = f.read()
-            
-            # 解析脚本
-            parsed_script = self.dsl_parser.parse(script_content)
+            # 解析并编译脚本
             script_name = Path(script_path).stem
+            program = self._compile_script(script_name, str(script_path))
             
-            # 保存到加载的脚本中
-            self.loaded_scripts[script_name] = parsed_script
-            self.interpreter.set_current_script(parsed_script)
+            # 保存到加载的脚本中（最后加载的脚本作为未绑定会话的默认脚本）
+            self.loaded_scripts[script_name] = program.script
+            self.script_paths[script_name] = str(script_path)
+            self.interpreter.set_program(program)
+            self._watch_script(script_name)
             
-            logger.info(f"成功加载脚本: {script_name}")
+            logger.info("成功加载脚本: %s", script_name)
             return script_name
             
         except Exception as e:
-            logger.error(f"加载脚本失败: {e}")
+            logger.error("加载脚本失败: %s", e)
             raise
     
-    def process_input(self, user_input: str, session_id: str = "default") -> str:
-        """处理用户输入 - 智能对话"""
+    def reload_script(self, script_name: str) -> DSLProgram:
+        """
+        重新编译已加载的脚本（仅重新解析改动过的场景）并原子切换
+        解析失败时保留旧版本并抛出异常
+        """
+        t_start = time.perf_counter()
+        old_program = self.programs[script_name]
+        program = self._compile_script(script_name, self.script_paths[script_name])
+        
+        self.loaded_scripts[script_name] = program.script
+        self._watch_script(script_name) # include 关系可能已变化
+        if self.interpreter.program is old_program:
+            # 单次引用赋值即完成切换；正在执行的轮次仍持有旧程序直到结束
+            self.interpreter.program = program
+        
+        elapsed = time.perf_counter() - t_start
+        self._reload_hist.observe(elapsed, script_name)
+        self.last_reload = {
+            "script": script_name,
+            "version": program.version,
+            "changed_scenes": program.changed_scenes,
+            "seconds": elapsed,
+        }
+        logger.info("热更新脚本 %s -> v%s，重新编译场景 %s，耗时 %.1fms",
+                    script_name, program.version, program.changed_scenes, elapsed * 1000)
+        return program
+    
+    def _compile_script(self, script_name: str, script_path: str) -> DSLProgram:
+        """单文件脚本按场景增量编译；含 include/import 的脚本交给模块加载器（只重新解析改动过的文件）"""
+        with open(script_path, 'r', encoding='utf-8') as f:
+            script_content = f.read()
+        if not SimpleDSLParser.parse_includes(script_content):
+            self.script_modules[script_name] = [script_path]
+            return self.programs.compile(script_name, script_content)
+        if self._module_loader is None:
+            from dsl_modules import ModuleLoader # 延迟导入：单文件脚本用不到
+            module_config = self.config.get('dsl_modules') or {}
+            self._module_loader = ModuleLoader(workers=module_config.get('workers'),
+                                               parallel_threshold=module_config.get('parallel_threshold', 64))
+        program = self.programs.compile_modules(script_name, script_path, self._module_loader)
+        self.script_modules[script_name] = self._module_loader.modules_of(script_path)
+        return program
+    
+    def _watch_script(self, script_name: str):
+        if self._watcher is None:
+            return
+        for path in self.script_modules.get(script_name, [self.script_paths[script_name]]):
+            self._watcher.watch(path, self._on_script_changed)
+    
+    def enable_hot_reload(self, interval: float = 1.0):
+        """在后台线程监视已加载的 .dsl 文件（含 include 的模块文件），变化时自动热更新"""
+        if self._watcher is None:
+            self._watcher = ScriptWatcher(interval)
+        for script_name in self.script_paths:
+            self._watch_script(script_name)
+        self._watcher.start()
+    
+    def disable_hot_reload(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+    
+    def _on_script_changed(self, path: str):
+        for script_name, module_paths in list(self.script_modules.items()):
+            if path in module_paths:
+                self.reload_script(script_name)
+    
+    def start_profiling(self, mode: str = "deterministic", turns: Optional[int] = 100,
+                        slow_threshold: Optional[float] = None, out_dir: str = "profiles",
+                        trace_memory: bool = False, sample_interval: float = 0.005):
+        """
+        开启按轮次的性能剖析（可在运行中随时调用）
+        参数含义见 profiler.TurnProfiler；turns 轮后自动输出文件并关闭
+        """
+        from profiler import TurnProfiler # 延迟导入：不剖析时不加载 cProfile / tracemalloc
+        self.stop_profiling()
+        profiler = TurnProfiler(out_dir=out_dir, mode=mode, turns=turns, slow_threshold=slow_threshold,
+                                sample_interval=sample_interval, trace_memory=trace_memory,
+                                on_finish=self._on_profile_finished)
+        self.interpreter.profiler = profiler
+        return profiler
+    
+    def stop_profiling(self) -> List[str]:
+        """关闭剖析并输出汇总文件，返回生成的文件路径"""
+        profiler = self.interpreter.profiler
+        if profiler is None:
+            return []
+        return profiler.stop()
+    
+    def _on_profile_finished(self, profiler):
+        if self.interpreter.profiler is profiler:
+            self.interpreter.profiler = None
+    
+    def enable_profile_signal(self, signum: Optional[int] = None, **options: Any):
+        """
+        服务模式下用信号切换剖析开关（默认 SIGUSR2），options 为 start_profiling 的参数
+        Supervisor 模式下在 start() 之前调用，各 worker 进程可分别用 kill -USR2 <pid> 切换
+        """
+        import signal
+        import threading
+        signum = signum if signum is not None else signal.SIGUSR2
+        
+        def toggle(*_):
+            if self.interpreter.profiler is None:
+                self.start_profiling(**options)
+            else:
+                # 信号处理函数运行在主线程，可能正打断一个剖析中的轮次，收尾放到后台线程
+                threading.Thread(target=self.stop_profiling, name="profile-stop", daemon=True).start()
+        
+        signal.signal(signum, toggle)
+    
+    def process_input(self, user_input: str, session_id: str = "default", script: Optional[str] = None) -> str:
+        """
+        处理用户输入 - 智能对话
+        
+        Args:
+            script: 可选，把会话绑定到指定的已加载脚本；之后同一会话无需再传
+        """
         try:
             # 处理输入
-            response = self.interpreter.execute(user_input, session_id)
+            response = self.interpreter.execute(user_input, session_id, script)
             
             return response
             
         except Exception as e:
-            logger.error(f"处理输入时出错: {e}")
+            logger.error("处理输入时出错: %s", e)
             return f"抱歉，处理您的请求时出现错误。请稍后再试。"
     
     def interactive_mode(self, script_path: str):
@@ -136,11 +329,39 @@ class SmartDSLAgent:
                 print("\n\n⏹️  对话被中断")
                 break
             except Exception as e:
-                logger.error(f"交互模式出错: {e}")
+                logger.error("交互模式出错: %s", e)
                 print(f"⚠️  发生错误: {e}")
 
+def run_traffic(args):
+    """合成流量压测：同时检查吞吐、时延与意图正确率"""
+    from traffic_gen import OracleLLMClient, TrafficGenerator, drive
+    oracle = OracleLLMClient()
+    agent = SmartDSLAgent(args.config, llm_client=oracle)
+    agent.load_script(args.script)
+    generator = TrafficGenerator(agent.interpreter.program, noise=args.traffic_noise,
+                                 off_topic=args.traffic_off_topic)
+    
+    def progress(stats):
+        print(f"⏱️  {stats['turns']} 轮，{stats['turns_per_sec']:.0f} 轮/秒，正确率 {stats['accuracy']:.2%}，"
+              f"p99 {stats['p99_ms']:.1f}ms")
+    
+    until = f"，持续 {args.traffic_duration:g} 秒" if args.traffic_duration else "（Ctrl-C 结束）"
+    print(f"🚦 合成流量：目标 {args.traffic:g} 轮/秒{until}")
+    stats = drive(agent, generator.turns(), oracle, rate=args.traffic,
+                  duration=args.traffic_duration or None, progress=progress, workers=args.traffic_workers)
+    print(f"✅ 完成 {stats['turns']} 轮（{stats['turns_per_sec']:.0f} 轮/秒，目标 {args.traffic:g}），"
+          f"正确率 {stats['accuracy']:.2%}，时延 p50/p95/p99 = "
+          f"{stats['p50_ms']:.1f}/{stats['p95_ms']:.1f}/{stats['p99_ms']:.1f}ms，最大调度延迟 {stats['max_lag_ms']:.1f}ms")
+    print(f"   轮次构成: {stats['kinds']}，LLM 调用 {stats['llm_calls']} 次")
+    for example in stats['examples'][:5]:
+        print(f"   ❌ [{example['kind']}] {example['session_id']}#{example['index']} \"{example['text']}\": "
+              f"期望 {example['expected']}，实际 {example['actual']}")
+
+
 def main():
     """主函数"""
+    import argparse # 仅命令行入口需要
+    import signal
     parser = argparse.ArgumentParser(
         description="🤖 智能多业务场景Agent - 基于DSL的智能客服机器人"
     )
@@ -159,8 +380,125 @@ def main():
         help="配置文件路径（默认: config.yaml）"
     )
     
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="监视DSL脚本文件，修改后自动热更新（无需重启）"
+    )
+    
+    parser.add_argument(
+        "--batch",
+        type=str,
+        metavar="IN_JSONL",
+        help="离线批处理模式：读取 JSONL 对话记录 {\"session_id\", \"input\"}"
+    )
+    
+    parser.add_argument(
+        "--out",
+        type=str,
+        default="batch_out.jsonl",
+        help="批处理结果输出文件（默认: batch_out.jsonl）"
+    )
+    
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="批处理并发 worker 数（默认: 4）"
+    )
+    
+    parser.add_argument(
+        "--profile",
+        choices=["deterministic", "sampling"],
+        help="开启性能剖析：deterministic 输出 .pstats，sampling 输出 collapsed stacks（火焰图）"
+    )
+    
+    parser.add_argument(
+        "--profile-turns",
+        type=int,
+        default=100,
+        help="剖析的轮次数，0 表示直到退出（默认: 100）"
+    )
+    
+    parser.add_argument(
+        "--profile-slow",
+        type=float,
+        metavar="SECONDS",
+        help="只为耗时超过该秒数的轮次输出剖析文件"
+    )
+    
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="同时用 tracemalloc 统计各会话的内存增长"
+    )
+    
+    parser.add_argument(
+        "--profile-out",
+        type=str,
+        default="profiles",
+        help="剖析文件输出目录（默认: profiles）"
+    )
+    
+    parser.add_argument(
+        "--compact-sessions",
+        action="store_true",
+        help="离线压缩会话目录：删除过期会话文件与重复格式、迁移旧版平铺布局后退出（需先停止服务）"
+    )
+    
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="与 --compact-sessions 一起使用：只统计不删除"
+    )
+    
+    parser.add_argument(
+        "--traffic",
+        type=float,
+        metavar="RATE",
+        help="合成流量压测：按对话图生成会话，以每秒 RATE 轮发给 Agent（LLM 层使用按目标意图作答的替身）"
+    )
+    
+    parser.add_argument(
+        "--traffic-duration",
+        type=float,
+        default=60,
+        help="合成流量持续秒数，0 表示直到 Ctrl-C（默认: 60）"
+    )
+    
+    parser.add_argument(
+        "--traffic-workers",
+        type=int,
+        default=4,
+        help="合成流量的并发 worker 线程数，同一会话的轮次由同一线程按顺序处理（默认: 4）"
+    )
+    
+    parser.add_argument(
+        "--traffic-noise",
+        type=float,
+        default=0.1,
+        help="合成流量中带口语噪声的轮次比例（默认: 0.1）"
+    )
+    
+    parser.add_argument(
+        "--traffic-off-topic",
+        type=float,
+        default=0.05,
+        help="合成流量中无关问题的比例（默认: 0.05）"
+    )
+    
     args = parser.parse_args()
     
+    if args.compact_sessions:
+        from state_manager import compact_sessions
+        session_config = load_config(args.config).get('session') or {}
+        stats = compact_sessions(session_config.get('persistence_dir', 'sessions'),
+                                 session_timeout=session_config.get('timeout', 3600), dry_run=args.dry_run)
+        print(f"🧹 扫描 {stats['scanned']} 个会话文件：过期 {stats['expired']}，重复格式 {stats['duplicates']}，"
+              f"迁移 {stats['migrated']}，释放 {stats['bytes_freed'] / 1024 / 1024:.1f} MiB，"
+              f"删除空目录 {stats['dirs_removed']}" + ("（dry run，未删除）" if args.dry_run else ""))
+        return
+    
     # 检查脚本文件
     script_path = Path(args.script)
     if not script_path.exists():
@@ -175,10 +513,40 @@ def main():
     try:
         # 创建Agent实例
         print("🚀 正在启动智能多业务Agent...")
+        if args.traffic:
+            run_traffic(args)
+            return
         agent = SmartDSLAgent(args.config)
+        profile_options = {
+            "mode": args.profile or "deterministic",
+            "turns": args.profile_turns or None,
+            "slow_threshold": args.profile_slow,
+            "trace_memory": args.profile_memory,
+            "out_dir": args.profile_out,
+        }
+        if args.profile:
+            agent.start_profiling(**profile_options)
+        if hasattr(signal, "SIGUSR2"):
+            agent.enable_profile_signal(**profile_options) # 运行中 kill -USR2 <pid> 切换剖析
         
-        # 运行交互模式
-        agent.interactive_mode(args.script)
+        try:
+            if args.batch:
+                from batch_runner import BatchRunner
+                agent.load_script(args.script)
+                stats = BatchRunner(agent, workers=args.workers).run(args.batch, args.out)
+                print(f"✅ 批处理完成：{stats['processed']} 轮，{stats['turns_per_sec']:.0f} 轮/秒，结果已写入 {args.out}")
+                if stats['evicted']:
+                    print(f"⚠️  {stats['evicted']} 次会话超出内存上限被丢弃，之后的轮次从空状态开始（见结果中的 state_reset）")
+                return
+            
+            if args.watch:
+                agent.enable_hot_reload()
+            
+            # 运行交互模式
+            agent.interactive_mode(args.script)
+        finally:
+            for path in agent.stop_profiling():
+                print(f"📈 剖析文件: {path}")
         
     except FileNotFoundError as e:
         print(f"❌ 文件未找到: {e}")
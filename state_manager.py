@@ -1,10 +1,23 @@
 # state_manager.py
-import json
+import os
+import string
+import threading
 import time
-from typing import Dict, Any, Optional, List
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict, Any, Iterator, Optional, List, Set, Tuple
 from pathlib import Path
 from dataclasses import dataclass, field
+import session_codec
 from utils.logger import setup_logger
+from utils.metrics import registry as default_registry
+
+try:
+    import fcntl # 文件后端跨进程 compare-and-set 用；Windows 上没有，只保证进程内
+except ImportError:
+    fcntl = None
 
 logger = setup_logger(__name__)
 
@@ -16,167 +29,800 @@ class SessionState:
     created_at: float = field(default_factory=time.time)
     updated_at: float = field(default_factory=time.time)
     last_activity: float = field(default_factory=time.time)
+    version: int = 0 # 每次写入加 1，用于乐观并发控制
+
+
+class VersionConflict(Exception):
+    """compare-and-set 失败：读取之后会话已被其他请求更新"""
+
+    def __init__(self, session_id: str, expected: int, actual: Optional[int]):
+        super().__init__(f"会话 {session_id} 版本冲突：期望 {expected}，当前 {actual}")
+        self.session_id = session_id
+        self.expected = expected
+        self.actual = actual
+
+
+# 持久化目录布局：<persistence_dir>/<ab>/<cd>/<编码后的会话 id><后缀>
+# ab/cd 取自会话 id 的 CRC32（两级共 65536 个子目录），单个目录内的文件数不随会话总数线性增长
+# 文件名只包含 [A-Za-z0-9_.-] 与 %XX 转义（开头的 "." 也转义），会话 id 不会被解释为路径；
+# 编码后过长的 id 改用 "=" + SHA-1 作为文件名，此时会话 id 从文件内容中读取
+SESSION_SUFFIXES = (".session", ".json")
+_FILENAME_SAFE = frozenset(string.ascii_letters + string.digits + "_-.")
+_MAX_FILENAME = 200
+
+
+def _encode_filename(session_id: str) -> str:
+    if session_id and not session_id.startswith(".") and _FILENAME_SAFE.issuperset(session_id):
+        encoded = session_id
+    else:
+        encoded = "".join(c if c in _FILENAME_SAFE else "".join(f"%{b:02X}" for b in c.encode('utf-8'))
+                          for c in session_id)
+        if encoded.startswith("."):
+            encoded = "%2E" + encoded[1:]
+    if len(encoded) > _MAX_FILENAME:
+        import hashlib # 只有超长 id 才需要
+        return "=" + hashlib.sha1(session_id.encode('utf-8')).hexdigest()
+    return encoded
+
+
+def _decode_filename(name: str) -> Optional[str]:
+    """文件名（不含后缀）还原为会话 id；哈希文件名返回 None"""
+    if name.startswith("="):
+        return None
+    if "%" not in name:
+        return name
+    from urllib.parse import unquote
+    return unquote(name, errors='strict')
+
+
+def session_file_path(persistence_dir, session_id: str, suffix: str = ".session") -> Path:
+    """会话文件在分片目录中的路径"""
+    shard = f"{zlib.crc32(session_id.encode('utf-8')):08x}"
+    return Path(persistence_dir) / shard[:2] / shard[2:4] / f"{_encode_filename(session_id)}{suffix}"
+
+
+def _split_suffix(name: str) -> Optional[Tuple[str, str]]:
+    for suffix in SESSION_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)], suffix
+    return None
+
+
+def _iter_shard_dirs(persistence_dir: Path) -> Iterator[str]:
+    """按目录流式遍历全部叶子分片目录"""
+    with os.scandir(persistence_dir) as top:
+        for first in top:
+            if len(first.name) != 2 or not first.is_dir(follow_symlinks=False):
+                continue
+            with os.scandir(first.path) as second:
+                for leaf in second:
+                    if len(leaf.name) == 2 and leaf.is_dir(follow_symlinks=False):
+                        yield leaf.path
+
+
+def _iter_session_files(persistence_dir: Path) -> Iterator[Tuple[os.DirEntry, str, str]]:
+    """遍历分片目录中的会话文件：(目录项, 编码后的文件名主干, 后缀)"""
+    for leaf in _iter_shard_dirs(persistence_dir):
+        with os.scandir(leaf) as entries:
+            for entry in entries:
+                parts = _split_suffix(entry.name)
+                if parts is not None:
+                    yield entry, parts[0], parts[1]
+
+
+def _replace_into_shard(source: str, target: Path):
+    try:
+        os.replace(source, target)
+    except FileNotFoundError:
+        if not os.path.exists(source):
+            return # 已被其他进程迁移
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, target)
+
+
+def _migrate_flat_layout(persistence_dir: Path) -> int:
+    """
+    把旧版平铺在 persistence_dir 下的会话文件（文件名即原始会话 id）移入分片目录，返回迁移的文件数
+    分片目录中已有同名文件时保留修改时间较新的一份；多个进程同时迁移是安全的
+    """
+    migrated = 0
+    with os.scandir(persistence_dir) as entries:
+        for entry in entries:
+            parts = _split_suffix(entry.name)
+            if parts is None or not entry.is_file(follow_symlinks=False):
+                continue
+            session_id, suffix = parts
+            target = session_file_path(persistence_dir, session_id, suffix)
+            try:
+                if target.exists() and target.stat().st_mtime >= entry.stat().st_mtime:
+                    os.unlink(entry.path)
+                else:
+                    _replace_into_shard(entry.path, target)
+                migrated += 1
+            except FileNotFoundError:
+                pass # 已被其他进程迁移
+    if migrated:
+        logger.info("已将 %s 个会话文件迁移到分片目录: %s", migrated, persistence_dir)
+    return migrated
+
+
+def compact_sessions(persistence_dir: str, session_timeout: int = 3600, dry_run: bool = False) -> Dict[str, int]:
+    """
+    离线压缩/清理会话目录（服务停止时运行），不解码任何会话文件：
+    - 迁移旧版平铺布局的文件
+    - 按修改时间删除过期会话：last_activity 不会晚于最后一次写盘，按 mtime 判断过期只会少删不会误删
+    - 同一会话同时存在 .session / .json 两种格式时只保留较新的一份
+    - 删除写入中途崩溃留下的临时文件与清空后的分片目录
+    dry_run 为 True 时只统计不删除，返回各项计数
+    """
+    root = Path(persistence_dir)
+    stats = {"migrated": 0, "scanned": 0, "expired": 0, "duplicates": 0, "bytes_freed": 0, "dirs_removed": 0,
+             "temp_removed": 0}
+    if not root.is_dir():
+        return stats
+    if not dry_run:
+        stats["migrated"] = _migrate_flat_layout(root)
+    cutoff = time.time() - session_timeout
+    
+    def remove(entry: os.DirEntry, st):
+        stats["bytes_freed"] += st.st_size
+        if not dry_run:
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+    
+    for leaf in list(_iter_shard_dirs(root)):
+        newest: Dict[str, Tuple[os.DirEntry, Any]] = {}
+        remaining = 0
+        with os.scandir(leaf) as entries:
+            for entry in entries:
+                remaining += 1
+                if entry.name.endswith(".tmp"): # 写入中途崩溃留下的临时文件
+                    stats["temp_removed"] += 1
+                    remove(entry, entry.stat())
+                    remaining -= 1
+                    continue
+                parts = _split_suffix(entry.name)
+                if parts is None:
+                    continue
+                stats["scanned"] += 1
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    remaining -= 1
+                    continue
+                if st.st_mtime < cutoff:
+                    stats["expired"] += 1
+                    remove(entry, st)
+                    remaining -= 1
+                    continue
+                other = newest.get(parts[0])
+                if other is None:
+                    newest[parts[0]] = (entry, st)
+                    continue
+                stats["duplicates"] += 1
+                if other[1].st_mtime <= st.st_mtime:
+                    newest[parts[0]], (entry, st) = (entry, st), other
+                remove(entry, st)
+                remaining -= 1
+        if remaining == 0 and not dry_run:
+            try:
+                os.rmdir(leaf)
+                stats["dirs_removed"] += 1
+                os.rmdir(os.path.dirname(leaf)) # 上一级目录非空时失败，忽略
+                stats["dirs_removed"] += 1
+            except OSError:
+                pass
+    logger.info("会话目录压缩完成 %s: %s", persistence_dir, stats)
+    return stats
+
 
 class SessionStateManager:
     """会话状态管理器"""
     
-    def __init__(self, persistence_dir: str = "sessions", session_timeout: int = 3600):
+    def __init__(self, persistence_dir: str = "sessions", session_timeout: int = 3600, metrics=None,
+                 ephemeral: bool = False, codec: str = "json", compress_threshold: Optional[int] = None,
+                 max_sessions: Optional[int] = None, max_bytes: Optional[int] = None,
+                 compress_evicted: bool = False):
         """
         初始化状态管理器
         
         Args:
             persistence_dir: 持久化存储目录
             session_timeout: 会话超时时间（秒）
+            metrics: 指标注册表（默认使用进程级注册表）
+            ephemeral: 仅内存模式，不读写磁盘（用于离线批处理等场景）
+            codec: 会话文件编解码器（json / json-pretty / msgpack / marshal），读取时自动识别
+            compress_threshold: 序列化结果超过该字节数时使用 zlib 压缩（None 表示不压缩）
+            max_sessions: 内存中常驻会话数上限，超出时按 LRU 淘汰到持久化存储（None 表示不限）
+            max_bytes: 常驻会话的估算字节数上限（按最近一次序列化大小估算，仅内存模式下不生效）
+            compress_evicted: 淘汰时强制压缩写出（冷数据以体积优先），磁盘上是未压缩副本的会话也压缩重写一次
         """
         self.persistence_dir = Path(persistence_dir)
-        self.persistence_dir.mkdir(parents=True, exist_ok=True) # 确保目录存在
-        self.sessions: Dict[str, SessionState] = {}
+        self.ephemeral = ephemeral
+        if not ephemeral:
+            self.persistence_dir.mkdir(parents=True, exist_ok=True) # 确保目录存在
+            _migrate_flat_layout(self.persistence_dir) # 旧版平铺布局自动迁移到分片目录
+        # 按最近访问排序（最久未访问的在前），同时也近似按 last_activity 排序
+        self.sessions: "OrderedDict[str, SessionState]" = OrderedDict()
         self.session_timeout = session_timeout
-        self._load_persisted_sessions()
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.compress_evicted = compress_evicted
+        self.codec = session_codec.get_codec(codec)
+        self.compress_threshold = compress_threshold
+        # 旧版缩进 JSON 仍使用 .json 后缀，带文件头的新格式使用 .session
+        self._suffix = ".json" if self.codec is session_codec.CODECS["json-pretty"] else ".session"
+        # 从其他格式文件加载的会话，下次持久化时删除旧文件（写时迁移）
+        self._stale_files: Set[str] = set()
+        # 文件后端：本进程最近一次读写时会话文件的 (inode, mtime_ns, size)，与磁盘不一致说明其他进程写过
+        self._stamps: Dict[str, Tuple[int, int, int]] = {}
+        # 常驻会话最近一次写盘（或从磁盘加载）时的版本，与内存版本一致说明没有未写出的修改
+        self._persisted_versions: Dict[str, int] = {}
+        # 本进程已持有 flock 的分片目录：提交中淘汰同一分片的其他会话时不重复加锁（同进程再次 flock 会阻塞）
+        self._locked_shards: Set[Path] = set()
+        # 保护内存索引与提交（版本比较 + 写盘）；轮次本身不持有任何锁
+        self._lock = threading.RLock()
+        
+        # 各会话最近一次持久化的字节数，用于统计存储体积
+        self._persisted_sizes: Dict[str, int] = {}
+        self._persisted_bytes = 0
+        self._resident_bytes = 0
+        self.metrics = metrics or default_registry
+        self._persist_hist = self.metrics.histogram("session_persist_seconds", "会话持久化耗时")
+        self._sessions_gauge = self.metrics.gauge("session_store_sessions", "内存中的会话数")
+        self._bytes_gauge = self.metrics.gauge("session_store_bytes", "已持久化会话的总字节数")
+        self._resident_bytes_gauge = self.metrics.gauge("session_resident_bytes", "内存中会话的估算字节数")
+        self._evictions = self.metrics.counter("session_evictions_total", "LRU 淘汰到冷存储的会话数")
+        self._faults = self.metrics.counter("session_faults_total", "从冷存储按需加载的会话数")
+        self._conflicts = self.metrics.counter("session_version_conflicts_total", "compare-and-set 版本冲突次数")
+        
+        # 设置了容量上限时不再启动即全量加载，会话在首次访问时按需加载
+        if not ephemeral and max_sessions is None and max_bytes is None:
+            self._load_persisted_sessions()
     
     def create_session(self, session_id: str, initial_state: Optional[Dict[str, Any]] = None) -> str:
         """创建新会话"""
-        if session_id in self.sessions:
-            logger.warning(f"会话已存在: {session_id}")
+        with self._lock:
+            if session_id in self.sessions or self._fault_in(session_id):
+                logger.warning("会话已存在: %s", session_id)
+                return session_id
+            
+            state = SessionState(
+                session_id=session_id,
+                state_data=initial_state or {}
+            )
+            self.sessions[session_id] = state
+            self._sessions_gauge.set(len(self.sessions))
+            logger.info("创建新会话: %s", session_id)
+            self._persist_session(session_id) # 创建时立即持久化
+            self._enforce_capacity(session_id)
             return session_id
-        
-        state = SessionState(
-            session_id=session_id,
-            state_data=initial_state or {}
-        )
-        self.sessions[session_id] = state
-        logger.info(f"创建新会话: {session_id}")
-        self._persist_session(session_id) # 创建时立即持久化
-        return session_id
-    
-    def get_state(self, session_id: str) -> Dict[str, Any]:
-        """获取会话状态"""
-        self._cleanup_expired_sessions()
-        
-        if session_id not in self.sessions:
-            self.create_session(session_id)
-        
-        session = self.sessions[session_id]
-        session.last_activity = time.time()
-        
-        # 返回深拷贝以防止外部直接修改内存状态
-        return session.state_data.copy()
     
-    def update_state(self, session_id: str, new_state: Dict[str, Any]):
-        """更新会话状态"""
-        if session_id not in self.sessions:
-            self.create_session(session_id)
-        
-        session = self.sessions[session_id]
-        session.state_data = new_state.copy()
-        session.updated_at = time.time()
-        session.last_activity = time.time()
-        
-        self._persist_session(session_id)
+    def get_state(self, session_id: str, with_version: bool = False):
+        """
+        获取会话状态
+        with_version 为 True 时返回 (状态, 版本号)，版本号用于之后 update_state 的 compare-and-set
+        """
+        with self._lock:
+            self._cleanup_expired_sessions()
+            
+            if session_id not in self.sessions and not self._fault_in(session_id):
+                self.create_session(session_id)
+            
+            session = self.sessions[session_id]
+            session.last_activity = time.time()
+            self.sessions.move_to_end(session_id)
+            
+            # 返回拷贝以防止外部直接修改内存状态
+            state = session.state_data.copy()
+            return (state, session.version) if with_version else state
     
-    def clear_session(self, session_id: str):
+    def update_state(self, session_id: str, new_state: Dict[str, Any],
+                     expected_version: Optional[int] = None) -> int:
         """
-        [新增] 清空指定会话的状态数据
-        用于测试或重置会话
+        更新会话状态，返回写入后的版本号
+        expected_version 不为 None 时为 compare-and-set：当前版本不等于它（读取之后被其他请求或进程更新过）
+        时抛出 VersionConflict，不写入；为 None 时直接覆盖
         """
-        if session_id in self.sessions:
+        with self._lock, self._commit_lock(session_id, expected_version is not None):
+            if expected_version is not None:
+                current = self._current_version(session_id)
+                if current != expected_version:
+                    self._conflicts.inc()
+                    raise VersionConflict(session_id, expected_version, current)
+            if session_id not in self.sessions and not self._fault_in(session_id):
+                self.create_session(session_id)
+            
             session = self.sessions[session_id]
-            session.state_data = {} # 清空数据
+            session.state_data = new_state.copy()
+            session.version += 1
             session.updated_at = time.time()
             session.last_activity = time.time()
-            self._persist_session(session_id) # 立即保存更改
-            logger.info(f"已清空会话数据: {session_id}")
-        else:
-            # 如果会话不存在，创建一个空的
-            self.create_session(session_id)
+            self.sessions.move_to_end(session_id)
+            
+            self._persist_session(session_id, atomic=expected_version is not None)
+            self._enforce_capacity(session_id)
+            return session.version
+    
+    @contextmanager
+    def _commit_lock(self, session_id: str, exclusive: bool):
+        """文件后端的 compare-and-set 对会话所在的分片目录加 flock，使比较与写入对其他进程也是原子的"""
+        if not exclusive or self.ephemeral or fcntl is None:
+            yield
+            return
+        shard_dir = self._session_path(session_id).parent
+        if shard_dir in self._locked_shards:
+            yield
+            return
+        try:
+            fd = os.open(shard_dir, os.O_RDONLY)
+        except FileNotFoundError:
+            shard_dir.mkdir(parents=True, exist_ok=True)
+            fd = os.open(shard_dir, os.O_RDONLY)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            self._locked_shards.add(shard_dir)
+            yield
+        finally:
+            self._locked_shards.discard(shard_dir)
+            os.close(fd) # 关闭即释放锁
+    
+    def _current_version(self, session_id: str) -> int:
+        """
+        会话的权威版本号（不存在时为 0）
+        文件后端先比较会话文件的 (inode, mtime_ns, size)：与本进程最近一次读写时一致则内存副本就是最新的，
+        否则重新读取磁盘上的版本（compare-and-set 以替换文件的方式写入，每次写入都会换 inode）
+        """
+        session = self.sessions.get(session_id)
+        fresh, st = self._changed_on_disk(session_id)
+        if fresh is None:
+            return session.version if session is not None else 0
+        # 以磁盘为准替换内存副本（其他进程写入的最新状态）
+        self._drop_resident(session_id)
+        self.sessions[session_id] = fresh
+        self._track_size(session_id, st.st_size)
+        self._sessions_gauge.set(len(self.sessions))
+        self._stamps[session_id] = (st.st_ino, st.st_mtime_ns, st.st_size)
+        self._persisted_versions[session_id] = fresh.version
+        return fresh.version
+    
+    def _changed_on_disk(self, session_id: str) -> Tuple[Optional[SessionState], Any]:
+        """
+        会话文件的标识与本进程最近一次读写时不一致时读取它，返回 (磁盘上的会话, stat 结果)
+        文件不存在、未变化或无法读取时会话为 None；不修改内存副本
+        """
+        if self.ephemeral:
+            return None, None
+        session_file = self._session_path(session_id)
+        try:
+            st = os.stat(session_file)
+        except FileNotFoundError:
+            return None, None
+        if session_id in self.sessions and self._stamps.get(session_id) == (st.st_ino, st.st_mtime_ns, st.st_size):
+            return None, st
+        try:
+            return self._read_session_file(session_file), st
+        except Exception as e:
+            logger.warning("加载会话文件失败 %s: %s", session_file, e)
+            return None, st
+    
+    def clear_session(self, session_id: str):
+        """
+        [新增] 清空指定会话的状态数据
+        用于测试或重置会话
+        """
+        with self._lock, self._commit_lock(session_id, True):
+            # 以磁盘上的最新版本为基础（包括其他进程的写入与已淘汰的会话），写入的版本号不会回退
+            self._current_version(session_id)
+            if session_id in self.sessions or self._fault_in(session_id):
+                session = self.sessions[session_id]
+                session.state_data = {} # 清空数据
+                session.version += 1
+                session.updated_at = time.time()
+                session.last_activity = time.time()
+                self.sessions.move_to_end(session_id)
+                self._persist_session(session_id, atomic=True) # 立即保存更改
+                logger.info("已清空会话数据: %s", session_id)
+            else:
+                # 如果会话不存在，创建一个空的
+                self.create_session(session_id)
 
     def _cleanup_expired_sessions(self):
-        """清理过期会话"""
+        """
+        清理过期会话
+        sessions 按最近访问排序，只需从最旧的一端扫描到第一个未过期的会话为止
+        """
         current_time = time.time()
         expired_sessions = []
         
         for session_id, session in self.sessions.items():
-            if current_time - session.last_activity > self.session_timeout:
-                expired_sessions.append(session_id)
+            if current_time - session.last_activity <= self.session_timeout:
+                break
+            expired_sessions.append(session_id)
         
         for session_id in expired_sessions:
             self.delete_session(session_id)
     
-    def _persist_session(self, session_id: str):
-        """持久化会话状态"""
-        if session_id not in self.sessions:
+    def _enforce_capacity(self, keep: str):
+        """超过容量上限时按 LRU 把会话淘汰到持久化存储（keep 为当前正在使用的会话）"""
+        while len(self.sessions) > 1 and (
+                (self.max_sessions is not None and len(self.sessions) > self.max_sessions) or
+                (self.max_bytes is not None and self._resident_bytes > self.max_bytes)):
+            session_id = next(iter(self.sessions))
+            if session_id == keep:
+                break
+            self._evict(session_id)
+    
+    def _evict(self, session_id: str):
+        """
+        从内存移除；只有存在未写出的修改（如之前写盘失败）时才先写出
+        只是被读取过的会话不重写（compress_evicted 下未压缩的磁盘副本除外），
+        磁盘上的 last_activity 停在最后一次写入，过期判断按此偏早（不会晚于实际）
+        补写与 compare-and-set 提交一样在分片锁内进行，磁盘上已有更新的版本（其他进程写入）时放弃本地副本
+        """
+        session = self.sessions[session_id]
+        if self._persisted_versions.get(session_id) != session.version:
+            with self._commit_lock(session_id, True):
+                fresh, _ = self._changed_on_disk(session_id)
+                if fresh is not None and fresh.version >= session.version:
+                    logger.warning("淘汰会话 %s 时磁盘上已有更新的版本 %s（本地 %s），不写出",
+                                   session_id, fresh.version, session.version)
+                else:
+                    self._persist_session(session_id, atomic=True,
+                                          compress_threshold=0 if self.compress_evicted else None)
+        elif self.compress_evicted:
+            self._recompress_file(session_id)
+        self._drop_resident(session_id)
+        self._evictions.inc()
+    
+    def _recompress_file(self, session_id: str):
+        """
+        compress_evicted 下淘汰没有未写出修改的会话：磁盘上的副本未压缩时压缩重写
+        以磁盘内容为准（不用内存副本覆盖其他进程的写入），旧版缩进 JSON 不支持压缩
+        """
+        if self.ephemeral or self._suffix == ".json":
+            return
+        session_file = self._session_path(session_id)
+        with self._commit_lock(session_id, True):
+            try:
+                raw = session_file.read_bytes()
+                if session_codec.is_compressed(raw):
+                    return
+                payload = session_codec.encode(session_codec.decode(raw), self.codec, 0)
+                temp_file = session_file.with_name(session_file.name + ".tmp")
+                self._write_file(temp_file, payload)
+                os.replace(temp_file, session_file)
+            except FileNotFoundError:
+                return
+            except Exception as e:
+                logger.error("压缩重写会话失败 %s: %s", session_id, e)
+                return
+        self._track_size(session_id, len(payload))
+    
+    def release_resident(self):
+        """丢弃内存中的全部会话（不写盘），之后按需从持久化存储重新加载"""
+        for session_id in list(self.sessions):
+            self._drop_resident(session_id)
+    
+    def _drop_resident(self, session_id: str):
+        self._persisted_versions.pop(session_id, None)
+        if self.sessions.pop(session_id, None) is not None:
+            self._resident_bytes -= self._persisted_sizes.get(session_id, 0)
+            self._resident_bytes_gauge.set(self._resident_bytes)
+            self._sessions_gauge.set(len(self.sessions))
+    
+    def _persist_session(self, session_id: str, atomic: bool = False,
+                         compress_threshold: Optional[int] = None):
+        """
+        持久化会话状态
+        atomic 为 True 时（compare-and-set 提交）先写临时文件再替换，并记录文件标识供下次比较版本
+        compress_threshold 覆盖本次写入的压缩阈值（None 表示使用 self.compress_threshold）
+        """
+        if self.ephemeral or session_id not in self.sessions:
             return
         
         session = self.sessions[session_id]
-        session_file = self.persistence_dir / f"{session_id}.json"
+        session_file = self._session_path(session_id)
+        t_start = perf_counter()
         
         try:
-            # 准备序列化数据
-            persist_data = {
-                "session_id": session.session_id,
-                "state_data": session.state_data,
-                "created_at": session.created_at,
-                "updated_at": session.updated_at,
-                "last_activity": session.last_activity
-            }
+            if compress_threshold is None:
+                compress_threshold = self.compress_threshold
+            payload = session_codec.encode(self._persist_data(session), self.codec, compress_threshold)
+            if atomic:
+                temp_file = session_file.with_name(session_file.name + ".tmp")
+                self._write_file(temp_file, payload)
+                os.replace(temp_file, session_file)
+                st = os.stat(session_file)
+                self._stamps[session_id] = (st.st_ino, st.st_mtime_ns, st.st_size)
+            else:
+                self._write_file(session_file, payload)
+                self._stamps.pop(session_id, None)
+            self._track_size(session_id, len(payload))
+            self._persisted_versions[session_id] = session.version
+            if session_id in self._stale_files:
+                self._remove_stale_file(session_id)
+            if self.metrics.enabled:
+                self._persist_hist.observe(perf_counter() - t_start)
             
-            with open(session_file, 'w', encoding='utf-8') as f:
-                json.dump(persist_data, f, ensure_ascii=False, indent=2)
-            
-            logger.debug(f"持久化会话: {session_id}")
+            logger.debug("持久化会话: %s", session_id)
             
         except Exception as e:
-            logger.error(f"持久化会话失败 {session_id}: {e}")
+            logger.error("持久化会话失败 %s: %s", session_id, e)
+    
+    @staticmethod
+    def _persist_data(session: SessionState) -> Dict[str, Any]:
+        """准备序列化数据"""
+        return {
+            "session_id": session.session_id,
+            "state_data": session.state_data,
+            "created_at": session.created_at,
+            "updated_at": session.updated_at,
+            "last_activity": session.last_activity,
+            "version": session.version
+        }
     
     def _load_persisted_sessions(self):
         """
         [新增实现] 加载持久化的会话
-        遍历目录下的 JSON 文件并恢复状态
+        遍历目录下的会话文件（新旧格式）并恢复状态
         """
         if not self.persistence_dir.exists():
             return
 
         try:
-            for session_file in self.persistence_dir.glob("*.json"):
+            for entry, _, suffix in _iter_session_files(self.persistence_dir):
                 try:
-                    with open(session_file, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    
-                    # 检查数据完整性
-                    if "session_id" not in data:
+                    session = self._read_session_file(Path(entry.path))
+                    if session is None:
                         continue
-                        
-                    session_id = data["session_id"]
-                    
-                    # 恢复 SessionState 对象
-                    session = SessionState(
-                        session_id=session_id,
-                        state_data=data.get("state_data", {}),
-                        created_at=data.get("created_at", time.time()),
-                        updated_at=data.get("updated_at", time.time()),
-                        last_activity=data.get("last_activity", time.time())
-                    )
-                    
-                    self.sessions[session_id] = session
+                    if suffix != self._suffix:
+                        self._stale_files.add(session.session_id)
+                        if session.session_id in self.sessions:
+                            continue # 同时存在新旧两种格式时以当前格式为准
+                    self.sessions[session.session_id] = session
+                    self._persisted_versions[session.session_id] = session.version
+                    self._track_size(session.session_id, entry.stat().st_size)
                     
                 except Exception as e:
-                    logger.warning(f"加载会话文件失败 {session_file}: {e}")
+                    logger.warning("加载会话文件失败 %s: %s", entry.path, e)
                     
-            logger.info(f"已加载 {len(self.sessions)} 个持久化会话")
+            # 按 last_activity 排序，保持“最久未访问在前”的顺序
+            ordered = sorted(self.sessions.values(), key=lambda s: s.last_activity)
+            self.sessions = OrderedDict((s.session_id, s) for s in ordered)
+            self._sessions_gauge.set(len(self.sessions))
+            logger.info("已加载 %s 个持久化会话", len(self.sessions))
             
         except Exception as e:
-            logger.error(f"遍历会话目录失败: {e}")
+            logger.error("遍历会话目录失败: %s", e)
         
+    def _session_path(self, session_id: str, suffix: Optional[str] = None) -> Path:
+        return session_file_path(self.persistence_dir, session_id, suffix or self._suffix)
+    
+    @staticmethod
+    def _write_file(session_file: Path, payload: bytes):
+        """写入会话文件，分片目录不存在时才创建（常见路径上不多一次系统调用）"""
+        try:
+            session_file.write_bytes(payload)
+        except FileNotFoundError:
+            session_file.parent.mkdir(parents=True, exist_ok=True)
+            session_file.write_bytes(payload)
+    
+    def _other_suffix(self) -> str:
+        return ".session" if self._suffix == ".json" else ".json"
+    
+    def _remove_stale_file(self, session_id: str):
+        self._stale_files.discard(session_id)
+        try:
+            self._session_path(session_id, self._other_suffix()).unlink()
+        except FileNotFoundError:
+            pass
+    
+    def _read_session_file(self, session_file: Path) -> Optional[SessionState]:
+        """读取单个会话文件（自动识别编解码器与 schema 版本），数据不完整时返回 None"""
+        return self._state_from_data(session_codec.decode(session_file.read_bytes()))
+    
+    @staticmethod
+    def _state_from_data(data: Dict[str, Any]) -> Optional[SessionState]:
+        # 检查数据完整性
+        if "session_id" not in data:
+            return None
+        
+        # 恢复 SessionState 对象
+        return SessionState(
+            session_id=data["session_id"],
+            state_data=data.get("state_data", {}),
+            created_at=data.get("created_at", time.time()),
+            updated_at=data.get("updated_at", time.time()),
+            last_activity=data.get("last_activity", time.time()),
+            version=data.get("version", 0)
+        )
+    
+    def _fault_in(self, session_id: str) -> bool:
+        """
+        内存中没有该会话时，尝试从持久化存储按需加载
+        （如 worker 接管其他进程的会话、或启动后才出现的会话文件）
+        """
+        if self.ephemeral:
+            return False
+        session_file = self._session_path(session_id)
+        if not session_file.exists():
+            session_file = self._session_path(session_id, self._other_suffix())
+            if not session_file.exists():
+                return False
+            self._stale_files.add(session_id)
+        try:
+            session = self._read_session_file(session_file)
+        except Exception as e:
+            logger.warning("加载会话文件失败 %s: %s", session_file, e)
+            return False
+        if session is None:
+            return False
+        if time.time() - session.last_activity > self.session_timeout:
+            self.delete_session(session_id)
+            return False
+        
+        self.sessions[session_id] = session
+        self._persisted_versions[session_id] = session.version
+        st = session_file.stat()
+        self._stamps[session_id] = (st.st_ino, st.st_mtime_ns, st.st_size)
+        self._track_size(session_id, st.st_size)
+        self._sessions_gauge.set(len(self.sessions))
+        self._faults.inc()
+        self._enforce_capacity(session_id)
+        return True
+    
     def delete_session(self, session_id: str):
         """删除会话"""
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+        self._drop_resident(session_id)
+        self._track_size(session_id, 0)
             
-        # 即使内存中没有，也要尝试删除文件
-        session_file = self.persistence_dir / f"{session_id}.json"
-        if session_file.exists():
+        # 即使内存中没有，也要尝试删除文件（新旧两种格式）
+        self._stale_files.discard(session_id)
+        self._stamps.pop(session_id, None)
+        if self.ephemeral:
+            return
+        for suffix in (self._suffix, self._other_suffix()):
+            session_file = self._session_path(session_id, suffix)
+            if session_file.exists():
+                try:
+                    session_file.unlink()
+                    logger.info("删除会话及文件: %s", session_id)
+                except Exception as e:
+                    logger.error("删除会话文件失败: %s", e)
+    
+    def _track_size(self, session_id: str, size: int):
+        """更新存储体积统计（size 为 0 表示已删除）"""
+        old_size = self._persisted_sizes.pop(session_id, 0)
+        self._persisted_bytes += size - old_size
+        if session_id in self.sessions:
+            self._resident_bytes += size - old_size
+            self._resident_bytes_gauge.set(self._resident_bytes)
+        if size:
+            self._persisted_sizes[session_id] = size
+        self._bytes_gauge.set(self._persisted_bytes)
+    
+    # --- 批量导出 / 导入（归档格式见 session_archive.py）---
+    
+    def export_archive(self, path: str, chunk_size: int = 1000) -> int:
+        """
+        把全部会话流式写入单个归档文件，返回会话数
+        内存中的会话以内存版本为准，其余会话直接复制持久化文件的内容（不解码）
+        """
+        from session_archive import ArchiveWriter # 延迟导入：只有迁移/备份时才用到
+        t_start = perf_counter()
+        with open(path, 'wb') as f:
+            writer = ArchiveWriter(f, chunk_size)
+            for session_id, payload in self._iter_payloads(chunk_size):
+                writer.add(session_id, payload)
+            count = writer.close()
+        logger.info("已导出 %s 个会话到 %s，耗时 %.2fs", count, path, perf_counter() - t_start)
+        return count
+    
+    def import_archive(self, path: str, workers: int = 1, verify: bool = True) -> int:
+        """
+        从归档文件流式导入会话（覆盖同 id 的已有会话），返回导入的会话数
+        workers > 1 时由线程池并行校验、解压并写入各块；在途的块数有上限，内存占用不随归档大小增长
+        verify 为 True 时先完整校验一遍归档（不写入），损坏或被截断的归档不会只导入一部分；
+        为 False 时只读一遍，出错时之前的块已经写入，已导入的会话数记在错误日志中
+        """
+        from session_archive import read_chunks, verify_archive
+        t_start = perf_counter()
+        if verify:
+            with open(path, 'rb') as f:
+                verify_archive(f)
+        count = 0
+        try:
+            with open(path, 'rb') as f:
+                chunks = read_chunks(f)
+                if workers <= 1:
+                    for chunk in chunks:
+                        count += self._apply_imported(self._import_chunk(chunk))
+                else:
+                    from collections import deque
+                    from concurrent.futures import ThreadPoolExecutor
+                    with ThreadPoolExecutor(max_workers=workers) as pool:
+                        in_flight = deque()
+                        try:
+                            for chunk in chunks:
+                                in_flight.append(pool.submit(self._import_chunk, chunk))
+                                if len(in_flight) >= workers * 2:
+                                    count += self._apply_imported(in_flight.popleft().result())
+                            while in_flight:
+                                count += self._apply_imported(in_flight.popleft().result())
+                        finally:
+                            # 中途出错时已提交的块仍会写完，同步它们的内存索引，不留下过期的常驻副本
+                            for future in in_flight:
+                                if future.exception() is None:
+                                    count += self._apply_imported(future.result())
+        except Exception:
+            logger.error("从 %s 导入中断，此前已导入 %s 个会话", path, count)
+            raise
+        logger.info("已从 %s 导入 %s 个会话，耗时 %.2fs", path, count, perf_counter() - t_start)
+        return count
+    
+    def _iter_resident_payloads(self) -> Iterator[Tuple[str, bytes]]:
+        for session_id in list(self.sessions):
+            session = self.sessions.get(session_id)
+            if session is not None:
+                yield session_id, session_codec.encode(self._persist_data(session), self.codec,
+                                                       self.compress_threshold)
+    
+    def _iter_payloads(self, batch_size: int) -> Iterator[Tuple[str, bytes]]:
+        """导出的数据源：(会话 id, 编码后的负载)，按目录流式遍历"""
+        yield from self._iter_resident_payloads()
+        if self.ephemeral or not self.persistence_dir.exists():
+            return
+        for entry, name, suffix in _iter_session_files(self.persistence_dir):
+            session_id = _decode_filename(name)
+            payload = None
             try:
-                session_file.unlink()
-                logger.info(f"删除会话及文件: {session_id}")
-            except Exception as e:
-                logger.error(f"删除会话文件失败: {e}")
\ No newline at end of file
+                if session_id is None: # 超长 id 使用哈希文件名，从内容中取回
+                    with open(entry.path, 'rb') as f:
+                        payload = f.read()
+                    session_id = session_codec.decode(payload).get("session_id")
+                    if session_id is None:
+                        continue
+                # 已在内存中的会话已导出；同时存在新旧两种格式时以当前格式为准
+                if session_id in self.sessions or (
+                        suffix != self._suffix and self._session_path(session_id).exists()):
+                    continue
+                if payload is None:
+                    with open(entry.path, 'rb') as f:
+                        payload = f.read()
+            except FileNotFoundError:
+                continue # 遍历期间被删除
+            yield session_id, payload
+    
+    def _import_chunk(self, chunk) -> List[Tuple[str, int, Optional[SessionState]]]:
+        """校验解压一块并写入存储（可在工作线程中执行），返回 [(会话 id, 字节数, 仅内存模式下的会话)]"""
+        from session_archive import decode_chunk
+        return self._store_payloads(decode_chunk(chunk))
+    
+    def _store_payloads(self, records: List[Tuple[str, bytes]]) -> List[Tuple[str, int, Optional[SessionState]]]:
+        results = []
+        for session_id, payload in records:
+            if self.ephemeral:
+                session = self._state_from_data(session_codec.decode(payload))
+                if session is None:
+                    logger.warning("归档中的会话 %s 缺少 session_id，跳过", session_id)
+                    continue
+                results.append((session_id, len(payload), session))
+            else:
+                self._write_file(self._session_path(session_id), payload)
+                results.append((session_id, len(payload), None))
+        return results
+    
+    def _apply_imported(self, results: List[Tuple[str, int, Optional[SessionState]]]) -> int:
+        """在调用线程中更新内存索引与体积统计：磁盘上的会话之后按需加载，旧的内存副本作废"""
+        for session_id, size, session in results:
+            self._drop_resident(session_id)
+            if session is not None:
+                self.sessions[session_id] = session
+            self._track_size(session_id, size)
+        if any(session is not None for _, _, session in results):
+            self._sessions_gauge.set(len(self.sessions))
+            self._enforce_capacity("")
+        return len(results)
@@ -0,0 +1,215 @@
+# supervisor.py
+"""
+多进程 Supervisor 模式
+父进程预先加载并编译脚本，冻结堆（gc.freeze）后 fork 出 N 个 worker，编译结果以写时复制方式共享；
+请求按 session_id 一致性哈希路由到固定 worker，会话状态只驻留在该 worker 本地
+"""
+import bisect
+import gc
+import hashlib
+import itertools
+import multiprocessing
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+IDLE = -1 # worker 当前没有在处理请求
+
+
+class WorkerCrashed(Exception):
+    """处理该请求的 worker 崩溃，请求未完成（可能已部分执行，不会自动重发）"""
+
+
+class ConsistentHashRing:
+    """一致性哈希环（带虚拟节点）"""
+
+    def __init__(self, nodes: List[int], replicas: int = 100):
+        self.replicas = replicas
+        self._keys: List[int] = []
+        self._ring: Dict[int, int] = {}
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+    def add(self, node: int):
+        for i in range(self.replicas):
+            h = self._hash(f"{node}#{i}")
+            self._ring[h] = node
+            bisect.insort(self._keys, h)
+
+    def remove(self, node: int):
+        for i in range(self.replicas):
+            h = self._hash(f"{node}#{i}")
+            if self._ring.pop(h, None) is not None:
+                self._keys.remove(h)
+
+    def get(self, key: str) -> int:
+        idx = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._ring[self._keys[idx]]
+
+
+def _worker_main(conn, agent, current):
+    """worker 进程主循环：逐条处理父进程发来的请求；current 记录正在处理的 req_id，供崩溃接管时判断"""
+    # 继承自父进程的会话快照可能已过期，worker 只按需从持久化存储加载自己负责的会话
+    agent.state_manager.release_resident()
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message is None:
+            break
+        req_id, (user_input, session_id, script) = message
+        current.value = req_id
+        response = agent.process_input(user_input, session_id, script)
+        conn.send((req_id, response))
+        current.value = IDLE
+    conn.close()
+
+
+class _WorkerHandle:
+    def __init__(self, slot: int, process, conn, current):
+        self.slot = slot
+        self.process = process
+        self.conn = conn
+        self.current = current # 共享内存中的 req_id，worker 正在处理的请求
+        # req_id -> (future, payload, 已重发次数)，崩溃接管时用于重发
+        self.pending: Dict[int, Tuple[Future, Tuple[str, str, Optional[str]], int]] = {}
+
+
+class AgentSupervisor:
+    """
+    会话亲和的多进程 Supervisor
+    agent 需已在父进程中加载好脚本；worker 崩溃时在同一哈希槽位重新 fork，
+    新 worker 从持久化存储恢复会话并重发排队中的请求。崩溃时正在处理的请求可能已部分执行
+    （甚至就是导致崩溃的输入），不重发，其 Future 以 WorkerCrashed 结束
+    """
+
+    def __init__(self, agent, num_workers: int = 0, max_resends: int = 3):
+        """
+        Args:
+            max_resends: 排队中的请求最多随崩溃接管重发的次数，超过后以 WorkerCrashed 结束
+        """
+        self.agent = agent
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.max_resends = max_resends
+        self._ctx = multiprocessing.get_context("fork")
+        self._ring = ConsistentHashRing(list(range(self.num_workers)))
+        self._workers: List[_WorkerHandle] = []
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stopping = False
+        self.restarts = 0
+
+    def start(self):
+        """冻结当前堆并 fork 出所有 worker"""
+        gc.collect()
+        gc.freeze() # 预加载对象移入永久代，避免 GC 触碰导致写时复制页被拷贝
+        with self._lock:
+            self._workers = [self._spawn(slot) for slot in range(self.num_workers)]
+        logger.info("Supervisor 已启动 %s 个 worker", self.num_workers)
+
+    def _spawn(self, slot: int) -> _WorkerHandle:
+        parent_conn, child_conn = self._ctx.Pipe()
+        current = self._ctx.Value('q', IDLE, lock=False)
+        process = self._ctx.Process(target=_worker_main, args=(child_conn, self.agent, current),
+                                    name=f"dsl-worker-{slot}", daemon=True)
+        process.start()
+        child_conn.close()
+        handle = _WorkerHandle(slot, process, parent_conn, current)
+        threading.Thread(target=self._read_loop, args=(handle,),
+                         name=f"dsl-worker-reader-{slot}", daemon=True).start()
+        return handle
+
+    def _read_loop(self, handle: _WorkerHandle):
+        while True:
+            try:
+                req_id, response = handle.conn.recv()
+            except (EOFError, OSError):
+                break
+            entry = handle.pending.pop(req_id, None)
+            if entry is not None:
+                entry[0].set_result(response)
+        if not self._stopping:
+            self._takeover(handle)
+
+    def _takeover(self, dead: _WorkerHandle):
+        """worker 崩溃：在同一槽位重新 fork，并把排队中的请求转交新 worker"""
+        with self._lock:
+            if self._stopping or self._workers[dead.slot] is not dead:
+                return
+            dead.process.join(timeout=1)
+            logger.warning("worker %s 异常退出 (exitcode=%s)，重新启动并接管其会话",
+                           dead.slot, dead.process.exitcode)
+            handle = self._spawn(dead.slot)
+            self._workers[dead.slot] = handle
+            self.restarts += 1
+            in_flight = dead.current.value
+            for req_id, (future, payload, resends) in dead.pending.items():
+                if req_id == in_flight:
+                    # 可能已部分执行或就是导致崩溃的请求，重发会重复执行或再次打崩 worker
+                    future.set_exception(WorkerCrashed(f"worker {dead.slot} 处理请求时崩溃"))
+                elif resends >= self.max_resends:
+                    logger.error("请求 %s 已随 worker 崩溃重发 %s 次，放弃", req_id, resends)
+                    future.set_exception(WorkerCrashed(f"请求随 worker 崩溃重发 {resends} 次后仍未完成"))
+                else:
+                    handle.pending[req_id] = (future, payload, resends + 1)
+                    handle.conn.send((req_id, payload))
+            dead.pending.clear()
+            dead.conn.close()
+
+    def worker_for(self, session_id: str) -> int:
+        return self._ring.get(session_id)
+
+    def submit(self, user_input: str, session_id: str, script: Optional[str] = None) -> Future:
+        """异步提交一轮对话，返回 Future（结果为回复文本）"""
+        future: Future = Future()
+        payload = (user_input, session_id, script)
+        with self._lock:
+            handle = self._workers[self._ring.get(session_id)]
+            req_id = next(self._ids)
+            handle.pending[req_id] = (future, payload, 0)
+            try:
+                handle.conn.send((req_id, payload))
+            except OSError:
+                # worker 已退出：读线程检测到 EOF 后会接管并重发 pending 中的请求
+                pass
+        return future
+
+    def process_input(self, user_input: str, session_id: str = "default",
+                      script: Optional[str] = None, timeout: Optional[float] = None) -> str:
+        return self.submit(user_input, session_id, script).result(timeout)
+
+    def worker_pids(self) -> List[int]:
+        return [w.process.pid for w in self._workers]
+
+    def stop(self):
+        with self._lock:
+            self._stopping = True
+            workers, self._workers = self._workers, []
+        for handle in workers:
+            try:
+                handle.conn.send(None)
+            except OSError:
+                pass
+        for handle in workers:
+            handle.process.join(timeout=5)
+            if handle.process.is_alive():
+                handle.process.terminate()
+            handle.conn.close()
+        gc.unfreeze()
+        logger.info("Supervisor 已停止")
+
+    def __enter__(self) -> "AgentSupervisor":
+        self.start()
+        return self
+
+    def __exit__(self, *exc: Any):
+        self.stop()
@@ -0,0 +1,114 @@
+# tests/test_admission.py
+import threading
+import time
+import unittest
+from admission import AdmissionController
+from interpreter import DSLInterpreter
+from dsl_program import compile_program
+from llm_client import LLMClient
+from state_manager import SessionStateManager
+from utils.metrics import MetricsRegistry
+from tests.test_stubs import StubChatClient
+
+SCRIPT = """
+scene main {
+    intent greeting {
+        reply "你好"
+    }
+    intent default {
+        reply "兜底回复"
+    }
+}
+"""
+
+class TestAdmissionController(unittest.TestCase):
+
+    def make(self, **kwargs) -> AdmissionController:
+        return AdmissionController(metrics=MetricsRegistry(), **kwargs)
+
+    def test_shed_when_wait_budget_exceeded(self):
+        admission = self.make(rate=1, burst=1, max_wait=0.05)
+        self.assertTrue(admission.acquire())
+        t_start = time.perf_counter()
+        self.assertFalse(admission.acquire())
+        # 预算内不可能拿到令牌时立即降级，而不是白等到超时
+        self.assertLess(time.perf_counter() - t_start, 0.05)
+        self.assertEqual(admission.stats()["shed"], 1)
+
+    def test_higher_priority_admitted_first(self):
+        admission = self.make(rate=20, burst=1, max_wait=2.0)
+        self.assertTrue(admission.acquire())
+        order = []
+        def waiter(name, priority):
+            if admission.acquire(priority):
+                order.append(name)
+        low = threading.Thread(target=waiter, args=("low", 5))
+        low.start()
+        time.sleep(0.01)
+        high = threading.Thread(target=waiter, args=("high", 0))
+        high.start()
+        low.join()
+        high.join()
+        self.assertEqual(order, ["high", "low"])
+
+    def test_full_queue_evicts_lowest_priority(self):
+        admission = self.make(rate=5, burst=1, queue_size=1, max_wait=1.0)
+        self.assertTrue(admission.acquire())
+        results = {}
+        low = threading.Thread(target=lambda: results.setdefault("low", admission.acquire(9)))
+        low.start()
+        time.sleep(0.01)
+        self.assertFalse(admission.acquire(9)) # 同级不能挤出已排队的请求
+        self.assertTrue(admission.acquire(0))
+        low.join()
+        self.assertFalse(results["low"])
+
+    def test_priority_for_mid_transaction(self):
+        admission = self.make(rate=1, scene_priorities={"vip_scene": -1})
+        self.assertEqual(admission.priority_for("main", "waiting_order_id"), 0)
+        self.assertEqual(admission.priority_for("main", ""), 1)
+        self.assertEqual(admission.priority_for("vip_scene", ""), -1)
+
+
+class TestOverload(unittest.TestCase):
+    """上游只能并发处理 2 个请求（每个 20ms），16 个并发会话同时打进来"""
+
+    SESSIONS = 16
+    TURNS = 8
+
+    def run_load(self, admission):
+        server = StubChatClient(lambda messages: "default", first_token_latency=0.02, capacity=2)
+        llm = LLMClient(api_key="test", client=server, metrics=MetricsRegistry())
+        program = compile_program(SCRIPT)
+        latencies, shed = [], []
+
+        def session(index):
+            interpreter = DSLInterpreter(llm, SessionStateManager(ephemeral=True),
+                                         metrics=MetricsRegistry(), admission=admission)
+            interpreter.set_program(program)
+            for _ in range(self.TURNS):
+                t_start = time.perf_counter()
+                interpreter.execute("随便聊聊", f"s{index}")
+                latencies.append(time.perf_counter() - t_start)
+                shed.append(interpreter.last_turn["shed"])
+
+        threads = [threading.Thread(target=session, args=(i,)) for i in range(self.SESSIONS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        latencies.sort()
+        return latencies[int(len(latencies) * 0.99)], sum(shed)
+
+    def test_p99_stable_under_overload(self):
+        p99_unlimited, _ = self.run_load(None)
+        admission = AdmissionController(rate=80, burst=2, max_wait=0.05, metrics=MetricsRegistry())
+        p99_admitted, shed = self.run_load(admission)
+
+        self.assertGreater(shed, 0)
+        self.assertLess(p99_admitted, p99_unlimited)
+        # 等待预算 50ms + 上游 20ms，再给调度留出余量
+        self.assertLess(p99_admitted, 0.2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# tests/test_batch_runner.py
+import unittest
+import json
+import shutil
+from pathlib import Path
+from batch_runner import BatchRunner
+from smart_main import SmartDSLAgent
+from tests.test_stubs import MockLLMClient
+
+class TestBatchRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path("tests/temp_batch")
+        self.test_dir.mkdir(parents=True, exist_ok=True)
+        self.sessions_dir = self.test_dir / "sessions"
+        config_path = self.test_dir / "config.yaml"
+        config_path.write_text(f"session:\n  persistence_dir: {self.sessions_dir}\n", encoding='utf-8')
+        self.agent = SmartDSLAgent(str(config_path), llm_client=MockLLMClient())
+        self.agent.load_script("examples/ecommerce.dsl")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_sessions_keep_turn_order(self):
+        """测试并发处理时每个会话的多轮顺序不变，且不写会话文件"""
+        in_path = self.test_dir / "in.jsonl"
+        out_path = self.test_dir / "out.jsonl"
+        with open(in_path, 'w', encoding='utf-8') as f:
+            for turn in ["我要查价格", "袜子"]:
+                for i in range(20):
+                    f.write(json.dumps({"session_id": f"u{i}", "input": turn}, ensure_ascii=False) + "\n")
+            f.write("not json\n")
+
+        stats = BatchRunner(self.agent, workers=3).run(str(in_path), str(out_path))
+        self.assertEqual(stats["processed"], 40)
+        self.assertEqual(stats["invalid"], 1)
+
+        results = [json.loads(line) for line in out_path.read_text(encoding='utf-8').splitlines()]
+        by_session = {}
+        for r in sorted(results, key=lambda r: r["seq"]):
+            by_session.setdefault(r["session_id"], []).append(r)
+        for turns in by_session.values():
+            self.assertEqual([t["tier"] for t in turns], ["rule", "expect"])
+            self.assertEqual(turns[1]["intent"], "provide_product_name_price")
+            self.assertIn("袜子", turns[1]["response"])
+            self.assertIn("latency_ms", turns[1])
+            self.assertFalse(turns[1]["state_reset"])
+
+        self.assertEqual(list(self.sessions_dir.glob("*")), [])
+
+    def test_evicted_sessions_are_reported(self):
+        """测试超出每个 worker 的会话上限时计入丢弃次数，被丢弃会话的下一条结果标记 state_reset"""
+        in_path = self.test_dir / "in.jsonl"
+        out_path = self.test_dir / "out.jsonl"
+        with open(in_path, 'w', encoding='utf-8') as f:
+            for turn in ["我要查价格", "袜子"]:
+                for i in range(3):
+                    f.write(json.dumps({"session_id": f"u{i}", "input": turn}, ensure_ascii=False) + "\n")
+
+        stats = BatchRunner(self.agent, workers=1, max_sessions_per_worker=2).run(str(in_path), str(out_path))
+        self.assertEqual(stats["evicted"], 4)
+
+        results = sorted((json.loads(line) for line in out_path.read_text(encoding='utf-8').splitlines()),
+                         key=lambda r: r["seq"])
+        self.assertEqual([r["state_reset"] for r in results], [False] * 3 + [True] * 3)
+        # 丢弃后从空状态开始：不再处于等待商品名的步骤，"袜子" 不走 expect
+        self.assertNotEqual(results[3]["tier"], "expect")
+
+if __name__ == '__main__':
+    unittest.main()
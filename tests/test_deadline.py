@@ -0,0 +1,77 @@
+# tests/test_deadline.py
+import time
+import unittest
+from dsl_program import compile_program
+from interpreter import DSLInterpreter
+from llm_client import LLMClient
+from state_manager import SessionStateManager
+from utils.metrics import MetricsRegistry
+from tests.test_stubs import StubChatClient
+
+SCRIPT = """
+scene main {
+    intent faq_shipping {
+        reply "一般 48 小时内发货。"
+    }
+    intent default {
+        reply "兜底回复"
+    }
+}
+"""
+
+class TestTurnDeadline(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubChatClient(lambda messages: "faq_shipping", first_token_latency=0.01)
+        self.metrics = MetricsRegistry()
+        self.interpreter = DSLInterpreter(
+            LLMClient(api_key="test", client=self.server, metrics=self.metrics),
+            SessionStateManager(ephemeral=True), metrics=self.metrics)
+        self.interpreter.set_program(compile_program(SCRIPT))
+
+    def turn(self, user_input="什么时候发货", session_id="u1"):
+        t_start = time.perf_counter()
+        response = self.interpreter.execute(user_input, session_id)
+        return response, time.perf_counter() - t_start
+
+    def test_slow_llm_degrades_to_default_within_budget(self):
+        self.server.first_token_latency = 0.5
+        self.interpreter.turn_deadline = 0.1
+        response, elapsed = self.turn()
+        self.assertEqual(response, "兜底回复")
+        self.assertLess(elapsed, 0.3)
+        self.assertEqual(self.interpreter.last_turn["degraded"], "deadline")
+        self.assertEqual(self.interpreter.last_turn["deadline"], 0.1)
+        self.assertEqual(self.metrics.counter("llm_requests_total").get("glm-4", "timeout"), 1)
+        self.assertEqual(self.metrics.counter("dsl_turn_degraded_total").get("deadline"), 1)
+
+    def test_degrades_to_cached_result(self):
+        self.interpreter.turn_deadline = 1.0
+        self.turn(session_id="warm")
+        self.assertEqual(self.interpreter.last_turn["tier"], "llm")
+
+        self.server.first_token_latency = 0.5
+        self.interpreter.turn_deadline = 0.05
+        response, _ = self.turn(session_id="cold")
+        self.assertEqual(response, "一般 48 小时内发货。")
+        self.assertEqual(self.interpreter.last_turn["tier"], "cache")
+        self.assertEqual(self.interpreter.last_turn["degraded"], "deadline")
+
+    def test_scene_deadline_overrides_global(self):
+        self.interpreter.turn_deadline = 5.0
+        self.interpreter.scene_deadlines = {"main": 0}
+        response, _ = self.turn()
+        self.assertEqual(response, "兜底回复")
+        self.assertEqual(self.server.requests, []) # 预算已耗尽，不再发起请求
+
+    def test_streaming_respects_remaining_budget(self):
+        self.interpreter.llm_client.config.stream_intent = True
+        self.server.first_token_latency = 0.02
+        self.server.token_latency = 0.2
+        self.interpreter.turn_deadline = 0.1
+        response, elapsed = self.turn()
+        self.assertEqual(response, "兜底回复")
+        self.assertLess(elapsed, 0.4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# tests/test_decision_log.py
+import gzip
+import shutil
+import time
+import unittest
+from pathlib import Path
+from decision_log import DecisionLog, read_decisions
+from smart_main import SmartDSLAgent
+from utils.metrics import MetricsRegistry
+from tests.test_stubs import MockLLMClient
+
+class TestDecisionLog(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path("tests/temp_decisions")
+        self.log_dir = self.test_dir / "decisions"
+        self.logs = []
+
+    def tearDown(self):
+        for log in self.logs:
+            log.close()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def make_log(self, **kwargs):
+        log = DecisionLog(str(self.log_dir), metrics=MetricsRegistry(), **kwargs)
+        self.logs.append(log)
+        return log
+
+    def test_agent_turns_recorded(self):
+        """测试开启后每轮记录场景、候选意图、解析层级、最终意图、耗时与回复"""
+        self.test_dir.mkdir(parents=True, exist_ok=True)
+        config_path = self.test_dir / "config.yaml"
+        config_path.write_text(
+            f"session:\n  persistence_dir: {self.test_dir / 'sessions'}\n"
+            f"decision_log:\n  dir: {self.log_dir}\n  flush_interval: 0.05\n", encoding='utf-8')
+        agent = SmartDSLAgent(str(config_path), llm_client=MockLLMClient())
+        self.logs.append(agent.interpreter.decision_log)
+        agent.load_script("examples/ecommerce.dsl")
+        agent.process_input("我要查价格", "u1")
+        response = agent.process_input("袜子", "u1")
+        agent.interpreter.decision_log.close()
+
+        records = list(read_decisions(str(self.log_dir)))
+        self.assertEqual([(r["input"], r["tier"], r["intent"]) for r in records],
+                         [("我要查价格", "rule", "query_product"),
+                          ("袜子", "expect", "provide_product_name_price")])
+        last = records[-1]
+        self.assertEqual((last["session_id"], last["scene"], last["response"]), ("u1", "main", response))
+        self.assertIn("query_order", last["candidates"])
+        self.assertGreater(last["latency_ms"], 0)
+        self.assertIsNone(last["degraded"])
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(DecisionLog.from_config(None))
+        self.assertIsNone(DecisionLog.from_config({"enabled": False}))
+
+    def test_rotation_and_retention(self):
+        log = self.make_log(batch_size=50, flush_interval=0.01, segment_bytes=2048, keep_segments=3)
+        for i in range(2000):
+            log.record({"n": i, "input": f"第 {i} 句"})
+            if i % 200 == 0:
+                log.flush()
+        log.close()
+
+        segments = sorted(self.log_dir.glob("decisions-*.jsonl.gz"))
+        self.assertEqual(len(segments), 3)
+        self.assertEqual(log.written, 2000)
+        numbers = [r["n"] for r in read_decisions(str(self.log_dir))]
+        self.assertEqual(numbers[-1], 1999)
+        self.assertEqual(numbers, sorted(numbers))
+
+    def test_overflow_drops_and_counts(self):
+        """测试缓冲区满时丢弃新记录并计数，入队本身不阻塞"""
+        log = self.make_log(max_buffer=100, batch_size=10000, flush_interval=60)
+        t_start = time.perf_counter()
+        accepted = sum(log.record({"n": i}) for i in range(1000))
+        self.assertLess(time.perf_counter() - t_start, 0.1)
+        self.assertEqual((accepted, log.dropped), (100, 900))
+        log.close()
+        self.assertEqual(len(list(read_decisions(str(self.log_dir)))), 100)
+        self.assertEqual(log.metrics.counter("decision_log_records_total").get("written"), 100)
+
+    def test_truncated_segment_keeps_complete_batches(self):
+        log = self.make_log(batch_size=10, flush_interval=0.01, compress=True)
+        for i in range(10):
+            log.record({"n": i})
+        log.flush()
+        log.close()
+        segment = next(self.log_dir.glob("*.jsonl.gz"))
+        segment.write_bytes(segment.read_bytes() + gzip.compress(b'{"n": 10}\n' * 50)[:30])
+        self.assertEqual([r["n"] for r in read_decisions(str(self.log_dir))], list(range(10)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+# tests/test_dsl_modules.py
+import os
+import shutil
+import unittest
+from pathlib import Path
+from dsl_modules import ModuleLoader
+from dsl_parser import SimpleDSLParser
+from dsl_program import compile_program
+from smart_main import SmartDSLAgent
+from tests.test_stubs import MockLLMClient
+
+ENTRY = """
+include "shop.dsl"
+import "shared/support.dsl"
+
+scene main {
+    intent select_ecommerce {
+        reply "进入电商"
+        goto shop
+    }
+}
+"""
+
+SHOP = """
+include "shared/support.dsl"
+
+scene shop {
+    intent query_product {
+        reply "查什么商品？"
+    }
+    intent contact_human {
+        reply "转人工"
+        goto support
+    }
+}
+"""
+
+SUPPORT = """
+scene support {
+    intent main_menu {
+        reply "返回主菜单"
+        goto main
+    }
+}
+"""
+
+
+class TestModuleLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path("tests/temp_modules")
+        (self.test_dir / "shared").mkdir(parents=True, exist_ok=True)
+        self.write("main.dsl", ENTRY)
+        self.write("shop.dsl", SHOP)
+        self.write("shared/support.dsl", SUPPORT)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def write(self, name: str, content: str):
+        path = self.test_dir / name
+        path.write_text(content, encoding='utf-8')
+        # 保证同一秒内的修改也能改变签名
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+    def test_parse_includes_only_at_top_level(self):
+        source = 'include "a.dsl"\nscene main {\n intent x {\n reply "include \\"b.dsl\\""\n }\n}\nimport \'c.dsl\''
+        self.assertEqual(SimpleDSLParser.parse_includes(source), ["a.dsl", "c.dsl"])
+
+    def test_load_resolves_graph_and_cross_file_goto(self):
+        loader = ModuleLoader(workers=1)
+        program = loader.load(str(self.test_dir / "main.dsl"))
+
+        self.assertEqual(list(program.scenes), ["main", "shop", "support"])
+        self.assertEqual(program.entry_scene, "main")
+        self.assertTrue(program.has_target("support"))
+        entry = os.path.abspath(self.test_dir / "main.dsl")
+        support = os.path.abspath(self.test_dir / "shared/support.dsl")
+        self.assertEqual(loader.graph[entry], [os.path.abspath(self.test_dir / "shop.dsl"), support])
+        self.assertEqual(len(loader.modules_of(str(self.test_dir / "main.dsl"))), 3)
+
+    def test_only_changed_files_are_reparsed(self):
+        loader = ModuleLoader(workers=1)
+        v1 = loader.load(str(self.test_dir / "main.dsl"))
+        self.write("shop.dsl", SHOP.replace("查什么商品？", "请问查什么商品？"))
+        v2 = loader.load(str(self.test_dir / "main.dsl"), previous=v1)
+
+        self.assertEqual(loader.last_parsed, [os.path.abspath(self.test_dir / "shop.dsl")])
+        self.assertEqual(v2.version, 2)
+        self.assertEqual(v2.changed_scenes, ["shop"])
+        self.assertIs(v2.scenes["support"], v1.scenes["support"])
+
+        # 只改了修改时间、内容不变时不重新解析
+        self.write("shop.dsl", SHOP.replace("查什么商品？", "请问查什么商品？"))
+        loader.load(str(self.test_dir / "main.dsl"))
+        self.assertEqual(loader.last_parsed, [])
+
+    def test_parallel_parse_matches_serial(self):
+        serial = ModuleLoader(workers=1).load(str(self.test_dir / "main.dsl"))
+        parallel = ModuleLoader(workers=2, parallel_threshold=1).load(str(self.test_dir / "main.dsl"))
+        self.assertEqual(parallel.script, serial.script)
+        self.assertEqual(parallel.scene_digests, serial.scene_digests)
+
+    def test_errors_detected_at_load_time(self):
+        self.write("shared/support.dsl", SUPPORT.replace("goto main", "goto checkout"))
+        with self.assertRaisesRegex(ValueError, "support.main_menu -> checkout"):
+            ModuleLoader(workers=1).load(str(self.test_dir / "main.dsl"))
+
+        self.write("shared/support.dsl", 'include "../main.dsl"\n' + SUPPORT)
+        with self.assertRaisesRegex(ValueError, "循环 include"):
+            ModuleLoader(workers=1).load(str(self.test_dir / "main.dsl"))
+
+        self.write("shared/support.dsl", SUPPORT.replace("scene support", "scene shop"))
+        with self.assertRaisesRegex(ValueError, "重复定义"):
+            ModuleLoader(workers=1).load(str(self.test_dir / "main.dsl"))
+
+        self.write("shop.dsl", 'include "missing.dsl"\n' + SHOP)
+        with self.assertRaises(FileNotFoundError):
+            ModuleLoader(workers=1).load(str(self.test_dir / "main.dsl"))
+
+    def test_example_matches_single_file_version(self):
+        modular = ModuleLoader(workers=1).load("examples/modules/main.dsl")
+        single = compile_program(Path("examples/multi_business.dsl").read_text(encoding='utf-8'))
+        self.assertEqual(modular.script, single.script)
+
+
+class TestAgentModules(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path("tests/temp_agent_modules")
+        shutil.copytree("examples/modules", self.test_dir / "modules")
+        config_path = self.test_dir / "config.yaml"
+        config_path.write_text(
+            f"session:\n  persistence_dir: {self.test_dir / 'sessions'}\n", encoding='utf-8')
+        self.agent = SmartDSLAgent(str(config_path), llm_client=MockLLMClient())
+        self.agent.load_script(str(self.test_dir / "modules" / "main.dsl"))
+
+    def tearDown(self):
+        self.agent.disable_hot_reload()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_included_file_change_triggers_reload(self):
+        self.assertEqual(len(self.agent.script_modules["main"]), 4)
+        self.agent.enable_hot_reload(interval=60)
+        travel = self.test_dir / "modules" / "travel.dsl"
+        travel.write_text(travel.read_text(encoding='utf-8').replace("请问飞往哪里？", "目的地是？"),
+                          encoding='utf-8')
+        st = os.stat(travel)
+        os.utime(travel, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+        self.agent._watcher.check_once()
+
+        self.assertEqual(self.agent.last_reload["version"], 2)
+        self.assertEqual(self.agent.last_reload["changed_scenes"], ["travel_scene"])
+        self.assertIs(self.agent.interpreter.program, self.agent.programs["main"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -46,5 +46,24 @@ class TestDSLParser(unittest.TestCase):
         self.assertEqual(price_intent['statements'][1]['variable'], 'step')
         self.assertEqual(price_intent['statements'][1]['value'], 'done')
 
+    def test_scene_directives(self):
+        """测试场景级 expect / escape 声明"""
+        result = self.parser.parse("""
+        scene main {
+            escape "主菜单", '退出'
+            expect "waiting_order_id" -> check_price as digits
+            expect "waiting_code" -> check_price matching "^[A-Z]{2}"
+            intent check_price {
+                reply "ok"
+            }
+        }
+        """)
+        scene = result['scenes'][0]
+        self.assertEqual(scene['escapes'], ['主菜单', '退出'])
+        self.assertEqual(scene['expects'][0]['step'], 'waiting_order_id')
+        self.assertEqual(scene['expects'][0]['intent'], 'check_price')
+        self.assertEqual(scene['expects'][0]['value_type'], 'digits')
+        self.assertEqual(scene['expects'][1]['pattern'], '^[A-Z]{2}')
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
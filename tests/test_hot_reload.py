@@ -0,0 +1,83 @@
+# tests/test_hot_reload.py
+import unittest
+import shutil
+from pathlib import Path
+from dsl_program import compile_program
+from smart_main import SmartDSLAgent
+from tests.test_stubs import MockLLMClient
+
+SCRIPT_V1 = """
+scene main {
+    intent greeting {
+        reply "Hello"
+    }
+    intent query_product {
+        reply "What product?"
+        goto shop
+    }
+}
+scene shop {
+    intent query_order {
+        reply "Order id?"
+    }
+}
+"""
+
+class TestIncrementalCompile(unittest.TestCase):
+
+    def test_unchanged_scenes_are_reused(self):
+        """测试增量编译只重新解析改动过的场景"""
+        v1 = compile_program(SCRIPT_V1)
+        v2 = compile_program(SCRIPT_V1.replace('"Order id?"', '"订单号？"'), previous=v1)
+
+        self.assertEqual(v2.version, 2)
+        self.assertEqual(v2.changed_scenes, ["shop"])
+        self.assertIs(v2.scenes["main"], v1.scenes["main"])
+        self.assertEqual(v2.intents["query_order"]["statements"][0]["message"], "订单号？")
+
+    def test_comment_only_change(self):
+        """测试仅修改注释不触发重新解析"""
+        v1 = compile_program(SCRIPT_V1)
+        v2 = compile_program(SCRIPT_V1.replace('reply "Hello"', 'reply "Hello" # 问候'), previous=v1)
+        self.assertEqual(v2.changed_scenes, [])
+
+
+class TestAgentHotReload(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path("tests/temp_reload")
+        self.test_dir.mkdir(parents=True, exist_ok=True)
+        config_path = self.test_dir / "config.yaml"
+        config_path.write_text(
+            f"session:\n  persistence_dir: {self.test_dir / 'sessions'}\n", encoding='utf-8')
+        self.script_path = self.test_dir / "shop.dsl"
+        self.script_path.write_text(SCRIPT_V1, encoding='utf-8')
+
+        self.agent = SmartDSLAgent(str(config_path), llm_client=MockLLMClient())
+        self.agent.load_script(str(self.script_path))
+
+    def tearDown(self):
+        self.agent.disable_hot_reload()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_reload_swaps_program_and_remaps_sessions(self):
+        """测试热更新切换程序，已删除场景中的会话被重置到入口场景"""
+        self.agent.process_input("我要查价格", "s1")
+        self.assertEqual(self.agent.state_manager.get_state("s1")["current_scene"], "shop")
+
+        # 删除 shop 场景，并通过监视器触发热更新
+        self.agent.enable_hot_reload(interval=60)
+        self.script_path.write_text(SCRIPT_V1.split("scene shop")[0] + "\n# v2\n", encoding='utf-8')
+        self.agent._watcher.check_once()
+
+        self.assertEqual(self.agent.last_reload["version"], 2)
+        self.assertEqual(self.agent.last_reload["changed_scenes"], [])
+        self.assertGreater(self.agent.last_reload["seconds"], 0)
+        self.assertIs(self.agent.interpreter.program, self.agent.programs["shop"])
+
+        response = self.agent.process_input("查订单", "s1")
+        self.assertNotEqual(response, "Order id?")
+        self.assertEqual(self.agent.state_manager.get_state("s1")["current_scene"], "main")
+
+if __name__ == '__main__':
+    unittest.main()
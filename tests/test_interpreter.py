@@ -1,7 +1,14 @@
 # tests/test_interpreter.py
+import re
+import shutil
+import threading
+import time
 import unittest
-from interpreter import DSLInterpreter
+from pathlib import Path
+from dsl_program import compile_program
+from interpreter import DSLInterpreter, merge_turn_state
 from state_manager import SessionStateManager
+from utils.metrics import MetricsRegistry
 from tests.test_stubs import MockLLMClient # 导入桩
 
 class TestInterpreterFlow(unittest.TestCase):
@@ -54,6 +61,10 @@ class TestInterpreterFlow(unittest.TestCase):
         self.session_id = "test_session_001"
         self.state_manager.clear_session(self.session_id) # 确保干净的开始
 
+    def tearDown(self):
+        # 会话文件按哈希分两级目录存放，整个临时目录一起删除
+        shutil.rmtree("tests/temp_sessions", ignore_errors=True)
+
     def test_rule_match_flow(self):
         """测试层级1：规则匹配 (查价格)"""
         # 桩中定义了 "查价格" -> query_product
@@ -93,5 +104,219 @@ class TestInterpreterFlow(unittest.TestCase):
         # 或者在我们的实现中，validate 失败返回 None，然后 execute 尝试 default
         self.assertIn("Sorry", response) # Default response
 
+class TestExpectRouting(unittest.TestCase):
+    """expect 声明：槽位回答不经过 LLM"""
+
+    TRANSCRIPT = ["我要查价格", "袜子", "查订单", "123456", "查价格", "返回主菜单"]
+
+    def setUp(self):
+        self.source = Path("examples/ecommerce.dsl").read_text(encoding='utf-8')
+
+    def replay(self, source):
+        mock_llm = MockLLMClient()
+        interpreter = DSLInterpreter(mock_llm, SessionStateManager(ephemeral=True))
+        interpreter.set_program(compile_program(source))
+        tiers = []
+        for user_input in self.TRANSCRIPT:
+            interpreter.execute(user_input, "expect_user")
+            tiers.append(interpreter.last_turn["tier"])
+        llm_calls = sum(1 for call in mock_llm.call_history if call["method"] == "intelligent")
+        return tiers, llm_calls, interpreter
+
+    def test_llm_calls_drop_on_slot_answers(self):
+        without_expect = re.sub(r'^\s*(expect|escape) .*$', '', self.source, flags=re.M)
+        _, baseline_calls, _ = self.replay(without_expect)
+        tiers, llm_calls, interpreter = self.replay(self.source)
+
+        self.assertEqual(tiers[:4], ["rule", "expect", "rule", "expect"])
+        self.assertEqual(baseline_calls - llm_calls, 2)
+        self.assertIn("袜子", interpreter.state.history[3]["content"])
+        # 逃逸关键词：等待商品名时说"返回主菜单"，不被当作商品名，按正常流程识别
+        self.assertNotEqual(tiers[-1], "expect")
+        self.assertNotEqual(interpreter.state.current_intent, "provide_product_name_price")
+
+    def test_type_guard_falls_back(self):
+        """订单号声明为 digits：非数字输入不走 expect"""
+        mock_llm = MockLLMClient()
+        interpreter = DSLInterpreter(mock_llm, SessionStateManager(ephemeral=True))
+        interpreter.set_program(compile_program(self.source))
+        interpreter.execute("查订单", "guard_user")
+        interpreter.execute("不知道", "guard_user")
+        self.assertNotEqual(interpreter.last_turn["tier"], "expect")
+        self.assertEqual(mock_llm.call_history[-1]["method"], "intelligent")
+
+    def test_unknown_expect_target_rejected(self):
+        with self.assertRaises(ValueError):
+            compile_program('scene main {\n expect "s" -> missing\n intent a {\n reply "x"\n }\n}')
+
+class TestTurnPipeline(unittest.TestCase):
+    """分阶段流水线：每个意图每轮至多执行一次，validate 失败直接进入下一层级"""
+
+    SCRIPT = """
+scene main {
+    intent query_order {
+        api_call lookup_order(user_input)
+        set order_checked = "yes"
+        validate current_step == "waiting_order"
+        reply "订单已查询"
+        goto order_scene
+    }
+    intent default {
+        reply "兜底回复"
+    }
+}
+scene order_scene {
+    intent default {
+        reply "订单场景"
+    }
+}
+"""
+
+    def setUp(self):
+        self.mock_llm = MockLLMClient()
+        self.interpreter = DSLInterpreter(self.mock_llm, SessionStateManager(ephemeral=True))
+        self.interpreter.set_program(compile_program(self.SCRIPT))
+        self.runs = []
+        run_intent = self.interpreter._run_intent
+        def counting_run(state, intent_name, user_input, program):
+            self.runs.append(intent_name)
+            return run_intent(state, intent_name, user_input, program)
+        self.interpreter._run_intent = counting_run
+
+    def test_rejected_intent_runs_once(self):
+        # 规则命中 query_order 但 validate 失败；LLM 层同样给出 query_order，不再重复执行
+        response = self.interpreter.execute("查订单", "p1")
+        self.assertEqual(response, "兜底回复")
+        self.assertEqual(self.runs, ["query_order", "default"])
+        self.assertEqual(self.interpreter.last_turn["tier"], "default")
+        methods = [call["method"] for call in self.mock_llm.call_history]
+        self.assertEqual(methods, ["fallback", "intelligent"])
+
+    def test_rejected_intent_leaves_no_side_effects(self):
+        self.interpreter.execute("查订单", "p1")
+        state = self.interpreter.state
+        self.assertNotIn("order_checked", state.variables)
+        self.assertEqual(state.variables["result"], "")
+        self.assertEqual(state.current_scene, "main")
+        self.assertEqual(state.current_intent, "default")
+
+    def test_stages_and_tiers_are_pluggable(self):
+        from interpreter import Recognition
+        seen = []
+        self.interpreter.recognizers.insert(0, ("vip", lambda ctx: Recognition("default", "vip")))
+        self.interpreter.stages = [(name, stage) for name, stage in self.interpreter.stages
+                                   if name != "persist"]
+        self.interpreter.stages.insert(-1, ("audit", lambda ctx: seen.append(ctx.tier)))
+        response = self.interpreter.execute("查订单", "p2")
+        self.assertEqual(response, "兜底回复")
+        self.assertEqual(seen, ["vip"])
+        self.assertEqual(self.mock_llm.call_history, [])
+        self.assertIn("audit", self.interpreter.last_turn["phases"])
+        self.assertNotIn("history", self.interpreter.state_manager.get_state("p2")) # 未持久化
+
+
+class TestOptimisticConcurrency(unittest.TestCase):
+    """同一会话的并发轮次：读取时记下版本，提交时 compare-and-set，冲突后合并或重跑"""
+
+    def setUp(self):
+        self.test_dir = Path("tests/temp_concurrency")
+        self.program = compile_program(Path("examples/ecommerce.dsl").read_text(encoding="utf-8"))
+        self.metrics = MetricsRegistry()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def make_interpreter(self, manager):
+        interpreter = DSLInterpreter(MockLLMClient(), manager, metrics=self.metrics)
+        interpreter.set_program(self.program)
+        return interpreter
+
+    def interleaved_turn(self, policy):
+        """A 读取会话后、提交前，B 完成一轮并提交"""
+        manager = SessionStateManager(ephemeral=True)
+        a, b = self.make_interpreter(manager), self.make_interpreter(manager)
+        a.conflict_policy = policy
+        pending = ["查订单"]
+        def race(ctx):
+            if pending:
+                b.execute(pending.pop(), "u1")
+        a.stages.insert(-1, ("race", race))
+        response = a.execute("我要查价格", "u1")
+        return manager.get_state("u1"), response
+
+    def test_conflicting_turns_are_merged(self):
+        state, response = self.interleaved_turn("merge")
+        self.assertEqual([m["content"] for m in state["history"]],
+                         ["查订单", "请提供您的订单号：", "我要查价格", response])
+        self.assertEqual(state["variables"]["current_step"], "waiting_product_name_price")
+        self.assertEqual(state["last_response"], response)
+        self.assertEqual(self.metrics.counter("dsl_commit_conflicts_total").get("merged"), 1)
+
+    def test_retry_policy_reruns_turn_on_latest_state(self):
+        state, response = self.interleaved_turn("retry")
+        self.assertEqual(len(state["history"]), 4)
+        self.assertEqual(state["history"][2]["content"], "我要查价格")
+        self.assertEqual(self.metrics.counter("dsl_commit_conflicts_total").get("retried"), 1)
+
+    def test_merge_appends_history_past_limit(self):
+        base = {"history": [{"n": i} for i in range(20)], "variables": {"a": 1, "b": 1}, "scene": "x"}
+        ours = {"history": base["history"][2:] + [{"n": "ours1"}, {"n": "ours2"}],
+                "variables": {"a": 2, "b": 1}, "scene": "x"}
+        theirs = {"history": base["history"][1:] + [{"n": "theirs"}], "variables": {"a": 1, "b": 3}, "scene": "y"}
+        merged = merge_turn_state(base, ours, theirs)
+        self.assertEqual([h["n"] for h in merged["history"][-3:]], ["theirs", "ours1", "ours2"])
+        self.assertEqual(len(merged["history"]), 20)
+        self.assertEqual((merged["variables"], merged["scene"]), ({"a": 2, "b": 3}, "y"))
+
+    def test_concurrent_turns_lose_no_updates(self):
+        """压力测试：多线程、两个共享目录的管理器（模拟多个进程）并发处理同一批会话，不丢失任何一轮"""
+        managers = [SessionStateManager(persistence_dir=str(self.test_dir), metrics=self.metrics)
+                    for _ in range(2)]
+        threads, sessions, turns = 4, 3, 6 # 每个会话 8 轮，历史不超过上限
+        inputs = ["我要查价格", "袜子", "查订单", "123456"]
+
+        def worker(index):
+            interpreter = self.make_interpreter(managers[index % 2])
+            # 提交前让出 CPU，制造并发冲突
+            interpreter.stages.insert(-1, ("yield", lambda ctx: time.sleep(0.002)))
+            for turn in range(turns):
+                interpreter.execute(inputs[(index + turn) % len(inputs)], f"s{(index + turn) % sessions}")
+
+        pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+
+        reader = SessionStateManager(persistence_dir=str(self.test_dir))
+        per_session = threads * turns // sessions
+        for i in range(sessions):
+            self.assertEqual(len(reader.get_state(f"s{i}")["history"]), 2 * per_session)
+        conflicts = self.metrics.counter("dsl_commit_conflicts_total").get("merged")
+        self.assertGreater(conflicts, 0)
+        self.assertEqual(self.metrics.counter("dsl_commit_conflicts_total").get("failed"), 0)
+
+    def test_shared_interpreter_isolates_sessions(self):
+        """多个线程共用一个解释器处理各自的会话：每轮的对话状态互不共享，历史中不出现其他会话的消息"""
+        interpreter = self.make_interpreter(SessionStateManager(ephemeral=True))
+        interpreter.stages.insert(-1, ("yield", lambda ctx: time.sleep(0.001)))
+        inputs = ["我要查价格", "袜子", "查订单", "123456"]
+
+        def worker(index):
+            for turn in range(20):
+                interpreter.execute(f"{inputs[turn % len(inputs)]} #{index}", f"iso{index}")
+
+        pool = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+
+        for i in range(8):
+            history = interpreter.state_manager.get_state(f"iso{i}")["history"]
+            user_messages = [m["content"] for m in history if m["role"] == "user"]
+            self.assertEqual(len(user_messages), 10)
+            self.assertTrue(all(m.endswith(f"#{i}") for m in user_messages), user_messages)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,153 @@
+# tests/test_llm_client.py
+import unittest
+import time
+import itertools
+from llm_client import CascadeTier, LLMClient, IntentTrie, parse_cascade
+from utils.metrics import MetricsRegistry
+from tests.test_stubs import StubChatClient
+
+INTENTS = ["query_product", "provide_product_name", "query_order", "provide_order_id"]
+
+class TestIntentTrie(unittest.TestCase):
+
+    def setUp(self):
+        tokens = {str(i): name for i, name in enumerate(INTENTS + ["default"] * 7, 1)}
+        tokens.update({name: name for name in INTENTS + ["default"]})
+        self.trie = IntentTrie(tokens)
+
+    def test_unique_prefix_resolves_early(self):
+        """测试前缀唯一时立即确定意图"""
+        self.assertEqual(self.trie.match("provide_p"), ("provide_product_name", True))
+        self.assertEqual(self.trie.match("'query_o"), ("query_order", True))
+        self.assertEqual(self.trie.match("query_"), (None, False))
+
+    def test_numeric_codes(self):
+        """测试数字编号：'1' 与 '10' 有歧义，遇到分隔符或结束时才确定"""
+        self.assertEqual(self.trie.match("1"), (None, False))
+        self.assertEqual(self.trie.match("1\n"), ("query_product", True))
+        self.assertEqual(self.trie.match("1", final=True), ("query_product", True))
+        self.assertEqual(self.trie.match("10"), ("default", True))
+
+    def test_off_candidate_output(self):
+        self.assertEqual(self.trie.match("根据对话"), (None, True))
+
+    def test_final_requires_complete_token(self):
+        """测试 final=True 时不按唯一前缀确定：输出必须是完整的候选词，或候选词后跟分隔符"""
+        trie = IntentTrie({name: name for name in ("greeting", "farewell", "query_order")})
+        self.assertEqual(trie.match("good morning", final=True), (None, True))
+        self.assertEqual(trie.match("farewell_extra", final=True), (None, True))
+        self.assertEqual(trie.match("query_orders please", final=True), (None, True))
+        self.assertEqual(trie.match("g", final=True), (None, True))
+        self.assertEqual(trie.match("greeting", final=True), ("greeting", True))
+        self.assertEqual(trie.match("farewell.", final=True), ("farewell", True))
+        self.assertEqual(trie.match("query_order please", final=True), ("query_order", True))
+        # 流式的中间结果仍按唯一前缀提前确定
+        self.assertEqual(trie.match("g"), ("greeting", True))
+
+
+class TestStreamingIntent(unittest.TestCase):
+
+    def make_client(self, stream: bool, answer: str = "provide_product_name"):
+        server = StubChatClient(lambda messages: answer, first_token_latency=0.01, token_latency=0.01)
+        client = LLMClient(api_key="test", client=server, stream_intent=stream, metrics=MetricsRegistry())
+        return client, server
+
+    def recognize(self, client):
+        return client.intelligent_intent_recognition("袜子", INTENTS, [])
+
+    def test_stream_stops_at_unique_prefix(self):
+        """测试流式识别在前缀唯一时关闭流，比等待完整输出更快"""
+        full_client, full_server = self.make_client(stream=False)
+        start = time.perf_counter()
+        self.assertEqual(self.recognize(full_client), "provide_product_name")
+        full_latency = time.perf_counter() - start
+
+        stream_client, stream_server = self.make_client(stream=True)
+        start = time.perf_counter()
+        self.assertEqual(self.recognize(stream_client), "provide_product_name")
+        stream_latency = time.perf_counter() - start
+
+        self.assertLess(stream_server.tokens_sent, full_server.tokens_sent)
+        self.assertLess(stream_latency, full_latency)
+        self.assertEqual(stream_client.metrics.histogram("llm_time_to_intent_seconds").count("glm-4"), 1)
+
+    def test_output_capped_and_codes_accepted(self):
+        """测试 max_tokens 按最长候选名封顶，且接受编号形式的回答"""
+        client, server = self.make_client(stream=True, answer="2")
+        self.assertEqual(self.recognize(client), "provide_order_id")  # 排序后第 2 个
+        self.assertEqual(server.requests[0]["max_tokens"], len("provide_product_name") + 2)
+
+
+class TestModelCascade(unittest.TestCase):
+    """小模型先答，低置信度或无效答案升级到大模型（替身服务按模型模拟不同时延）"""
+
+    def make_client(self, small_answers, cascade=None, scene_cascades=None, small_latency=0.01):
+        answers = itertools.cycle(small_answers)
+        server = StubChatClient(lambda messages: "query_product", models={
+            "glm-4-flash": {"responder": lambda messages: next(answers), "first_token_latency": small_latency},
+            "glm-4": {"first_token_latency": 0.15},
+        })
+        cascade = cascade or [CascadeTier("glm-4-flash", threshold=0.8), CascadeTier("glm-4")]
+        client = LLMClient(api_key="test", client=server, metrics=MetricsRegistry(),
+                           cascade=cascade, scene_cascades=scene_cascades)
+        return client, server
+
+    def recognize(self, client, **kwargs):
+        return client.intelligent_intent_recognition("袜子", INTENTS, [], **kwargs)
+
+    def outcomes(self, client, model):
+        counter = client.metrics.counter("llm_cascade_total")
+        return {o: counter.get(model, o) for o in ("accepted", "low_confidence", "invalid", "error")
+                if counter.get(model, o)}
+
+    def test_confident_small_model_answers_alone(self):
+        client, server = self.make_client(["provide_product_name|0.95"])
+        start = time.perf_counter()
+        self.assertEqual(self.recognize(client), "provide_product_name")
+        self.assertLess(time.perf_counter() - start, 0.1)
+        self.assertEqual([r["model"] for r in server.requests], ["glm-4-flash"])
+        self.assertEqual(self.outcomes(client, "glm-4-flash"), {"accepted": 1})
+
+    def test_low_confidence_and_invalid_escalate(self):
+        client, server = self.make_client(["provide_product_name|0.3", "我觉得是查价格|0.9"])
+        self.assertEqual(self.recognize(client), "query_product")
+        self.assertEqual(self.recognize(client), "query_product")
+        self.assertEqual([r["model"] for r in server.requests], ["glm-4-flash", "glm-4"] * 2)
+        self.assertEqual(self.outcomes(client, "glm-4-flash"), {"low_confidence": 1, "invalid": 1})
+        self.assertEqual(self.outcomes(client, "glm-4"), {"accepted": 2})
+        hist = client.metrics.histogram("llm_request_seconds")
+        self.assertEqual((hist.count("glm-4-flash"), hist.count("glm-4")), (2, 2))
+
+    def test_sample_agreement(self):
+        cascade = [CascadeTier("glm-4-flash", confidence="agreement"), CascadeTier("glm-4")]
+        client, server = self.make_client(["2"], cascade=cascade)
+        self.assertEqual(self.recognize(client), "provide_order_id")
+        self.assertEqual([(r["model"], r["temperature"]) for r in server.requests], [("glm-4-flash", 0.7)] * 2)
+
+        client, server = self.make_client(["2", "3"], cascade=cascade)
+        self.assertEqual(self.recognize(client), "query_product")
+        self.assertEqual(self.outcomes(client, "glm-4-flash"), {"low_confidence": 1})
+
+    def test_scene_override_and_shared_timeout(self):
+        client, server = self.make_client(["provide_product_name|0.95"],
+                                          scene_cascades={"service_scene": [CascadeTier("glm-4")]})
+        self.assertEqual(self.recognize(client, scene="service_scene"), "query_product")
+        self.assertEqual([r["model"] for r in server.requests], ["glm-4"])
+
+        # 小模型耗尽预算后不再升级，交由调用方降级
+        client, server = self.make_client(["provide_product_name|0.3"], small_latency=0.1)
+        self.assertIsNone(self.recognize(client, timeout=0.05))
+        self.assertEqual([r["model"] for r in server.requests], ["glm-4-flash"])
+
+    def test_parse_cascade_config(self):
+        tiers, scenes = parse_cascade({
+            "tiers": [{"model": "glm-4-flash", "confidence": "agreement", "samples": 3}, "glm-4"],
+            "scenes": {"service_scene": ["glm-4"]},
+        })
+        self.assertEqual(tiers, [CascadeTier("glm-4-flash", confidence="agreement", samples=3), CascadeTier("glm-4")])
+        self.assertEqual(scenes, {"service_scene": [CascadeTier("glm-4")]})
+        with self.assertRaises(ValueError):
+            parse_cascade({"tiers": [{"model": "x", "confidence": "vibes"}]})
+
+if __name__ == '__main__':
+    unittest.main()
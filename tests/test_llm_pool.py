@@ -0,0 +1,173 @@
+# tests/test_llm_pool.py
+import shutil
+import threading
+import time
+import unittest
+from pathlib import Path
+from llm_client import LLMClient
+from llm_pool import KeyPool, NoAvailableKey, PoolMember
+from smart_main import SmartDSLAgent
+from utils.metrics import MetricsRegistry
+from tests.test_stubs import StubChatClient, StubRateLimitError
+
+INTENTS = ["query_product", "provide_product_name", "query_order", "provide_order_id"]
+
+def endpoint(**kwargs) -> StubChatClient:
+    """一个本地替身端点，总是回答 query_product"""
+    return StubChatClient(lambda messages: "query_product", **kwargs)
+
+
+class FakeClock:
+    """手动推进的时钟，替代冷却与令牌桶中的等待；起点在当前 monotonic 之后，令牌桶创建时即为满桶"""
+
+    def __init__(self):
+        self.now = time.monotonic() + 1.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+class TestKeyPool(unittest.TestCase):
+
+    def make_pool(self, endpoints, weights=None, **kwargs):
+        weights = weights or [1] * len(endpoints)
+        members = [PoolMember(api_key=f"key-{name}", name=name, weight=weight, client=server)
+                   for (name, server), weight in zip(endpoints.items(), weights)]
+        return KeyPool(members, metrics=MetricsRegistry(), **kwargs)
+
+    def ask(self, pool, **kwargs):
+        return pool.chat.completions.create(model="glm-4", messages=[], **kwargs)
+
+    def test_weighted_round_robin_is_smooth(self):
+        servers = {"a": endpoint(), "b": endpoint()}
+        pool = self.make_pool(servers, weights=[3, 1], strategy="weighted_round_robin")
+        for _ in range(8):
+            self.ask(pool)
+        self.assertEqual((len(servers["a"].requests), len(servers["b"].requests)), (6, 2))
+        self.assertEqual(pool.metrics.counter("llm_key_requests_total").get("b", "ok"), 2)
+
+    def test_least_outstanding_prefers_faster_endpoint(self):
+        """测试并发时慢端点积压的在途请求多，更多请求被分到快端点"""
+        servers = {"slow": endpoint(first_token_latency=0.05), "fast": endpoint(first_token_latency=0.005)}
+        pool = self.make_pool(servers)
+        threads = [threading.Thread(target=lambda: [self.ask(pool) for _ in range(10)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreater(len(servers["fast"].requests), 2 * len(servers["slow"].requests))
+        self.assertEqual(pool.stats()["slow"]["outstanding"], 0)
+
+    def test_rate_limited_key_fails_over_and_cools_down(self):
+        """测试 429 时请求转给其他密钥，被限流的密钥冷却（按 Retry-After）后重新参与选择"""
+        clock = FakeClock()
+        servers = {"small": endpoint(rate_limit=1, retry_after=0.1, clock=clock), "large": endpoint()}
+        pool = self.make_pool(servers, strategy="weighted_round_robin", cooldown=5.0, clock=clock)
+        for _ in range(6):
+            self.ask(pool)
+        self.assertEqual(len(servers["small"].requests), 1)
+        self.assertEqual(servers["small"].rate_limited, 1)
+        self.assertEqual(len(servers["large"].requests), 5)
+        self.assertEqual(pool.metrics.counter("llm_key_cooldowns_total").get("small", "rate_limited"), 1)
+        self.assertGreater(pool.stats()["small"]["cooldown"], 0)
+
+        clock.advance(1.0) # 冷却结束，令牌桶补充 1 个令牌
+        for _ in range(2):
+            self.ask(pool)
+        self.assertEqual(len(servers["small"].requests), 2)
+
+    def test_errors_cool_down_after_threshold(self):
+        def broken(messages):
+            raise ConnectionError("upstream down")
+        servers = {"broken": StubChatClient(broken), "ok": endpoint()}
+        pool = self.make_pool(servers, strategy="weighted_round_robin", error_threshold=2, cooldown=60)
+        outcomes = []
+        for _ in range(8):
+            try:
+                self.ask(pool)
+                outcomes.append("ok")
+            except ConnectionError:
+                outcomes.append("error")
+        # 其他错误不换密钥重发，直接交给调用方；连续失败 2 次后该密钥不再被选中
+        self.assertEqual(outcomes.count("error"), 2)
+        self.assertEqual(pool.metrics.counter("llm_key_cooldowns_total").get("broken", "error"), 1)
+
+    def test_all_keys_cooling_degrades_to_default(self):
+        servers = {"a": endpoint(rate_limit=1), "b": endpoint(rate_limit=1)}
+        pool = self.make_pool(servers, cooldown=60)
+        self.ask(pool)
+        self.ask(pool)
+        with self.assertRaises(NoAvailableKey):
+            self.ask(pool)
+        client = LLMClient(api_key="unused", client=pool, metrics=MetricsRegistry())
+        self.assertEqual(client.intelligent_intent_recognition("我要查价格", INTENTS, []), "default")
+
+    def test_streams_release_key_on_close(self):
+        servers = {"a": endpoint(token_latency=0.001)}
+        pool = self.make_pool(servers)
+        client = LLMClient(api_key="unused", client=pool, stream_intent=True, metrics=MetricsRegistry())
+        self.assertEqual(client.intelligent_intent_recognition("我要查价格", INTENTS, []), "query_product")
+        self.assertEqual(pool.stats()["a"]["outstanding"], 0)
+        self.assertEqual(pool.metrics.counter("llm_key_requests_total").get("a", "ok"), 1)
+
+    def test_endpoints_with_different_rate_limits(self):
+        """测试多个速率配额不同的替身端点：并发请求数超过任一单个密钥的配额，负载分摊后没有请求失败"""
+        clock = FakeClock() # 时钟不走：每个密钥只有初始的突发配额，被限流的密钥一直冷却
+        servers = {"a": endpoint(rate_limit=20, first_token_latency=0.005, clock=clock),
+                   "b": endpoint(rate_limit=40, first_token_latency=0.005, clock=clock),
+                   "c": endpoint(rate_limit=40, first_token_latency=0.005, clock=clock)}
+        pool = self.make_pool(servers, weights=[1, 2, 2], cooldown=0.05, clock=clock)
+        client = LLMClient(api_key="unused", client=pool, metrics=MetricsRegistry())
+        results = []
+
+        def worker():
+            for _ in range(15):
+                results.append(client.intelligent_intent_recognition("我要查价格", INTENTS, []))
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["query_product"] * 60)
+        # 单个密钥最多 40 次，60 次请求全部成功说明负载分摊到了多个密钥
+        served = {name: len(server.requests) for name, server in servers.items()}
+        self.assertEqual(sum(served.values()), 60)
+        self.assertTrue(all(0 < served[name] <= limit for name, limit in (("a", 20), ("b", 40), ("c", 40))))
+
+    def test_timeout_shared_across_failover(self):
+        """测试换密钥重发共享同一个 timeout：429 返回时已经超时则抛出 TimeoutError，不再以 ≤0 的超时请求其他密钥"""
+        def slow_rate_limit(messages):
+            time.sleep(0.05)
+            raise StubRateLimitError()
+
+        servers = {"limited": StubChatClient(slow_rate_limit), "spare": endpoint()}
+        pool = self.make_pool(servers, strategy="weighted_round_robin")
+        with self.assertRaises(TimeoutError):
+            self.ask(pool, timeout=0.02)
+        self.assertEqual(servers["spare"].requests, [])
+        self.ask(pool, timeout=1.0) # limited 冷却中，直接使用 spare
+        self.assertEqual(len(servers["spare"].requests), 1)
+
+    def test_agent_builds_pool_from_config(self):
+        test_dir = Path("tests/temp_llm_pool")
+        self.addCleanup(shutil.rmtree, test_dir, True)
+        test_dir.mkdir(parents=True, exist_ok=True)
+        config_path = test_dir / "config.yaml"
+        config_path.write_text(
+            f"session:\n  persistence_dir: {test_dir / 'sessions'}\n"
+            "zhipuai:\n  key_pool:\n    strategy: weighted_round_robin\n    keys:\n"
+            "      - sk-primary-1111\n"
+            "      - {api_key: sk-backup-2222, base_url: 'http://127.0.0.1:9/v4', weight: 2, name: backup}\n",
+            encoding='utf-8')
+        agent = SmartDSLAgent(str(config_path))
+        pool = agent.llm_client._client
+        self.assertIsInstance(pool, KeyPool)
+        self.assertEqual([(m.name, m.weight) for m in pool.members], [("...1111", 1.0), ("backup", 2.0)])
+        self.assertEqual(pool.strategy, "weighted_round_robin")
+        self.assertIsNone(KeyPool.from_config({"strategy": "least_outstanding"}))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# tests/test_logger.py
+import unittest
+import json
+import logging
+import shutil
+from pathlib import Path
+from utils.logger import setup_logger, configure_logging, shutdown_logging, SamplingFilter
+
+class TestLoggingPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path("tests/temp_logs")
+        self.test_dir.mkdir(parents=True, exist_ok=True)
+
+    def tearDown(self):
+        configure_logging({})  # 恢复默认管线
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_json_lines_and_module_levels(self):
+        """测试 JSON-lines 输出与按模块设置级别"""
+        log_file = self.test_dir / "agent.jsonl"
+        configure_logging({
+            'console': False,
+            'json_file': str(log_file),
+            'modules': {'test_quiet_module': 'WARNING'},
+        })
+        loud = setup_logger("test_loud_module")
+        quiet = setup_logger("test_quiet_module")
+
+        loud.info("SET %s = %s", "product", "袜子")
+        quiet.info("不应输出")
+        quiet.warning("应输出")
+        shutdown_logging()  # 刷出后台队列
+
+        records = [json.loads(line) for line in log_file.read_text(encoding='utf-8').splitlines()]
+        self.assertEqual([r["msg"] for r in records], ["SET product = 袜子", "应输出"])
+        self.assertEqual(records[0]["logger"], "test_loud_module")
+
+    def test_logs_after_shutdown_are_written(self):
+        """测试 shutdown_logging 之后的日志直接写出，json_file 的目录不存在时自动创建"""
+        log_file = self.test_dir / "nested" / "agent.jsonl"
+        configure_logging({'console': False, 'json_file': str(log_file)})
+        logger = setup_logger("test_shutdown_module")
+        logger.info("关闭前")
+        shutdown_logging()
+        logger.info("关闭后")
+        shutdown_logging() # 重复调用无副作用
+
+        records = [json.loads(line) for line in log_file.read_text(encoding='utf-8').splitlines()]
+        self.assertEqual([r["msg"] for r in records], ["关闭前", "关闭后"])
+
+    def test_unknown_level_rejected(self):
+        with self.assertRaisesRegex(ValueError, "未知的日志级别: verbose"):
+            configure_logging({'level': 'verbose'})
+        with self.assertRaisesRegex(ValueError, "未知的日志级别"):
+            configure_logging({'modules': {'interpreter': 'LOUD'}})
+
+    def test_debug_sampling(self):
+        """测试 DEBUG 事件按 1/N 采样，INFO 不受影响"""
+        sampler = SamplingFilter(every_n=5)
+
+        def make(level):
+            return logging.LogRecord("x", level, __file__, 0, "msg", None, None)
+
+        kept = sum(sampler.filter(make(logging.DEBUG)) for _ in range(100))
+        self.assertEqual(kept, 20)
+        self.assertTrue(all(sampler.filter(make(logging.INFO)) for _ in range(10)))
+
+if __name__ == '__main__':
+    unittest.main()
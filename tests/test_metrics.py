@@ -0,0 +1,90 @@
+# tests/test_metrics.py
+import unittest
+import shutil
+from pathlib import Path
+from utils.metrics import MetricsRegistry
+from interpreter import DSLInterpreter
+from state_manager import SessionStateManager
+from tests.test_stubs import MockLLMClient
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_histogram_render(self):
+        """测试直方图的 Prometheus 文本导出（累计分桶）"""
+        registry = MetricsRegistry()
+        hist = registry.histogram("demo_seconds", "demo", ("phase",), buckets=(0.1, 1.0))
+        hist.observe(0.05, "rule")
+        hist.observe(0.5, "rule")
+        hist.observe(5.0, "rule")
+
+        text = registry.render_prometheus()
+        self.assertIn('demo_seconds_bucket{phase="rule",le="0.1"} 1', text)
+        self.assertIn('demo_seconds_bucket{phase="rule",le="1"} 2', text)
+        self.assertIn('demo_seconds_bucket{phase="rule",le="+Inf"} 3', text)
+        self.assertIn('demo_seconds_count{phase="rule"} 3', text)
+
+    def test_sink_errors_are_isolated(self):
+        """测试 sink 抛异常不影响其他 sink"""
+        registry = MetricsRegistry()
+        received = []
+
+        def bad_sink(record):
+            raise RuntimeError("boom")
+
+        registry.add_sink(bad_sink)
+        registry.add_sink(received.append)
+        registry.publish({"tier": "rule"})
+        self.assertEqual(received, [{"tier": "rule"}])
+
+
+class TestInterpreterMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "tests/temp_metrics"
+        self.registry = MetricsRegistry()
+        self.state_manager = SessionStateManager(persistence_dir=self.test_dir, metrics=self.registry)
+        self.interpreter = DSLInterpreter(MockLLMClient(), self.state_manager, metrics=self.registry)
+        self.interpreter.set_current_script({
+            'type': 'script',
+            'scenes': [{
+                'name': 'main',
+                'intents': [
+                    {'name': 'query_product', 'statements': [{'type': 'reply', 'message': 'What product?'}]},
+                    {'name': 'default', 'statements': [{'type': 'reply', 'message': 'Sorry?'}]}
+                ]
+            }]
+        })
+
+    def tearDown(self):
+        if Path(self.test_dir).exists():
+            shutil.rmtree(self.test_dir)
+
+    def test_turn_phases_and_tier(self):
+        """测试每轮记录阶段耗时与解析层级"""
+        turns = []
+        self.registry.add_sink(turns.append)
+
+        self.interpreter.execute("我要查价格", "s1")
+        self.interpreter.execute("飞机几点飞", "s1")
+
+        self.assertEqual([t["tier"] for t in turns], ["rule", "default"])
+        stages = {"load", "recognize", "resolve", "execute", "render", "persist"}
+        self.assertEqual(set(turns[0]["phases"]), stages)
+        self.assertEqual(set(turns[1]["phases"]), stages | {"llm"}) # 规则未命中才调用 LLM
+
+        tiers = self.registry.counter("dsl_intent_tier_total")
+        self.assertEqual(tiers.get("rule"), 1)
+        self.assertEqual(tiers.get("default"), 1)
+        self.assertEqual(self.registry.histogram("dsl_turn_seconds").count(), 2)
+        self.assertEqual(self.registry.gauge("session_store_sessions").get(), 1)
+        self.assertGreater(self.registry.gauge("session_store_bytes").get(), 0)
+
+    def test_disabled_registry_skips_recording(self):
+        """测试关闭指标后不再记录"""
+        self.registry.enabled = False
+        self.interpreter.execute("我要查价格", "s1")
+        self.assertEqual(self.registry.histogram("dsl_turn_seconds").count(), 0)
+        self.assertEqual(self.interpreter.last_turn["tier"], "rule")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+# tests/test_multi_script.py
+import unittest
+import shutil
+from pathlib import Path
+from dsl_program import ProgramRegistry
+from smart_main import SmartDSLAgent
+from tests.test_stubs import MockLLMClient
+
+SHARED_SCENE = """
+scene support {
+    intent contact_human {
+        reply "正在转人工..."
+    }
+}
+"""
+
+class TestProgramRegistry(unittest.TestCase):
+
+    def test_identical_scenes_are_shared(self):
+        """测试不同租户脚本中相同的场景共享同一只读对象"""
+        registry = ProgramRegistry()
+        shop = registry.compile("shop", 'scene main {\n intent greeting {\n reply "shop"\n }\n}\n' + SHARED_SCENE)
+        hotel = registry.compile("hotel", 'scene main {\n intent greeting {\n reply "hotel"\n }\n}\n' + SHARED_SCENE)
+
+        self.assertIs(shop.scenes["support"], hotel.scenes["support"])
+        self.assertIsNot(shop.scenes["main"], hotel.scenes["main"])
+        self.assertEqual(hotel.changed_scenes, ["main"])
+        self.assertEqual(registry.stats(), {"programs": 2, "scenes": 4, "unique_scenes": 3})
+
+        # 注销后只释放不再被引用的场景，其余程序保持不变
+        registry.unregister("shop")
+        self.assertEqual(list(registry), ["hotel"])
+        self.assertIs(registry["hotel"], hotel)
+        self.assertEqual(registry.stats(), {"programs": 1, "scenes": 2, "unique_scenes": 2})
+        registry.unregister("hotel")
+        self.assertEqual(registry.stats(), {"programs": 0, "scenes": 0, "unique_scenes": 0})
+
+
+class TestPerSessionScriptBinding(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path("tests/temp_multi_script")
+        self.test_dir.mkdir(parents=True, exist_ok=True)
+        config_path = self.test_dir / "config.yaml"
+        config_path.write_text(
+            f"session:\n  persistence_dir: {self.test_dir / 'sessions'}\n", encoding='utf-8')
+        self.agent = SmartDSLAgent(str(config_path), llm_client=MockLLMClient())
+        self.agent.load_script("examples/ecommerce.dsl")
+        self.agent.load_script("examples/travel_booking.dsl")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_sessions_routed_to_bound_script(self):
+        """测试会话绑定脚本后，每轮路由到对应程序"""
+        self.agent.interpreter.execute_initial_greeting("shop_user", script="ecommerce")
+        self.agent.interpreter.execute_initial_greeting("trip_user", script="travel_booking")
+
+        self.assertIn("查询什么商品", self.agent.process_input("我要查价格", "shop_user"))
+        # travel_booking 中没有 query_product，落入兜底
+        self.assertNotIn("查询什么商品", self.agent.process_input("我要查价格", "trip_user"))
+        self.assertEqual(self.agent.state_manager.get_state("shop_user")["script"], "ecommerce")
+
+    def test_unknown_script_is_rejected(self):
+        """测试绑定未加载的脚本时报错而不是静默使用默认脚本"""
+        response = self.agent.process_input("你好", "s1", script="not_loaded")
+        self.assertIn("未加载的脚本", response)
+
+if __name__ == '__main__':
+    unittest.main()
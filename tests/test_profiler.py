@@ -0,0 +1,85 @@
+# tests/test_profiler.py
+import pstats
+import shutil
+import unittest
+from pathlib import Path
+from dsl_program import compile_program
+from interpreter import DSLInterpreter
+from llm_client import LLMClient
+from smart_main import SmartDSLAgent
+from state_manager import SessionStateManager
+from utils.metrics import MetricsRegistry
+from tests.test_stubs import MockLLMClient, StubChatClient
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path("tests/temp_profiler")
+        self.test_dir.mkdir(parents=True, exist_ok=True)
+        self.out_dir = self.test_dir / "profiles"
+        config_path = self.test_dir / "config.yaml"
+        config_path.write_text(f"session:\n  persistence_dir: {self.test_dir / 'sessions'}\n", encoding='utf-8')
+        self.agent = SmartDSLAgent(str(config_path), llm_client=MockLLMClient())
+        self.agent.load_script("examples/ecommerce.dsl")
+
+    def tearDown(self):
+        self.agent.stop_profiling()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_window_of_turns_dumps_pstats(self):
+        self.assertIsNone(self.agent.interpreter.profiler) # 默认关闭
+        self.agent.start_profiling(turns=3, out_dir=str(self.out_dir), trace_memory=True)
+        for user_input in ["我要查价格", "袜子", "查订单"]:
+            self.agent.process_input(user_input, "prof_user")
+
+        # 达到轮次后自动输出并从解释器上摘除
+        self.assertIsNone(self.agent.interpreter.profiler)
+        stats_files = list(self.out_dir.glob("*.pstats"))
+        self.assertEqual(len(stats_files), 1)
+        functions = {func[2] for func in pstats.Stats(str(stats_files[0])).stats}
+        self.assertIn("_execute", functions)
+
+        report = next(self.out_dir.glob("*memory.txt")).read_text(encoding='utf-8')
+        self.assertIn("prof_user", report)
+
+    def test_sampling_only_keeps_slow_turns(self):
+        server = StubChatClient(lambda messages: "default", first_token_latency=0.1)
+        llm = LLMClient(api_key="test", client=server, metrics=MetricsRegistry())
+        interpreter = DSLInterpreter(llm, SessionStateManager(ephemeral=True), metrics=MetricsRegistry())
+        interpreter.set_program(compile_program(Path("examples/ecommerce.dsl").read_text(encoding='utf-8')))
+        self.agent.interpreter = interpreter
+        self.agent.start_profiling(mode="sampling", turns=None, slow_threshold=0.05,
+                                   out_dir=str(self.out_dir), sample_interval=0.002)
+
+        interpreter.execute("我要查价格", "fast_user") # 规则命中，不输出
+        interpreter.execute("随便聊聊", "slow_user")  # 需要调用 LLM
+        self.agent.stop_profiling()
+
+        files = list(self.out_dir.glob("*.collapsed"))
+        self.assertEqual(len(files), 1)
+        self.assertIn("slow_user", files[0].name)
+        self.assertIn("intelligent_intent_recognition", files[0].read_text(encoding='utf-8'))
+
+    def test_profiler_failures_fall_back_to_plain_turns(self):
+        """测试剖析开启或输出失败时本轮照常完成，剖析被关闭并从解释器上摘除"""
+        class BrokenProfile:
+            def enable(self):
+                raise ValueError("Another profiling tool is already active")
+
+        profiler = self.agent.start_profiling(turns=3, out_dir=str(self.out_dir))
+        profiler._profile = BrokenProfile()
+        with self.assertLogs("profiler", "ERROR"):
+            self.assertIn("查询什么商品", self.agent.process_input("我要查价格", "broken_user"))
+        self.assertIsNone(self.agent.interpreter.profiler)
+        self.assertIn("袜子", self.agent.process_input("袜子", "broken_user"))
+
+        # 轮次完成后写文件失败：返回已完成的回复，不重复执行
+        self.agent.start_profiling(turns=None, slow_threshold=0, out_dir=str(self.out_dir))
+        shutil.rmtree(self.out_dir)
+        with self.assertLogs("profiler", "ERROR"):
+            self.assertIn("查询什么商品", self.agent.process_input("我要查价格", "io_user"))
+        self.assertIsNone(self.agent.interpreter.profiler)
+        self.assertEqual(self.agent.interpreter.state_manager.get_state("io_user", with_version=True)[1], 1)
+
+if __name__ == '__main__':
+    unittest.main()
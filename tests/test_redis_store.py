@@ -0,0 +1,158 @@
+# tests/test_redis_store.py
+import os
+import shutil
+import threading
+import unittest
+from pathlib import Path
+from redis_store import ConnectionPool, RedisError, RedisSessionStateManager
+from state_manager import SessionStateManager, VersionConflict
+from smart_main import SmartDSLAgent
+from tests.test_stubs import MockLLMClient, StubRedisServer
+
+class TestRedisSessionStore(unittest.TestCase):
+    """默认使用进程内替身服务；设置 DSL_TEST_REDIS=host:port 时改用真实 redis-server"""
+
+    def setUp(self):
+        address = os.environ.get("DSL_TEST_REDIS")
+        if address:
+            self.server = None
+            host, port = address.rsplit(":", 1)
+            self.host, self.port = host, int(port)
+        else:
+            self.server = StubRedisServer().start()
+            self.host, self.port = self.server.host, self.server.port
+        self.prefix = "test:%d:" % os.getpid()
+        self.managers = []
+
+    def tearDown(self):
+        for manager in self.managers:
+            for session_id in ("u1", "u2"):
+                manager.delete_session(session_id)
+            manager.close()
+        if self.server is not None:
+            self.server.stop()
+
+    def make_manager(self, **kwargs) -> RedisSessionStateManager:
+        manager = RedisSessionStateManager(host=self.host, port=self.port, key_prefix=self.prefix, **kwargs)
+        self.managers.append(manager)
+        return manager
+
+    def test_sessions_shared_between_instances(self):
+        a, b = self.make_manager(), self.make_manager()
+        a.update_state("u1", {"step": "wait_prod"})
+        self.assertEqual(b.get_state("u1")["step"], "wait_prod")
+
+        b.update_state("u1", {"step": "done"})
+        # a 的近端缓存版本已过期，必须重新读取
+        self.assertEqual(a.get_state("u1")["step"], "done")
+
+        a.delete_session("u1")
+        self.assertEqual(b.get_state("u1"), {})
+
+    def test_near_cache_skips_payload_reads(self):
+        manager = self.make_manager(session_timeout=120)
+        manager.update_state("u2", {"n": 1})
+        manager.get_state("u2")
+        faults = manager._faults.get()
+        for _ in range(5):
+            self.assertEqual(manager.get_state("u2")["n"], 1)
+        self.assertEqual(manager._faults.get(), faults)
+
+        # 过期交给服务端 TTL，且每次访问都会刷新
+        ttl = manager.pool.execute("TTL", self.prefix + "u2")
+        self.assertTrue(0 < ttl <= 120)
+
+    def test_compare_and_set_between_instances(self):
+        """两个实例读到同一版本，后提交的一方被拒绝，重新读取后提交成功"""
+        a, b = self.make_manager(), self.make_manager()
+        _, version_a = a.get_state("cas", with_version=True)
+        state_b, version_b = b.get_state("cas", with_version=True)
+        self.assertEqual(version_a, version_b)
+        self.assertEqual(b.update_state("cas", {"by": "b"}, expected_version=version_b), version_b + 1)
+
+        with self.assertRaises(VersionConflict):
+            a.update_state("cas", {"by": "a"}, expected_version=version_a)
+        state, version = a.get_state("cas", with_version=True)
+        self.assertEqual((state, version), ({"by": "b"}, version_b + 1))
+        a.update_state("cas", {"by": "a"}, expected_version=version)
+        self.assertEqual(b.get_state("cas"), {"by": "a"})
+
+    def test_shared_manager_across_threads(self):
+        """多个线程共用一个实例，近端缓存容量小于会话数时频繁淘汰，不应出现异常或串号"""
+        manager = self.make_manager(max_sessions=4, max_connections=8)
+        session_ids = ["t%d" % i for i in range(12)]
+        errors = []
+
+        def worker(offset):
+            try:
+                for n in range(30):
+                    session_id = session_ids[(offset + n) % len(session_ids)]
+                    manager.update_state(session_id, {"owner": session_id, "n": n})
+                    self.assertEqual(manager.get_state(session_id)["owner"], session_id)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(manager.sessions), 4)
+        for session_id in session_ids:
+            self.assertEqual(manager.get_state(session_id)["owner"], session_id)
+            manager.delete_session(session_id)
+
+    def test_connection_discarded_after_error(self):
+        """测试连接上出现任何异常（如 WATCH 后的错误回复）时关闭连接，不放回池中复用"""
+        pool = ConnectionPool(self.host, self.port, max_connections=1)
+        self.addCleanup(pool.close)
+        with self.assertRaises(RedisError):
+            with pool.connection() as conn:
+                failed = conn
+                raise RedisError("ERR boom")
+        with pool.connection() as conn:
+            self.assertIsNot(conn, failed)
+            self.assertEqual(conn.execute("PING"), "PONG")
+
+    def test_archive_roundtrip(self):
+        """从文件存储导出归档，灌入 Redis，再从 Redis 导出"""
+        work_dir = Path("tests/temp_redis_archive")
+        try:
+            source = SessionStateManager(persistence_dir=str(work_dir / "src"))
+            for session_id in ("u1", "u2"):
+                source.update_state(session_id, {"owner": session_id})
+            source.export_archive(str(work_dir / "a.dsla"))
+
+            a, b = self.make_manager(), self.make_manager()
+            self.assertEqual(b.get_state("u1"), {}) # 近端缓存中的旧副本
+            self.assertEqual(a.import_archive(str(work_dir / "a.dsla"), workers=2), 2)
+            self.assertEqual(b.get_state("u1"), {"owner": "u1"})
+
+            self.assertEqual(a.export_archive(str(work_dir / "b.dsla"), chunk_size=1), 2)
+            target = SessionStateManager(ephemeral=True)
+            target.import_archive(str(work_dir / "b.dsla"))
+            self.assertEqual(sorted(target.sessions), ["u1", "u2"])
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def test_agent_uses_redis_backend(self):
+        test_dir = Path("tests/temp_redis")
+        test_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            config_path = test_dir / "config.yaml"
+            config_path.write_text(
+                "session:\n  backend: redis\n  redis:\n"
+                f"    host: {self.host}\n    port: {self.port}\n    key_prefix: '{self.prefix}'\n",
+                encoding='utf-8')
+            agent = SmartDSLAgent(str(config_path), llm_client=MockLLMClient())
+            self.managers.append(agent.state_manager)
+            self.assertIsInstance(agent.state_manager, RedisSessionStateManager)
+            agent.load_script("examples/ecommerce.dsl")
+            agent.process_input("我要查价格", "u1")
+            self.assertIn("袜子", agent.process_input("袜子", "u1"))
+        finally:
+            shutil.rmtree(test_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
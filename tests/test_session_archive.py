@@ -0,0 +1,93 @@
+# tests/test_session_archive.py
+import shutil
+import unittest
+from pathlib import Path
+from state_manager import SessionStateManager, session_file_path
+import session_codec
+
+class TestSessionArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path("tests/temp_archive")
+        self.archive = self.test_dir / "sessions.dsla"
+        self.source = SessionStateManager(persistence_dir=str(self.test_dir / "src"), max_sessions=50)
+        for i in range(600):
+            self.source.update_state(f"user_{i}", {"current_scene": "main", "variables": {"n": i}})
+        # 旧版缩进 JSON 文件也一并导出
+        legacy = {"session_id": "legacy", "state_data": {"old": True}, "created_at": 1.0,
+                  "updated_at": 1.0, "last_activity": 9e12}
+        legacy_file = session_file_path(self.test_dir / "src", "legacy", ".json")
+        legacy_file.parent.mkdir(parents=True, exist_ok=True)
+        legacy_file.write_bytes(session_codec.encode(legacy, session_codec.get_codec("json-pretty")))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_roundtrip_with_parallel_import(self):
+        self.source.update_state("user_7", {"current_scene": "shop"}) # 内存中的最新版本
+        self.assertEqual(self.source.export_archive(str(self.archive), chunk_size=250), 601)
+
+        target = SessionStateManager(persistence_dir=str(self.test_dir / "dst"), max_sessions=100)
+        target.update_state("user_1", {"stale": True})
+        self.assertEqual(target.import_archive(str(self.archive), workers=4), 601)
+
+        self.assertEqual(len(list((self.test_dir / "dst").rglob("*.session"))), 601)
+        self.assertEqual(target.get_state("user_1"), {"current_scene": "main", "variables": {"n": 1}})
+        self.assertEqual(target.get_state("user_7"), {"current_scene": "shop"})
+        self.assertEqual(target.get_state("legacy"), {"old": True})
+        self.assertEqual(len(target.sessions), 3) # 其余会话按需加载
+
+    def test_import_into_memory_only_store(self):
+        self.source.export_archive(str(self.archive), chunk_size=170)
+        target = SessionStateManager(ephemeral=True)
+        self.assertEqual(target.import_archive(str(self.archive)), 601)
+        self.assertEqual(target.get_state("user_599")["variables"], {"n": 599})
+
+    def test_corrupt_or_truncated_archive_rejected(self):
+        self.source.export_archive(str(self.archive), chunk_size=250)
+        raw = self.archive.read_bytes()
+        target = SessionStateManager(ephemeral=True)
+
+        corrupt = self.test_dir / "corrupt.dsla"
+        corrupt.write_bytes(raw[:100] + bytes([raw[100] ^ 0xFF]) + raw[101:])
+        with self.assertRaisesRegex(ValueError, "校验失败"):
+            target.import_archive(str(corrupt))
+
+        truncated = self.test_dir / "truncated.dsla"
+        truncated.write_bytes(raw[:-20])
+        with self.assertRaisesRegex(ValueError, "不完整|结尾"):
+            target.import_archive(str(truncated), workers=2)
+
+    def test_corrupt_archive_not_partially_applied(self):
+        """测试末尾的块损坏时，默认先校验的导入不写入任何会话；跳过校验时报错前的块已写入"""
+        self.source.export_archive(str(self.archive), chunk_size=250)
+        raw = self.archive.read_bytes()
+        corrupt = self.test_dir / "corrupt.dsla"
+        corrupt.write_bytes(raw[:-30] + bytes([raw[-30] ^ 0xFF]) + raw[-29:]) # 最后一块的数据
+
+        target_dir = self.test_dir / "dst"
+        target = SessionStateManager(persistence_dir=str(target_dir), max_sessions=100)
+        with self.assertRaisesRegex(ValueError, "校验失败"):
+            target.import_archive(str(corrupt), workers=2)
+        self.assertEqual(list(target_dir.rglob("*.session")), [])
+
+        with self.assertRaisesRegex(ValueError, "校验失败"), self.assertLogs("state_manager", "ERROR") as logs:
+            target.import_archive(str(corrupt), verify=False)
+        self.assertEqual(len(list(target_dir.rglob("*.session"))), 500)
+        self.assertIn("此前已导入 500 个会话", logs.output[0])
+
+    def test_ephemeral_import_skips_records_without_session_id(self):
+        from session_archive import ArchiveWriter
+        codec = session_codec.get_codec("json")
+        with open(self.archive, 'wb') as f:
+            writer = ArchiveWriter(f)
+            writer.add("ok", session_codec.encode({"session_id": "ok", "state_data": {"n": 1}, "last_activity": 9e12},
+                                                  codec))
+            writer.add("broken", session_codec.encode({"state_data": {}}, codec))
+            writer.close()
+        target = SessionStateManager(ephemeral=True)
+        self.assertEqual(target.import_archive(str(self.archive)), 1)
+        self.assertEqual(list(target.sessions), ["ok"])
+
+if __name__ == '__main__':
+    unittest.main()
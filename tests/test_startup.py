@@ -0,0 +1,53 @@
+# tests/test_startup.py
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+from llm_client import LLMClient
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# smart_main 导入耗时预算（毫秒，取多次运行的最小值）；可用环境变量按机器调整
+IMPORT_BUDGET_MS = float(os.environ.get("DSL_IMPORT_BUDGET_MS", "250"))
+# 这些模块只应在真正用到时才导入
+DEFERRED_MODULES = ("zhipuai", "yaml", "http.server", "argparse", "redis_store", "batch_runner",
+                    "profiler", "cProfile", "dsl_modules", "concurrent.futures", "decision_log", "gzip",
+                    "llm_pool", "traffic_gen")
+
+
+def import_profile():
+    """以 -X importtime 导入 smart_main，返回 (总耗时微秒, 导入的模块名集合)"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import smart_main"],
+                            cwd=str(PROJECT_ROOT), capture_output=True, text=True, check=True)
+    total, modules = 0, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue # 表头
+        modules.add(name.strip())
+        if name.strip() == "smart_main":
+            total = int(cumulative)
+    return total, modules
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_import_time_budget(self):
+        runs = [import_profile() for _ in range(3)]
+        best = min(total for total, _ in runs)
+        self.assertLess(best / 1000, IMPORT_BUDGET_MS,
+                        f"导入 smart_main 耗时 {best / 1000:.1f}ms，超出预算 {IMPORT_BUDGET_MS}ms")
+        for module in DEFERRED_MODULES:
+            self.assertNotIn(module, runs[0][1], f"{module} 不应在导入 smart_main 时加载")
+
+    def test_llm_sdk_created_on_first_model_call(self):
+        """只走规则匹配时不创建 SDK 客户端"""
+        client = LLMClient(api_key="unused")
+        self.assertEqual(client.fallback_intent_recognition("我要查订单", ["query_order"]), "query_order")
+        self.assertIsNone(client._client)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,12 @@
 # tests/test_state_manager.py
 import unittest
+import json
+import os
 import shutil
+import time
 from pathlib import Path
-from state_manager import SessionStateManager
+from state_manager import SessionStateManager, VersionConflict, compact_sessions, session_file_path
+import session_codec
 
 class TestStateManager(unittest.TestCase):
     
@@ -36,5 +40,210 @@ class TestStateManager(unittest.TestCase):
         # 验证数据是否持久化
         self.assertEqual(loaded_state["step"], "active")
 
+    def test_legacy_json_files_are_migrated(self):
+        """测试旧版缩进 JSON 会话文件可自动识别，并在下次写入时迁移到新格式"""
+        legacy_file = Path(self.test_dir) / "old_user.json"
+        legacy_file.write_text(json.dumps({
+            "session_id": "old_user",
+            "state_data": {"step": "legacy"},
+            "created_at": 0, "updated_at": 0, "last_activity": 9e12
+        }, ensure_ascii=False, indent=2), encoding='utf-8')
+
+        manager = SessionStateManager(persistence_dir=self.test_dir)
+        self.assertEqual(manager.get_state("old_user")["step"], "legacy")
+
+        manager.update_state("old_user", {"step": "migrated"})
+        self.assertFalse(legacy_file.exists())
+        self.assertFalse(session_file_path(self.test_dir, "old_user", ".json").exists())
+        self.assertTrue(session_file_path(self.test_dir, "old_user").exists())
+        self.assertEqual(SessionStateManager(persistence_dir=self.test_dir).get_state("old_user")["step"], "migrated")
+
+    def test_binary_codec_with_compression(self):
+        """测试二进制编解码器 + 超过阈值时压缩，且任意配置都能读取"""
+        manager = SessionStateManager(persistence_dir=self.test_dir, codec="marshal", compress_threshold=64)
+        manager.update_state("big", {"history": ["很长的对话内容"] * 50})
+
+        raw = session_file_path(self.test_dir, "big").read_bytes()
+        self.assertTrue(raw.startswith(session_codec.MAGIC))
+        self.assertEqual(session_codec.decode(raw)["state_data"]["history"][0], "很长的对话内容")
+
+        reader = SessionStateManager(persistence_dir=self.test_dir, codec="json")
+        self.assertEqual(len(reader.get_state("big")["history"]), 50)
+
+    def test_marshal_rejects_other_python_versions(self):
+        """测试 marshal 负载记录写入时的 Python 版本，版本不一致或数据损坏时给出明确错误"""
+        raw = session_codec.encode({"session_id": "m", "state_data": {}}, session_codec.get_codec("marshal"))
+        header = len(session_codec.MAGIC) + 3
+        other = bytes([raw[header], raw[header + 1] ^ 0x7F])
+        with self.assertRaisesRegex(ValueError, "无法读取"):
+            session_codec.decode(raw[:header] + other + raw[header + 2:])
+        with self.assertRaisesRegex(ValueError, "损坏"):
+            session_codec.decode(raw[:-3])
+
+    def test_lru_eviction_to_disk(self):
+        """测试常驻会话数受上限约束，被淘汰的会话再次访问时从磁盘透明恢复"""
+        manager = SessionStateManager(persistence_dir=self.test_dir, max_sessions=3)
+        for i in range(10):
+            manager.update_state(f"user_{i}", {"n": i})
+            manager.get_state("hot") # 热点会话持续被访问，不应被淘汰
+            self.assertLessEqual(len(manager.sessions), 3)
+
+        self.assertIn("hot", manager.sessions)
+        self.assertNotIn("user_0", manager.sessions)
+        self.assertEqual(manager.get_state("user_0")["n"], 0)
+        self.assertIn("user_0", manager.sessions)
+        self.assertLessEqual(len(manager.sessions), 3)
+
+    def test_eviction_skips_clean_sessions(self):
+        """测试淘汰时只写出有未保存修改的会话，只被读取过的会话不重写"""
+        manager = SessionStateManager(persistence_dir=self.test_dir, max_sessions=1)
+        manager.update_state("read_only", {"n": 1})
+        path = session_file_path(self.test_dir, "read_only")
+        mtime = path.stat().st_mtime_ns
+        time.sleep(0.01)
+        manager.get_state("read_only") # 只更新 last_activity
+        manager.update_state("other", {"n": 2}) # 淘汰 read_only
+        self.assertNotIn("read_only", manager.sessions)
+        self.assertEqual(path.stat().st_mtime_ns, mtime)
+
+        # 写盘失败留下的修改在淘汰时补写
+        manager.get_state("read_only")
+        session = manager.sessions["read_only"]
+        session.state_data = {"n": 3}
+        session.version += 1
+        manager.get_state("other")
+        self.assertEqual(SessionStateManager(persistence_dir=self.test_dir).get_state("read_only"), {"n": 3})
+
+    def test_compress_evicted_rewrites_uncompressed_copies(self):
+        """测试 compress_evicted：只被读取过的会话若磁盘上是未压缩副本，淘汰时压缩重写一次"""
+        SessionStateManager(persistence_dir=self.test_dir).update_state("cold", {"n": 1})
+        path = session_file_path(self.test_dir, "cold")
+        self.assertFalse(session_codec.is_compressed(path.read_bytes()))
+
+        manager = SessionStateManager(persistence_dir=self.test_dir, max_sessions=1, compress_evicted=True)
+        manager.get_state("cold")
+        manager.get_state("other") # 淘汰 cold
+        self.assertTrue(session_codec.is_compressed(path.read_bytes()))
+        mtime = path.stat().st_mtime_ns
+
+        time.sleep(0.01)
+        manager.get_state("cold")
+        manager.get_state("other") # 已是压缩副本，不再重写
+        self.assertEqual(path.stat().st_mtime_ns, mtime)
+        self.assertEqual(manager.get_state("cold"), {"n": 1})
+
+    def test_ephemeral_cap_drops_oldest(self):
+        manager = SessionStateManager(ephemeral=True, max_sessions=2)
+        for name in ("a", "b", "c"):
+            manager.update_state(name, {"v": name})
+        self.assertEqual(list(manager.sessions), ["b", "c"])
+
+    def test_sharded_layout_and_safe_filenames(self):
+        """测试会话文件分两级目录存放，任意会话 id 都不会逃出持久化目录"""
+        ids = ["../../etc/passwd", "a/b\\c", ".hidden", "用户:1", "x" * 300, "plain_id-1.0"]
+        for session_id in ids:
+            self.manager.update_state(session_id, {"id": session_id})
+
+        root = Path(self.test_dir).resolve()
+        files = [p for p in root.rglob("*") if p.is_file()]
+        self.assertEqual(len(files), len(ids))
+        for path in files:
+            self.assertEqual(len(path.relative_to(root).parts), 3)
+            self.assertFalse(path.name.startswith("."))
+        self.assertEqual(session_file_path(self.test_dir, "plain_id-1.0").name, "plain_id-1.0.session")
+
+        reloaded = SessionStateManager(persistence_dir=self.test_dir)
+        self.assertEqual(sorted(reloaded.sessions), sorted(ids))
+        lazy = SessionStateManager(persistence_dir=self.test_dir, max_sessions=10)
+        self.assertEqual(lazy.get_state("../../etc/passwd"), {"id": "../../etc/passwd"})
+        self.assertEqual(sorted(sid for sid, _ in lazy._iter_payloads(100)), sorted(ids))
+
+    def test_flat_layout_migrated_on_startup(self):
+        codec = session_codec.get_codec("json")
+        for i in range(20):
+            data = {"session_id": f"flat_{i}", "state_data": {"n": i}, "last_activity": 9e12}
+            (Path(self.test_dir) / f"flat_{i}.session").write_bytes(session_codec.encode(data, codec))
+
+        manager = SessionStateManager(persistence_dir=self.test_dir, max_sessions=5)
+        self.assertEqual([p.name for p in Path(self.test_dir).iterdir() if p.is_file()], [])
+        self.assertEqual(manager.get_state("flat_7"), {"n": 7})
+        self.assertTrue(session_file_path(self.test_dir, "flat_7").exists())
+
+    def test_offline_compaction(self):
+        """测试离线压缩按修改时间删除过期文件与重复格式，并清理空目录"""
+        for i in range(30):
+            self.manager.update_state(f"user_{i}", {"n": i})
+        old = time.time() - 7200
+        for i in range(20):
+            os.utime(session_file_path(self.test_dir, f"user_{i}"), (old, old))
+        duplicate = session_file_path(self.test_dir, "user_25", ".json")
+        duplicate.write_bytes(b"{}")
+        os.utime(duplicate, (old + 5400, old + 5400))
+        (Path(self.test_dir) / "user_26.session").write_bytes(
+            session_file_path(self.test_dir, "user_26").read_bytes()) # 残留的平铺文件
+
+        self.assertEqual(compact_sessions(self.test_dir, session_timeout=3600, dry_run=True)["expired"], 20)
+        stats = compact_sessions(self.test_dir, session_timeout=3600)
+        self.assertEqual((stats["migrated"], stats["expired"], stats["duplicates"]), (1, 20, 1))
+        self.assertGreater(stats["dirs_removed"], 0)
+
+        remaining = [p for p in Path(self.test_dir).rglob("*") if p.is_file()]
+        self.assertEqual(len(remaining), 10)
+        self.assertFalse(any(p.is_dir() and not any(p.iterdir()) for p in Path(self.test_dir).rglob("*")))
+        reloaded = SessionStateManager(persistence_dir=self.test_dir)
+        self.assertEqual(sorted(reloaded.sessions), sorted(f"user_{i}" for i in range(20, 30)))
+
+    def test_compare_and_set(self):
+        """测试版本号随写入递增，过期版本的 compare-and-set 被拒绝且不写入（内存与文件后端）"""
+        for manager in (SessionStateManager(ephemeral=True), self.manager):
+            state, version = manager.get_state("cas", with_version=True)
+            self.assertEqual((state, version), ({}, 0))
+            self.assertEqual(manager.update_state("cas", {"n": 1}, expected_version=0), 1)
+            with self.assertRaises(VersionConflict) as caught:
+                manager.update_state("cas", {"n": "stale"}, expected_version=0)
+            self.assertEqual((caught.exception.expected, caught.exception.actual), (0, 1))
+            self.assertEqual(manager.get_state("cas", with_version=True), ({"n": 1}, 1))
+            self.assertEqual(manager.update_state("cas", {"n": 2}), 2) # 不带版本时直接覆盖
+
+        self.assertEqual(SessionStateManager(persistence_dir=self.test_dir).get_state("cas", with_version=True),
+                         ({"n": 2}, 2))
+
+    def test_compare_and_set_sees_other_process_writes(self):
+        """测试共享目录的另一个管理器（另一进程）写入后，本进程的旧版本提交被拒绝并读到最新状态"""
+        other = SessionStateManager(persistence_dir=self.test_dir)
+        _, version = self.manager.get_state("shared", with_version=True)
+        other.get_state("shared")
+        other.update_state("shared", {"owner": "other"}, expected_version=version)
+
+        with self.assertRaises(VersionConflict):
+            self.manager.update_state("shared", {"owner": "me"}, expected_version=version)
+        state, version = self.manager.get_state("shared", with_version=True)
+        self.assertEqual(state, {"owner": "other"})
+        self.manager.update_state("shared", {"owner": "me"}, expected_version=version)
+        self.assertEqual(SessionStateManager(persistence_dir=self.test_dir).get_state("shared"), {"owner": "me"})
+
+    def test_evict_and_clear_respect_newer_versions(self):
+        """测试淘汰补写与清空都以磁盘上的最新版本为准，不会用旧副本覆盖其他进程的写入"""
+        mine = SessionStateManager(persistence_dir=self.test_dir, max_sessions=1)
+        other = SessionStateManager(persistence_dir=self.test_dir, max_sessions=1)
+        mine.update_state("shared", {"owner": "me"})
+        other.update_state("shared", {"owner": "other"}, expected_version=1)
+
+        # 本地副本有未写出的修改（版本 2），但磁盘上已是其他进程写入的版本 2
+        session = mine.sessions["shared"]
+        session.state_data = {"owner": "stale"}
+        session.version += 1
+        mine.get_state("unrelated") # 淘汰 shared
+        self.assertEqual(SessionStateManager(persistence_dir=self.test_dir).get_state("shared"), {"owner": "other"})
+
+        other.update_state("shared", {"owner": "other", "n": 3})
+        mine.clear_session("shared")
+        self.assertEqual(SessionStateManager(persistence_dir=self.test_dir).get_state("shared", with_version=True),
+                         ({}, 4))
+
+    def test_unknown_codec_rejected(self):
+        with self.assertRaises(ValueError):
+            SessionStateManager(persistence_dir=self.test_dir, codec="xml")
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
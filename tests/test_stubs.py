@@ -1,6 +1,9 @@
 # tests/test_stubs.py
-from typing import List, Dict, Optional
+from typing import Any, Callable, List, Dict, Optional
+from types import SimpleNamespace
+import fnmatch
 import logging
+import time
 
 # 引入真实类的接口定义（不需要引入具体实现，只要保持签名一致）
 # 这里我们模拟 llm_client.py 中的 LLMClient
@@ -15,7 +18,8 @@ class MockLLMClient:
         self.call_history = [] # 记录调用历史，用于验证
 
     def intelligent_intent_recognition(self, user_input: str, available_intents: List[str], 
-                                      conversation_context: List[Dict[str, str]]) -> str:
+                                      conversation_context: List[Dict[str, str]],
+                                      timeout: Optional[float] = None, scene: Optional[str] = None) -> str:
         """模拟智能意图识别"""
         self.call_history.append({"input": user_input, "method": "intelligent"})
         
@@ -52,4 +56,277 @@ class MockLLMClient:
         if "查价格" in user_input:
             return "query_product"
             
-        return None
\ No newline at end of file
+        return None
+
+class StubChatClient:
+    """
+    [测试桩] 本地替身 LLM 服务，兼容 client.chat.completions.create 接口。
+    按固定的首 token 延迟与逐 token 延迟输出 responder 给出的答案，
+    支持 stream=True（可提前 close）和 max_tokens 截断，用于测量时延相关的行为。
+    """
+    def __init__(self, responder: Callable[[List[Dict[str, str]]], str],
+                 first_token_latency: float = 0.0, token_latency: float = 0.0, chars_per_token: int = 2,
+                 capacity: Optional[int] = None, models: Optional[Dict[str, Dict[str, Any]]] = None,
+                 rate_limit: Optional[float] = None, retry_after: Optional[float] = None,
+                 clock: Optional[Callable[[], float]] = None):
+        """
+        capacity: 可同时处理的请求数，超出的请求在服务端排队（模拟上游过载时延迟飙升）
+        models: 按模型名覆盖的配置（responder / first_token_latency / token_latency），模拟大小模型的不同时延
+        rate_limit: 每秒允许的请求数（令牌桶，突发容量同速率），超出时抛出 429（模拟单个密钥的速率配额）
+        retry_after: 429 响应中的 Retry-After 秒数
+        clock: 令牌桶使用的时钟（默认 time.monotonic，测试中可注入以免等待补充令牌）
+        """
+        import threading
+        from admission import TokenBucket
+        self._rate_lock = threading.Lock()
+        self._bucket = TokenBucket(rate_limit, max(1.0, rate_limit)) if rate_limit else None
+        self.retry_after = retry_after
+        self._clock = clock or time.monotonic
+        self.rate_limited = 0
+        self.responder = responder
+        self.models = dict(models or {})
+        self._capacity = threading.Semaphore(capacity) if capacity else None
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.chars_per_token = chars_per_token
+        self.requests: List[Dict[str, Any]] = []
+        self.tokens_sent = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    @staticmethod
+    def _sleep(latency: float, timeout: Optional[float]):
+        """模拟 SDK 的请求超时：超过 timeout 时抛出 TimeoutError"""
+        if timeout is not None and latency > timeout:
+            time.sleep(max(timeout, 0))
+            raise TimeoutError("stub request timed out")
+        time.sleep(latency)
+
+    def _profile(self, model: str):
+        """返回 (responder, 首 token 延迟, 逐 token 延迟)"""
+        profile = self.models.get(model, {})
+        return (profile.get("responder", self.responder),
+                profile.get("first_token_latency", self.first_token_latency),
+                profile.get("token_latency", self.token_latency))
+
+    def _tokens(self, responder, messages, max_tokens):
+        answer = responder(messages)
+        n = self.chars_per_token
+        tokens = [answer[i:i + n] for i in range(0, len(answer), n)]
+        return tokens[:max_tokens] if max_tokens else tokens
+
+    def _create(self, model: str, messages: List[Dict[str, str]], temperature: float = 0.1,
+                max_tokens: Optional[int] = None, stream: bool = False, **kwargs):
+        if self._bucket is not None:
+            with self._rate_lock:
+                if not self._bucket.try_acquire(self._clock()):
+                    self.rate_limited += 1
+                    raise StubRateLimitError(self.retry_after)
+        self.requests.append({"model": model, "max_tokens": max_tokens, "stream": stream,
+                              "temperature": temperature})
+        responder, first_token_latency, token_latency = self._profile(model)
+        tokens = self._tokens(responder, messages, max_tokens)
+        timeout = kwargs.get("timeout")
+        if stream:
+            return _StubStream(self, tokens, timeout, first_token_latency, token_latency)
+        latency = first_token_latency + token_latency * len(tokens)
+        if self._capacity is not None:
+            with self._capacity:
+                self._sleep(latency, timeout)
+        else:
+            self._sleep(latency, timeout)
+        self.tokens_sent += len(tokens)
+        message = SimpleNamespace(content="".join(tokens))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+class StubRateLimitError(Exception):
+    """与 SDK 的 429 异常相同的形状：带 status_code 与 response.headers"""
+    def __init__(self, retry_after: Optional[float] = None):
+        super().__init__("429 rate limit exceeded")
+        self.status_code = 429
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = SimpleNamespace(status_code=429, headers=headers)
+
+
+class _StubStream:
+    def __init__(self, server: StubChatClient, tokens: List[str], timeout: Optional[float] = None,
+                 first_token_latency: float = 0.0, token_latency: float = 0.0):
+        self.server = server
+        self.tokens = tokens
+        self.timeout = timeout
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.closed = False
+
+    def __iter__(self):
+        self.server._sleep(self.first_token_latency, self.timeout)
+        for token in self.tokens:
+            if self.closed:
+                return
+            time.sleep(self.token_latency)
+            self.server.tokens_sent += 1
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+
+    def close(self):
+        self.closed = True
+
+
+class StubRedisServer:
+    """
+    [测试桩] 进程内的 Redis 协议替身服务（RESP2，线程化 TCP 服务）
+    只实现会话存储用到的命令：PING / AUTH / SELECT / GET / MGET / SET [EX] / DEL / EXISTS /
+    EXPIRE / TTL / INCR / SCAN / MULTI / EXEC / WATCH / UNWATCH / FLUSHDB，键过期在访问时惰性判断
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        import socketserver
+        import threading
+
+        self.data: Dict[bytes, Any] = {}
+        self.expires: Dict[bytes, float] = {}
+        self.revisions: Dict[bytes, int] = {} # 每次写入键时递增，供 WATCH 判断
+        self.commands = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            disable_nagle_algorithm = True
+
+            def handle(self):
+                queued = None
+                watched: Dict[bytes, int] = {}
+                while True:
+                    try:
+                        args = stub._read_command(self.rfile)
+                    except (ConnectionError, ValueError):
+                        return
+                    if args is None:
+                        return
+                    name = args[0].upper()
+                    if name == b"MULTI":
+                        queued = []
+                        reply = "OK"
+                    elif name == b"WATCH":
+                        with stub.lock:
+                            watched.update({k: stub.revisions.get(k, 0) for k in args[1:]})
+                        reply = "OK"
+                    elif name == b"UNWATCH":
+                        watched = {}
+                        reply = "OK"
+                    elif name == b"EXEC" and queued is not None:
+                        with stub.lock:
+                            if any(stub.revisions.get(k, 0) != rev for k, rev in watched.items()):
+                                reply = None # 被 WATCH 的键已变化，事务放弃
+                            else:
+                                reply = [stub._dispatch(cmd) for cmd in queued]
+                        queued = None
+                        watched = {}
+                    elif queued is not None:
+                        queued.append(args)
+                        reply = "QUEUED"
+                    else:
+                        with stub.lock:
+                            reply = stub._dispatch(args)
+                    self.wfile.write(stub._encode(reply))
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self._server = Server((host, port), Handler)
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def start(self) -> "StubRedisServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @staticmethod
+    def _read_command(rfile) -> Optional[List[bytes]]:
+        line = rfile.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int(rfile.readline()[1:-2])
+            args.append(rfile.read(length + 2)[:-2])
+        return args
+
+    @classmethod
+    def _encode(cls, reply: Any) -> bytes:
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, Exception):
+            return b"-ERR %s\r\n" % str(reply).encode('utf-8')
+        if isinstance(reply, str):
+            return b"+%s\r\n" % reply.encode('utf-8')
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, bytes):
+            return b"$%d\r\n%s\r\n" % (len(reply), reply)
+        return b"*%d\r\n" % len(reply) + b"".join(cls._encode(r) for r in reply)
+
+    def _alive(self, key: bytes) -> bool:
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def _dispatch(self, args: List[bytes]) -> Any:
+        self.commands += 1
+        name, keys = args[0].upper(), args[1:]
+        if name in (b"SET", b"DEL", b"EXPIRE", b"INCR"):
+            for key in (keys if name == b"DEL" else keys[:1]):
+                self.revisions[key] = self.revisions.get(key, 0) + 1
+        if name in (b"PING", b"AUTH", b"SELECT"):
+            return "PONG" if name == b"PING" else "OK"
+        if name == b"FLUSHDB":
+            self.data.clear()
+            self.expires.clear()
+            return "OK"
+        if name == b"GET":
+            return self.data[keys[0]] if self._alive(keys[0]) else None
+        if name == b"MGET":
+            return [self.data[k] if self._alive(k) else None for k in keys]
+        if name == b"SET":
+            self.data[keys[0]] = keys[1]
+            self.expires.pop(keys[0], None)
+            if len(keys) >= 4 and keys[2].upper() == b"EX":
+                self.expires[keys[0]] = time.time() + int(keys[3])
+            return "OK"
+        if name in (b"DEL", b"EXISTS"):
+            alive = [k for k in keys if self._alive(k)]
+            if name == b"DEL":
+                for k in alive:
+                    self.data.pop(k, None)
+                    self.expires.pop(k, None)
+            return len(alive)
+        if name == b"EXPIRE":
+            if not self._alive(keys[0]):
+                return 0
+            self.expires[keys[0]] = time.time() + int(keys[1])
+            return 1
+        if name == b"TTL":
+            if not self._alive(keys[0]):
+                return -2
+            deadline = self.expires.get(keys[0])
+            return -1 if deadline is None else int(deadline - time.time())
+        if name == b"SCAN":
+            # 游标即排序后键列表的下标（遍历期间的增删可能导致重复或遗漏，与真实 Redis 的保证类似）
+            options = {keys[i].upper(): keys[i + 1] for i in range(1, len(keys) - 1, 2)}
+            pattern, count = options.get(b"MATCH", b"*"), int(options.get(b"COUNT", 10))
+            ordered = sorted(k for k in list(self.data) if self._alive(k))
+            start = int(keys[0])
+            batch = ordered[start:start + count]
+            cursor = start + count if start + count < len(ordered) else 0
+            return [str(cursor).encode(), [k for k in batch if fnmatch.fnmatchcase(k, pattern)]]
+        if name == b"INCR":
+            value = int(self.data[keys[0]]) + 1 if self._alive(keys[0]) else 1
+            self.data[keys[0]] = str(value).encode()
+            return value
+        return ValueError("unknown command '%s'" % name.decode())
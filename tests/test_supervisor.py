@@ -0,0 +1,113 @@
+# tests/test_supervisor.py
+import unittest
+import os
+import signal
+import shutil
+import time
+from pathlib import Path
+from supervisor import AgentSupervisor, ConsistentHashRing, WorkerCrashed
+from smart_main import SmartDSLAgent
+from tests.test_stubs import MockLLMClient
+
+class TestConsistentHashRing(unittest.TestCase):
+
+    def test_removing_node_only_moves_its_keys(self):
+        """测试移除节点只影响该节点上的会话"""
+        ring = ConsistentHashRing([0, 1, 2, 3])
+        keys = [f"session_{i}" for i in range(2000)]
+        before = {k: ring.get(k) for k in keys}
+        self.assertEqual(set(before.values()), {0, 1, 2, 3})
+
+        ring.remove(2)
+        moved = [k for k in keys if ring.get(k) != before[k]]
+        self.assertTrue(moved)
+        self.assertTrue(all(before[k] == 2 for k in moved))
+
+
+class TestAgentSupervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path("tests/temp_supervisor")
+        self.test_dir.mkdir(parents=True, exist_ok=True)
+        config_path = self.test_dir / "config.yaml"
+        config_path.write_text(
+            f"session:\n  persistence_dir: {self.test_dir / 'sessions'}\n", encoding='utf-8')
+        agent = SmartDSLAgent(str(config_path), llm_client=MockLLMClient())
+        agent.load_script("examples/ecommerce.dsl")
+        self.supervisor = AgentSupervisor(agent, num_workers=2)
+        self.supervisor.start()
+
+    def tearDown(self):
+        self.supervisor.stop()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_multi_turn_flow_across_workers(self):
+        """测试多会话并发，多轮流程在各自 worker 中保持有序"""
+        sessions = [f"user_{i}" for i in range(8)]
+        first = [self.supervisor.submit("我要查价格", s) for s in sessions]
+        second = [self.supervisor.submit("袜子", s) for s in sessions]
+
+        for future in first:
+            self.assertIn("查询什么商品", future.result(timeout=10))
+        for future in second:
+            self.assertIn("袜子", future.result(timeout=10))
+        self.assertEqual({self.supervisor.worker_for(s) for s in sessions}, {0, 1})
+
+    def test_crashed_worker_sessions_are_taken_over(self):
+        """测试 worker 崩溃后会话从持久化存储恢复并继续"""
+        session_id = "crash_user"
+        self.assertIn("查询什么商品", self.supervisor.process_input("我要查价格", session_id, timeout=10))
+
+        slot = self.supervisor.worker_for(session_id)
+        os.kill(self.supervisor.worker_pids()[slot], signal.SIGKILL)
+
+        # 槽位上的新 worker 从磁盘加载 current_step，继续完成填槽
+        self.assertIn("袜子", self.supervisor.process_input("袜子", session_id, timeout=10))
+        self.assertEqual(self.supervisor.restarts, 1)
+
+
+class TestPoisonRequest(unittest.TestCase):
+    """某个输入必然打崩 worker：该请求不重发，排队的请求重发次数有上限"""
+
+    def setUp(self):
+        self.test_dir = Path("tests/temp_supervisor_poison")
+        self.test_dir.mkdir(parents=True, exist_ok=True)
+        config_path = self.test_dir / "config.yaml"
+        config_path.write_text(
+            f"session:\n  persistence_dir: {self.test_dir / 'sessions'}\n", encoding='utf-8')
+        self.agent = SmartDSLAgent(str(config_path), llm_client=MockLLMClient())
+        self.agent.load_script("examples/ecommerce.dsl")
+        process_input = self.agent.process_input
+
+        def crash_on_poison(user_input, session_id="default", script=None):
+            if user_input.startswith("poison"):
+                time.sleep(0.2) # 让后续请求先进入队列
+                os._exit(1)
+            return process_input(user_input, session_id, script)
+
+        self.agent.process_input = crash_on_poison
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_in_flight_request_is_not_resent(self):
+        with AgentSupervisor(self.agent, num_workers=1) as supervisor:
+            poison = supervisor.submit("poison", "user_1")
+            normal = supervisor.submit("我要查价格", "user_1")
+            with self.assertRaises(WorkerCrashed):
+                poison.result(timeout=10)
+            self.assertIn("查询什么商品", normal.result(timeout=10))
+            self.assertEqual(supervisor.restarts, 1)
+
+    def test_queued_request_dropped_after_max_resends(self):
+        with AgentSupervisor(self.agent, num_workers=1, max_resends=1) as supervisor:
+            futures = [supervisor.submit(text, "user_1") for text in ("poison_1", "poison_2", "我要查价格")]
+            for future in futures:
+                with self.assertRaises(WorkerCrashed):
+                    future.result(timeout=10)
+            self.assertEqual(supervisor.restarts, 2)
+            # 新 worker 仍可正常处理后续请求
+            self.assertIn("查询什么商品", supervisor.process_input("我要查价格", "user_2", timeout=10))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+# tests/test_traffic_gen.py
+import itertools
+import shutil
+import time
+import unittest
+from pathlib import Path
+from dsl_program import compile_program
+from llm_client import match_rule_keywords
+from smart_main import SmartDSLAgent
+from traffic_gen import OracleLLMClient, TrafficGenerator, drive
+from utils.metrics import MetricsRegistry
+
+class TestTrafficGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = Path("tests/temp_traffic")
+        self.test_dir.mkdir(parents=True, exist_ok=True)
+        self.config_path = self.test_dir / "config.yaml"
+        self.config_path.write_text(f"session:\n  persistence_dir: {self.test_dir / 'sessions'}\n", encoding='utf-8')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def make_agent(self, script_path: str):
+        oracle = OracleLLMClient()
+        agent = SmartDSLAgent(str(self.config_path), llm_client=oracle)
+        agent.load_script(script_path)
+        return agent, oracle
+
+    def test_flows_follow_slots_and_gotos(self):
+        """测试填槽意图只在对应的 set current_step 之后出现，goto 到场景后从该场景选择意图"""
+        program = compile_program(Path("examples/multi_business.dsl").read_text(encoding='utf-8'))
+        generator = TrafficGenerator(program, seed=7, sessions=5, noise=0, off_topic=0)
+        sessions = {}
+        for turn in itertools.islice(generator.turns(), 400):
+            sessions.setdefault(turn.session_id, []).append(turn)
+        self.assertGreater(len(sessions), 5) # 结束的会话被新会话替换，流量不会停止
+        for turns in sessions.values():
+            self.assertEqual([t.index for t in turns], list(range(len(turns))))
+            for previous, turn in zip(turns, turns[1:]):
+                if turn.expected == "provide_destination":
+                    self.assertEqual(previous.expected, "query_flight")
+                if previous.expected == "select_travel" and turn.kind == "flow":
+                    self.assertIn(turn.intent, ("query_flight", "main_menu"))
+        kinds = {t.kind for turns in sessions.values() for t in turns}
+        self.assertEqual(kinds, {"flow", "slot"})
+
+    def test_utterances_from_rules_and_descriptions(self):
+        program = compile_program(Path("examples/ecommerce.dsl").read_text(encoding='utf-8'))
+        generator = TrafficGenerator(program, seed=1, noise=0, off_topic=0)
+        phrases = generator.synth.phrases("query_order")
+        self.assertIn("物流", phrases) # 规则关键词
+        self.assertIn("查订单状态", phrases) # 描述中的核心短语
+        self.assertIn("我想买东西", generator.synth.phrases("query_product")) # 描述中的示例
+        # digits 类型的槽位只生成数字
+        self.assertTrue(all(v.isdigit() for v in generator.synth.slot_values("provide_order_id", "waiting_order_id")))
+        for turn in itertools.islice(generator.turns(), 200):
+            if turn.kind == "flow" and match_rule_keywords(turn.text, program.available_intents):
+                self.assertEqual(match_rule_keywords(turn.text, program.available_intents), turn.intent)
+
+    def test_drive_agent_checks_correctness_at_rate(self):
+        """测试以目标速率驱动 SmartDSLAgent：实际执行的意图与预测一致，吞吐接近目标"""
+        agent, oracle = self.make_agent("examples/ecommerce.dsl")
+        generator = TrafficGenerator(agent.interpreter.program, seed=3, noise=0.3, off_topic=0.1)
+        metrics = MetricsRegistry()
+        t_start = time.perf_counter()
+        stats = drive(agent, generator.turns(), oracle, rate=200, duration=1.0, metrics=metrics)
+        elapsed = time.perf_counter() - t_start
+        self.assertEqual(stats["accuracy"], 1.0, stats["examples"])
+        self.assertAlmostEqual(stats["turns"], 200, delta=2)
+        self.assertGreater(elapsed, 0.95)
+        self.assertGreater(oracle.calls, 0) # 部分轮次经过 LLM 层
+        self.assertTrue({"flow", "slot", "noise", "off_topic"} <= set(stats["kinds"]))
+        self.assertEqual(metrics.histogram("traffic_turn_seconds").count(), stats["turns"])
+
+    def test_drive_keeps_rate_with_slow_llm(self):
+        """测试 LLM 层较慢时由 worker 线程池并发处理：串行最多 50 轮/秒，并发后仍能达到目标速率"""
+        agent, oracle = self.make_agent("examples/ecommerce.dsl")
+        oracle.latency = 0.02
+        generator = TrafficGenerator(agent.interpreter.program, seed=11, sessions=40, noise=0.3, off_topic=0.5)
+        stats = drive(agent, generator.turns(), oracle, rate=150, duration=1.0, workers=8,
+                      metrics=MetricsRegistry())
+        self.assertEqual(stats["accuracy"], 1.0, stats["examples"])
+        self.assertAlmostEqual(stats["turns"], 150, delta=2)
+        self.assertGreater(stats["turns_per_sec"], 100)
+        self.assertGreater(oracle.calls, 50)
+
+    def test_drive_reports_mismatches(self):
+        """测试脚本与预期的对话图不一致时报告错误的轮次：query_order 不再设置槽位，订单号落到 default"""
+        source = Path("examples/ecommerce.dsl").read_text(encoding='utf-8')
+        broken = source.replace('''        reply "请提供您的订单号："
+        set current_step = "waiting_order_id"''', '''        reply "请提供您的订单号："''')
+        broken_path = self.test_dir / "broken.dsl"
+        broken_path.write_text(broken, encoding='utf-8')
+        agent, oracle = self.make_agent(str(broken_path))
+        generator = TrafficGenerator(compile_program(source), seed=5, noise=0, off_topic=0)
+        stats = drive(agent, generator.turns(), oracle, rate=10000, max_turns=300, metrics=MetricsRegistry())
+        self.assertLess(stats["accuracy"], 1.0)
+        self.assertIn("provide_order_id -> default", stats["mismatches"])
+        self.assertEqual(stats["examples"][0]["kind"], "slot")
+
+if __name__ == '__main__':
+    unittest.main()
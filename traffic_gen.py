@@ -0,0 +1,428 @@
+# traffic_gen.py
+"""
+合成对话流量（新脚本上线前、还没有真实流量时做压测）
+- 从编译后的程序提取对话图：set current_step = "X" 的意图之后接 validate current_step == "X" 的意图（填槽），
+  goto 到场景时切换后续意图的候选范围，goto 到意图时下一轮更倾向该意图
+- 用户话术由 LLMClient 的规则关键词与意图描述（其中的示例、核心短语）合成，可按比例混入噪声与无关问题
+- 预测每句话在 expect → rule → LLM（替身）→ default 各层下应解析到的意图，正常轮次只选用预测结果与目标一致的话术
+- 按目标速率（开环调度）把无限的会话流经 worker 线程池发给 SmartDSLAgent（同一会话的轮次保持顺序），
+  LLM 层使用按目标意图作答的替身，同时统计吞吐、时延与意图正确率
+"""
+import queue
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from dsl_program import DSLProgram
+from llm_client import INTENT_DESCRIPTIONS, RULE_KEYWORDS, match_rule_keywords
+from utils.logger import setup_logger
+from utils.metrics import registry as default_registry
+
+logger = setup_logger(__name__)
+
+# 不含任何规则关键词的无关问题（预期落到 default，或在等待填槽时被 expect 当作回答）
+OFF_TOPIC = ["今天天气怎么样", "给我讲个笑话吧", "你叫什么名字", "一加一等于几", "推荐一部电影", "随便聊聊", "现在几点了"]
+NOISE_PREFIXES = ["嗯，", "那个，", "呃……", "请问", "麻烦", "哎，"]
+NOISE_SUFFIXES = ["。", "？", "！", "啊", "呢", "~", "...", "谢谢"]
+PHRASE_TEMPLATES = ["{}", "我想{}", "帮我{}", "{}，可以吗", "麻烦{}"]
+KEYWORD_TEMPLATES = ["{}", "我想问一下{}", "帮我看看{}", "{}相关的问题"]
+SLOT_TEMPLATES = ["{}", "{}吧", "是{}"]
+# 描述中没有示例时的文本槽位取值（digits / number 类型的槽位使用随机数字串）
+SLOT_VALUES = ["袜子", "蛋糕", "耳机", "雨伞", "北京", "上海", "明天下午"]
+
+_STOP = object()
+
+_QUOTED = re.compile(r"'([^']+)'")
+_ASKED = re.compile(r"问了'[^']*'")
+_EXAMPLES = re.compile(r"如([^。（）]+)")
+
+
+@dataclass
+class Turn:
+    """生成的一轮对话"""
+    session_id: str
+    text: str
+    intent: str # 合成用户想表达的意图（LLM 替身据此作答）
+    expected: str # 按各识别层预测的、正确的 agent 应执行的意图
+    kind: str # flow（发起请求）/ slot（回答槽位）/ noise（带噪声）/ off_topic（无关问题）
+    index: int # 会话内的轮次序号
+
+
+class ScriptGraph:
+    """从编译后的程序提取的对话图"""
+
+    def __init__(self, program: DSLProgram):
+        self.program = program
+        self.requires: Dict[str, Dict[str, str]] = {} # 意图 -> validate 要求的 {变量: 值}
+        for name, intent in program.intents.items():
+            for statement in intent.get('statements', []):
+                if statement.get('type') == 'validate':
+                    match = re.match(r'(\w+)\s*==\s*"(.*?)"', statement.get('condition', ''))
+                    if match:
+                        self.requires.setdefault(name, {})[match.group(1)] = match.group(2)
+
+        # 槽位（set current_step 的值）-> 回答它的意图
+        self.answers: Dict[str, List[str]] = {}
+        for name, required in self.requires.items():
+            step = required.get('current_step')
+            if step:
+                self.answers.setdefault(step, []).append(name)
+        # 场景 -> 可以主动发起的意图（无 validate，不含 default）
+        self.entries: Dict[str, List[str]] = {}
+        for scene_name, scene in program.scenes.items():
+            self.entries[scene_name] = [i['name'] for i in scene.get('intents', [])
+                                        if i['name'] not in self.requires and i['name'] != "default"]
+
+    def entry_intents(self, scene: str) -> List[str]:
+        return self.entries.get(scene) or self.entries.get(self.program.entry_scene) or []
+
+    def validates(self, intent: str, variables: Dict[str, str]) -> bool:
+        return all(variables.get(k, "") == v for k, v in self.requires.get(intent, {}).items())
+
+    def apply(self, intent: str, user_input: str, variables: Dict[str, str]) -> Optional[str]:
+        """按意图中的 set 语句更新变量，返回最后一个 goto 目标（没有时为 None）"""
+        target = None
+        for statement in self.program.intents.get(intent, {}).get('statements', []):
+            if statement.get('type') == 'set' and statement.get('variable'):
+                value = statement.get('value')
+                variables[statement['variable']] = user_input if value == "user_input" else str(value)
+            elif statement.get('type') == 'goto':
+                target = statement.get('scene') or target
+        return target
+
+    def predict(self, text: str, intended: str, variables: Dict[str, str]) -> str:
+        """按 expect → rule → LLM（替身回答 intended）→ default 的顺序，预测解释器应执行的意图"""
+        program = self.program
+        available = program.available_intents
+        attempted: Set[str] = set()
+        expect = program.expects.get(variables.get('current_step', ""))
+        candidates = [expect.intent if expect is not None and expect.accepts(text) else None,
+                      match_rule_keywords(text, available),
+                      intended if intended in available else "default",
+                      "default"]
+        for intent in candidates:
+            if intent is None or intent in attempted or intent not in program.intents:
+                continue
+            attempted.add(intent)
+            if self.validates(intent, variables):
+                return intent
+        return "default"
+
+
+class UtteranceSynthesizer:
+    """由规则关键词与意图描述合成用户话术"""
+
+    def __init__(self, graph: ScriptGraph, rng: random.Random,
+                 descriptions: Optional[Dict[str, str]] = None,
+                 keywords: Optional[Dict[str, List[str]]] = None):
+        self.graph = graph
+        self.rng = rng
+        self.descriptions = descriptions if descriptions is not None else INTENT_DESCRIPTIONS
+        self.keywords = keywords if keywords is not None else RULE_KEYWORDS
+        self._phrases: Dict[str, List[str]] = {}
+
+    def phrases(self, intent: str) -> List[str]:
+        """发起该意图的候选话术"""
+        if intent not in self._phrases:
+            phrases = [t.format(k) for k in self.keywords.get(intent, []) for t in KEYWORD_TEMPLATES]
+            examples, core = self._parse_description(self.descriptions.get(intent, ""))
+            phrases += examples
+            phrases += [t.format(p) for p in core for t in PHRASE_TEMPLATES]
+            if not phrases:
+                phrases = [intent.replace("_", " ")]
+            self._phrases[intent] = phrases
+        return self._phrases[intent]
+
+    def slot_values(self, intent: str, step: str) -> List[str]:
+        """回答槽位 step 的候选取值：优先使用描述中的示例，并满足 expect 的类型与正则"""
+        expect = self.graph.program.expects.get(step)
+        if expect is not None and expect.value_type in ("digits", "number"):
+            values = [str(self.rng.randint(100000, 999999)) for _ in range(3)]
+        else:
+            examples, _ = self._parse_description(self.descriptions.get(intent, ""))
+            values = [t.format(v) for v in examples or SLOT_VALUES for t in SLOT_TEMPLATES]
+        if expect is not None:
+            accepted = [v for v in values if expect.accepts(v)]
+            values = accepted or values
+        return values
+
+    def perturb(self, text: str) -> str:
+        """加入口语化前缀、语气词或标点"""
+        roll = self.rng.random()
+        if roll < 0.4:
+            return self.rng.choice(NOISE_PREFIXES) + text
+        if roll < 0.8:
+            return text + self.rng.choice(NOISE_SUFFIXES)
+        return self.rng.choice(NOISE_PREFIXES) + text + self.rng.choice(NOISE_SUFFIXES)
+
+    @staticmethod
+    def _parse_description(description: str):
+        """返回 (示例, 核心短语)：示例取引号与“如……”中的内容（忽略“❌”之后的反例与“问了'…'”中的助手原话）"""
+        description = _ASKED.sub("", description.split("❌")[0])
+        examples = _QUOTED.findall(description)
+        for match in _EXAMPLES.findall(description):
+            examples += [e.strip() for e in match.split("、") if e.strip() and "'" not in e]
+        head = re.sub(r"【[^】]*】", "", description).split("✅")[0]
+        head = re.split(r"[。（(，]", head)[0].strip()
+        head = head[2:] if head.startswith("用户") else head
+        core = [p for p in head.split("、") if p and "'" not in p]
+        return examples, core
+
+
+class _Session:
+    def __init__(self, session_id: str, scene: str, length: int):
+        self.session_id = session_id
+        self.scene = scene # 选择发起意图的场景
+        self.variables: Dict[str, str] = {"current_step": ""}
+        self.hint: Optional[str] = None # goto 到意图时，下一轮倾向的意图
+        self.length = length
+        self.index = 0
+
+
+class TrafficGenerator:
+    """按对话图生成无限的多会话流量"""
+
+    def __init__(self, program: DSLProgram, seed: Optional[int] = None, sessions: int = 50,
+                 min_turns: int = 2, max_turns: int = 8, noise: float = 0.1, off_topic: float = 0.05,
+                 session_prefix: str = "synthetic-", descriptions: Optional[Dict[str, str]] = None,
+                 keywords: Optional[Dict[str, List[str]]] = None):
+        """
+        Args:
+            sessions: 同时进行中的会话数（轮次在这些会话之间随机交错）
+            min_turns / max_turns: 每个会话的轮数范围（未填完的槽位会继续回答，可能略超上限）
+            noise: 在话术上加入口语噪声的比例
+            off_topic: 无关问题的比例
+        """
+        self.graph = ScriptGraph(program)
+        self.rng = random.Random(seed)
+        self.synth = UtteranceSynthesizer(self.graph, self.rng, descriptions, keywords)
+        self.sessions = max(1, sessions)
+        self.min_turns = max(1, min_turns)
+        self.max_turns = max(self.min_turns, max_turns)
+        self.noise = noise
+        self.off_topic = off_topic
+        self.session_prefix = session_prefix
+        self._started = 0
+        if not any(self.graph.entries.values()):
+            raise ValueError("脚本中没有可以主动发起的意图，无法生成流量")
+
+    def __iter__(self) -> Iterator[Turn]:
+        return self.turns()
+
+    def turns(self) -> Iterator[Turn]:
+        active = [self._new_session() for _ in range(self.sessions)]
+        while True:
+            slot = self.rng.randrange(len(active))
+            session = active[slot]
+            yield self._next_turn(session)
+            if session.index >= session.length and not session.variables.get('current_step'):
+                active[slot] = self._new_session()
+
+    def _new_session(self) -> _Session:
+        self._started += 1
+        return _Session(f"{self.session_prefix}{self._started}", self.graph.program.entry_scene,
+                        self.rng.randint(self.min_turns, self.max_turns))
+
+    def _next_turn(self, session: _Session) -> Turn:
+        graph, rng = self.graph, self.rng
+        step = session.variables.get('current_step', "")
+        if rng.random() < self.off_topic:
+            intent, kind = "default", "off_topic"
+            text = rng.choice(OFF_TOPIC)
+            expected = graph.predict(text, intent, session.variables)
+        else:
+            answering = [i for i in graph.answers.get(step, []) if graph.validates(i, session.variables)]
+            if answering:
+                intent, kind = rng.choice(answering), "slot"
+                pool = self.synth.slot_values(intent, step)
+            else:
+                intent, kind = self._choose_intent(session), "flow"
+                pool = self.synth.phrases(intent)
+            text, expected = self._pick(pool, intent, session.variables)
+            if rng.random() < self.noise:
+                kind = "noise"
+                text = self.synth.perturb(text)
+                expected = graph.predict(text, intent, session.variables)
+
+        turn = Turn(session.session_id, text, intent, expected, kind, session.index)
+        session.index += 1
+        # 按预测的执行结果推进会话状态（validate 失败的意图不会执行）
+        target = graph.apply(expected, text, session.variables)
+        session.hint = None
+        if target in graph.program.scenes:
+            session.scene = target
+        elif target is not None:
+            session.hint = target
+        return turn
+
+    def _choose_intent(self, session: _Session) -> str:
+        candidates = self.graph.entry_intents(session.scene)
+        if session.hint in self.graph.program.intents and session.hint not in self.graph.requires:
+            # goto 指向意图：按 3 倍权重跟随
+            candidates = candidates + [session.hint] * 3
+        return self.rng.choice(candidates)
+
+    def _pick(self, pool: List[str], intent: str, variables: Dict[str, str]):
+        """随机选一句预测结果与目标一致的话术；都不一致时返回最后一次尝试（按实际预测计入期望）"""
+        text, expected = "", "default"
+        for _ in range(min(len(pool), 16)):
+            text = self.rng.choice(pool)
+            expected = self.graph.predict(text, intent, variables)
+            if expected == intent:
+                break
+        return text, expected
+
+
+class OracleLLMClient:
+    """
+    MockLLMClient 风格的 LLM 替身：LLM 层按生成器给出的本轮目标意图作答，规则层与 LLMClient 相同
+    drive() 的 worker 在每轮前后调用 begin() / end() 登记在途轮次，作答时按 (会话 id, 话术) 查找目标意图；
+    LLM 接口不带会话 id，由登记该轮的线程确定（同一会话的轮次总在同一个 worker 上按顺序执行）
+    """
+
+    def __init__(self, latency: float = 0.0):
+        """latency: 每次 LLM 调用的模拟耗时（秒）"""
+        self.latency = latency
+        self.calls = 0
+        self._pending: Dict[Tuple[str, str], Turn] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def begin(self, turn: Turn):
+        with self._lock:
+            self._pending[(turn.session_id, turn.text)] = turn
+        self._local.session_id = turn.session_id
+
+    def end(self, turn: Turn):
+        with self._lock:
+            self._pending.pop((turn.session_id, turn.text), None)
+        self._local.session_id = None
+
+    def intelligent_intent_recognition(self, user_input: str, available_intents: List[str],
+                                       conversation_context: List[Dict[str, str]],
+                                       timeout: Optional[float] = None, scene: Optional[str] = None) -> str:
+        with self._lock:
+            self.calls += 1
+            turn = self._pending.get((getattr(self._local, "session_id", None), user_input))
+        if self.latency:
+            time.sleep(self.latency if timeout is None else min(self.latency, max(timeout, 0)))
+        if turn is None or turn.intent not in available_intents:
+            return "default"
+        return turn.intent
+
+    def fallback_intent_recognition(self, user_input: str, available_intents: List[str]) -> Optional[str]:
+        return match_rule_keywords(user_input, available_intents)
+
+
+def drive(agent, turns: Iterator[Turn], oracle: OracleLLMClient, rate: float,
+          duration: Optional[float] = None, max_turns: Optional[int] = None,
+          progress=None, progress_interval: float = 5.0, metrics=None,
+          workers: int = 4, queue_size: int = 1000) -> Dict[str, Any]:
+    """
+    按目标速率把生成的轮次发给 agent（开环调度：第 n 轮计划在 n / rate 秒发出，落后时不补等），
+    直到 duration 秒或 max_turns 轮（都为 None 时一直运行，KeyboardInterrupt 结束）
+    与 BatchRunner 相同，同一会话的轮次按 session_id 哈希到固定 worker 线程，保证轮次顺序；
+    所有 worker 共用同一个 agent。时延从计划发出时刻算起，包含排队等待；返回统计信息
+    """
+    metrics = metrics or default_registry
+    turn_counter = metrics.counter("traffic_turns_total", "合成流量的轮次 (kind, outcome: correct/mismatch)",
+                                   ("kind", "outcome"))
+    latency_hist = metrics.histogram("traffic_turn_seconds", "合成流量每轮从计划发出到完成的时延")
+    latencies: deque = deque(maxlen=100000)
+    kinds: Counter = Counter()
+    mismatches: Counter = Counter()
+    examples: List[Dict[str, Any]] = []
+    totals = {"count": 0, "correct": 0}
+    lock = threading.Lock()
+    stopping = threading.Event()
+    max_lag = 0.0
+    start = time.perf_counter()
+    last_progress = start
+
+    def snapshot() -> Dict[str, Any]:
+        with lock:
+            elapsed = time.perf_counter() - start
+            count, correct = totals["count"], totals["correct"]
+            ordered = sorted(latencies)
+            pct = (lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000 if ordered else 0.0)
+            return {
+                "turns": count, "seconds": elapsed, "target_rate": rate,
+                "turns_per_sec": count / elapsed if elapsed else 0.0,
+                "correct": correct, "accuracy": correct / count if count else 1.0,
+                "p50_ms": pct(0.50), "p95_ms": pct(0.95), "p99_ms": pct(0.99), "max_lag_ms": max_lag * 1000,
+                "kinds": dict(kinds), "mismatches": dict(mismatches.most_common(10)), "examples": list(examples),
+                "llm_calls": oracle.calls,
+            }
+
+    def record(turn: Turn, scheduled: float, actual: Optional[str]):
+        latency = time.perf_counter() - scheduled
+        latency_hist.observe(latency)
+        outcome = "correct" if actual == turn.expected else "mismatch"
+        turn_counter.inc(turn.kind, outcome)
+        with lock:
+            latencies.append(latency)
+            totals["count"] += 1
+            kinds[turn.kind] += 1
+            if outcome == "correct":
+                totals["correct"] += 1
+                return
+            mismatches[f"{turn.expected} -> {actual}"] += 1
+            if len(examples) < 20:
+                examples.append({"session_id": turn.session_id, "index": turn.index, "text": turn.text,
+                                 "kind": turn.kind, "expected": turn.expected, "actual": actual})
+
+    def worker(inbox: "queue.Queue"):
+        while True:
+            item = inbox.get()
+            if item is _STOP:
+                return
+            if stopping.is_set():
+                continue # 被中断：丢弃尚未开始的轮次
+            turn, scheduled = item
+            oracle.begin(turn)
+            try:
+                agent.process_input(turn.text, turn.session_id)
+            finally:
+                oracle.end(turn)
+            record(turn, scheduled, agent.interpreter.last_turn.get("intent"))
+
+    workers = max(1, workers)
+    inboxes = [queue.Queue(queue_size) for _ in range(workers)]
+    pool = [threading.Thread(target=worker, args=(inbox,), name=f"traffic-{i}", daemon=True)
+            for i, inbox in enumerate(inboxes)]
+    for thread in pool:
+        thread.start()
+    dispatched = 0
+    try:
+        for turn in turns:
+            if max_turns is not None and dispatched >= max_turns:
+                break
+            scheduled = start + dispatched / rate
+            now = time.perf_counter()
+            if duration is not None and scheduled - start >= duration:
+                break
+            if scheduled > now:
+                time.sleep(scheduled - now)
+            elif now - scheduled > max_lag:
+                with lock:
+                    max_lag = now - scheduled
+            # 使用稳定哈希（而非 hash()），保证同一会话总是进入同一队列；队列满时阻塞，落后计入调度延迟
+            inboxes[zlib.crc32(turn.session_id.encode('utf-8')) % workers].put((turn, scheduled))
+            dispatched += 1
+            now = time.perf_counter()
+            if progress is not None and now - last_progress >= progress_interval:
+                last_progress = now
+                progress(snapshot())
+    except KeyboardInterrupt:
+        stopping.set()
+        logger.info("合成流量被中断")
+    for inbox in inboxes:
+        inbox.put(_STOP)
+    for thread in pool:
+        thread.join()
+    return snapshot()
@@ -1,5 +1,4 @@
 # utils/config.py
-import yaml
 from pathlib import Path
 
 def load_config(config_path: str = "config.yaml"):
@@ -7,6 +6,8 @@ def load_config(config_path: str = "config.yaml"):
     config_file = Path(config_path)
     if not config_file.exists():
         raise FileNotFoundError(f"配置文件未找到: {config_path}")
+    
+    import yaml # 延迟导入：只在真正读取配置时加载
         
     with open(config_file, 'r', encoding='utf-8') as f:
         config = yaml.safe_load(f)
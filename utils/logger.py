@@ -1,17 +1,208 @@
 # utils/logger.py
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
 import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 所有模块 logger 共享同一个队列 handler，格式化与 I/O 在后台线程完成
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_running = False # 为 False 时（shutdown_logging 之后）日志在调用线程里直接写出
+_lock = threading.Lock()
+_module_levels: Dict[str, int] = {}
+_default_level = logging.INFO
+_sampling_filter: Optional["SamplingFilter"] = None
+
+
+class SamplingFilter(logging.Filter):
+    """对高频 DEBUG 事件按 1/N 采样，INFO 及以上级别不受影响"""
+
+    def __init__(self, every_n: int = 1):
+        super().__init__()
+        self.every_n = max(1, int(every_n))
+        self._counter = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.every_n == 1:
+            return True
+        self._counter += 1
+        return self._counter % self.every_n == 0
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        elif record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    只把 LogRecord 原样放入队列，由后台线程负责 msg % args 格式化
+    （标准 QueueHandler 会在调用线程里预先格式化）
+    """
+
+    def emit(self, record: logging.LogRecord):
+        if _listener_running:
+            super().emit(record)
+        else:
+            # 后台线程已停止（如 atexit 之后仍有日志），放入队列就不会再被写出
+            _listener.handle(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info and not record.exc_text:
+            # 异常栈必须在当前线程取出，否则 traceback 对象可能失效
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _build_queue_handler() -> logging.handlers.QueueHandler:
+    global _queue_handler, _listener, _listener_running
+    with _lock:
+        if _queue_handler is None:
+            log_queue: queue.SimpleQueue = queue.SimpleQueue()
+            _queue_handler = _LazyQueueHandler(log_queue)
+            console = logging.StreamHandler(sys.stdout)
+            console.setFormatter(logging.Formatter(DEFAULT_FORMAT))
+            _listener = logging.handlers.QueueListener(log_queue, console, respect_handler_level=True)
+            _listener.start()
+            _listener_running = True
+            atexit.register(shutdown_logging)
+    return _queue_handler
+
 
 def setup_logger(name):
-    """配置并返回一个标准的日志对象"""
+    """配置并返回一个标准的日志对象（写入共享的异步日志队列）"""
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO) # 默认级别
-    
+    logger.setLevel(_module_levels.get(name, _default_level))
+
     # 防止重复添加 handler
     if not logger.handlers:
-        ch = logging.StreamHandler(sys.stdout)
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        ch.setFormatter(formatter)
-        logger.addHandler(ch)
-        
-    return logger
\ No newline at end of file
+        handler = _build_queue_handler()
+        logger.addHandler(handler)
+        logger.propagate = False
+
+    return logger
+
+
+def configure_logging(log_config: Optional[Dict[str, Any]] = None):
+    """
+    根据 config.yaml 的 logging 段调整日志管线，例如：
+
+        logging:
+          level: INFO
+          modules: {interpreter: WARNING, llm_client: DEBUG}
+          debug_sample_rate: 10        # DEBUG 事件每 10 条保留 1 条
+          json_file: logs/agent.jsonl  # 可选：额外输出 JSON-lines 文件
+          console: true
+    """
+    global _default_level, _sampling_filter, _listener_running
+    log_config = log_config or {}
+    # 先校验全部级别，配置有误时不改动现有管线
+    default_level = _parse_level(log_config.get('level', 'INFO'))
+    module_levels = {module: _parse_level(level) for module, level in (log_config.get('modules') or {}).items()}
+    handler = _build_queue_handler()
+
+    _default_level = default_level
+    _module_levels.clear()
+    _module_levels.update(module_levels)
+
+    # 已创建的 logger 立即应用新级别
+    for name, logger in logging.Logger.manager.loggerDict.items():
+        if isinstance(logger, logging.Logger) and handler in logger.handlers:
+            logger.setLevel(_module_levels.get(name, _default_level))
+
+    if _sampling_filter is not None:
+        handler.removeFilter(_sampling_filter)
+        _sampling_filter = None
+    sample_rate = int(log_config.get('debug_sample_rate', 1))
+    if sample_rate > 1:
+        _sampling_filter = SamplingFilter(sample_rate)
+        handler.addFilter(_sampling_filter)
+
+    handlers = []
+    if log_config.get('console', True):
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(logging.Formatter(DEFAULT_FORMAT))
+        handlers.append(console)
+    if log_config.get('json_file'):
+        Path(log_config['json_file']).parent.mkdir(parents=True, exist_ok=True)
+        file_handler = logging.FileHandler(log_config['json_file'], encoding='utf-8')
+        file_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(file_handler)
+
+    with _lock:
+        old_handlers = _listener.handlers
+        if _listener_running:
+            _listener.stop()
+        _listener.handlers = tuple(handlers)
+        _listener.start()
+        _listener_running = True
+        for old in old_handlers:
+            old.close()
+
+
+def _parse_level(level: Any) -> int:
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).upper())
+    if not isinstance(value, int):
+        raise ValueError(f"未知的日志级别: {level}（可选: DEBUG/INFO/WARNING/ERROR/CRITICAL）")
+    return value
+
+
+def shutdown_logging():
+    """
+    停止后台线程并刷出队列中剩余的日志
+    之后的日志在调用线程里直接写出；再次调用 configure_logging 时恢复异步管线
+    """
+    global _listener_running
+    with _lock:
+        if _listener is None or not _listener_running:
+            return
+        _listener_running = False
+        _listener.stop()
+        # 标志切换前已进入 emit、在结束标记之后才入队的记录
+        while True:
+            try:
+                record = _queue_handler.queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is not None:
+                _listener.handle(record)
+
+
+def _reinit_after_fork():
+    """fork 出的子进程里没有后台线程：换用新队列并重新启动监听线程"""
+    global _lock, _listener, _listener_running
+    _lock = threading.Lock()
+    if _queue_handler is None:
+        return
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+    _listener_running = True
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_after_fork)
@@ -0,0 +1,226 @@
+# utils/metrics.py
+import bisect
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+# 默认延迟桶（秒），覆盖从规则匹配的亚毫秒级到 LLM 调用的秒级
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], labels: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """单调递增计数器"""
+
+    def __init__(self, name: str, help_text: str = "", labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {",".join(k) or "_": v for k, v in self._values.items()}
+
+
+class Gauge(Counter):
+    """可任意设置的瞬时值"""
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    """固定分桶直方图（记录时只做一次二分查找，导出时再累加）"""
+
+    def __init__(self, name: str, help_text: str = "", labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签: [各桶计数..., +Inf 计数, 总和, 总数]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(labels)
+            if data is None:
+                data = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            data[idx] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def observe_many(self, values: Dict[str, float]):
+        """单标签直方图的批量记录：{标签值: 观测值}，整批只加一次锁"""
+        bisect_left = bisect.bisect_left
+        buckets = self.buckets
+        size = len(buckets) + 1
+        with self._lock:
+            for label, value in values.items():
+                key = (label,)
+                data = self._values.get(key)
+                if data is None:
+                    data = self._values[key] = [0] * size + [0.0, 0]
+                data[bisect_left(buckets, value)] += 1
+                data[-2] += value
+                data[-1] += 1
+
+    def count(self, *labels: str) -> int:
+        data = self._values.get(labels)
+        return data[-1] if data else 0
+
+    def total(self, *labels: str) -> float:
+        data = self._values.get(labels)
+        return data[-2] if data else 0.0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, data in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), data):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                label_str = _format_labels(self.labelnames, labels, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {data[-2]:g}")
+            lines.append(f"{self.name}_count{label_str} {data[-1]}")
+        return lines
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {",".join(k) or "_": {"count": v[-1], "sum": v[-2]} for k, v in self._values.items()}
+
+
+class MetricsRegistry:
+    """
+    指标注册表
+    负责创建/查找指标、导出 Prometheus 文本格式，并把每轮对话的汇总记录分发给自定义 sink
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: Dict[str, Any] = {}
+        self._sinks: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+        self._dump_thread: Optional[threading.Thread] = None
+        self._dump_stop = threading.Event()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = cls(name, *args, **kwargs)
+        return metric
+
+    def counter(self, name: str, help_text: str = "", labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str = "", labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name: str, help_text: str = "", labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets)
+
+    # --- 自定义 sink ---
+    def add_sink(self, sink: Callable[[Dict[str, Any]], None]):
+        """注册 sink，每轮对话结束时以汇总记录 (dict) 调用"""
+        self._sinks.append(sink)
+
+    def remove_sink(self, sink: Callable[[Dict[str, Any]], None]):
+        if sink in self._sinks:
+            self._sinks.remove(sink)
+
+    def publish(self, record: Dict[str, Any]):
+        for sink in self._sinks:
+            try:
+                sink(record)
+            except Exception:
+                # sink 的错误不能影响业务流程
+                pass
+
+    # --- 导出 ---
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def start_periodic_dump(self, interval: float, target: Callable[[str], None]):
+        """后台线程每隔 interval 秒把 Prometheus 文本交给 target（如写文件、打日志）"""
+        self.stop_periodic_dump()
+        self._dump_stop.clear()
+
+        def _loop():
+            while not self._dump_stop.wait(interval):
+                target(self.render_prometheus())
+
+        self._dump_thread = threading.Thread(target=_loop, name="metrics-dump", daemon=True)
+        self._dump_thread.start()
+
+    def stop_periodic_dump(self):
+        if self._dump_thread is not None:
+            self._dump_stop.set()
+            self._dump_thread.join()
+            self._dump_thread = None
+
+    def serve_http(self, port: int = 9464, host: str = "127.0.0.1") -> "ThreadingHTTPServer":
+        """启动 Prometheus 风格的 /metrics 文本端点（后台线程），返回 server 以便关闭"""
+        # 延迟导入：http.server 较重，只有开启 HTTP 端点时才需要
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), _Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+
+# 进程级默认注册表
+registry = MetricsRegistry()